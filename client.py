@@ -1,15 +1,27 @@
+import os
 import time
 import logging
 import colorlog
 import socket
+from itertools import chain
+from typing import Dict, Optional, Tuple
 
 from lib.segment import Segment
 from lib.argparse import FileTransferArgumentParser
 from lib.connection import Connection
-from lib.constant import SYN_FLAG, ACK_FLAG, FIN_FLAG, SYN_ACK_FLAG, TIMEOUT, TIMEOUT_LISTEN
+from lib.options import ConnectionOptions
+from lib.rtt import RTTEstimator
+from lib.sack import get_sack_blocks
+from lib.multicast import get_nak_blocks
+from lib.filewriter import FileWriter
+from lib.hamming import decode as decode_hamming
+from lib.fec import RepairDecoder
+from lib.metrics import MetricsRegistry, MetricsEndpoint
+from lib.trace import Tracer, TRACE_RECEIVE_SEGMENT, TRACE_BUFFER_SEGMENT, TRACE_SEND_ACK
+from lib.constant import SYN_FLAG, ACK_FLAG, FIN_FLAG, SYN_ACK_FLAG, TIMEOUT_LISTEN, DEFAULT_CHECKSUM, ARQ_SELECTIVE_REPEAT, REORDER_BUFFER_SIZE, RECEIVE_BUFFER_SIZE, SEGMENT_SIZE, ACK_DELAYED, DELAYED_ACK_COUNT, DELAYED_ACK_TIMEOUT, ACK_FRAME_CACHE_SIZE, SACK_ON, MAX_WINDOW, MULTICAST_GROUP, MULTICAST_UNICAST, ECC_HAMMING, FEC_NONE, INCOMPLETE_SUFFIX
 
 class Client:
-    def __init__(self):
+    def __init__(self, connection: Optional[Connection] = None):
         # Initialize client
         args = FileTransferArgumentParser(is_server=False)
         client_arguments = args.get_value()
@@ -17,10 +29,42 @@ class Client:
         self.client_port: int = client_arguments["client_port"]
         self.broadcast_port: int = client_arguments["broadcast_port"]
         self.pathfile_output: str = client_arguments["pathfile_output"].split("/")[-1]
+        self.durability: str = client_arguments["fsync"]
 
-        # Connection
-        self.connection = Connection(broadcast_port=self.broadcast_port, port=self.client_port, is_server=False)
+        # Connection, given one replaces UDP socket (e.g. SimulatedConnection of lib.simulator)
+        self.connection = connection if connection is not None else Connection(broadcast_port=self.broadcast_port, port=self.client_port, is_server=False)
         self.segment = Segment()
+        self.receive_buffer = self.connection.set_receive_buffer(RECEIVE_BUFFER_SIZE)
+        self.options = ConnectionOptions(window=self.get_receive_window(SEGMENT_SIZE))
+        self.ack_segment = Segment()
+
+        # Encoded ACK frame of each (seq_num, ack_num), duplicate ACK is sent without encoding again
+        self.ack_frames: Dict[Tuple[int, int], bytes] = {}
+
+        # Delayed ACK: newest cumulative ACK not sent yet, number of in-order segments it covers and its deadline
+        self.pending_ack: Optional[Tuple[int, int]] = None
+        self.pending_count = 0
+        self.ack_deadline = 0.0
+
+        # Out-of-order segments held past the gap (Selective Repeat, or Go-Back-N with SACK) and newest of them.
+        # Payload is written to its file position right away once payload size is known, None marks it as written
+        self.reorder_buffer: Dict[int, Optional[bytes]] = {}
+        self.last_buffered: Optional[int] = None
+
+        # Forward error correction keeps data payloads of unfinished blocks, None when it isn't negotiated
+        self.fec : Optional[RepairDecoder] = None
+
+        # Payload size of data segment, learned from first one (seq_num 3). Segment seq_num is at (seq_num - 3) * payload_size
+        self.payload_size: Optional[int] = None
+
+        # Retransmission timeout, sampled from SYN-ACK to handshake ACK and FIN-ACK to final ACK
+        self.rtt = RTTEstimator(client_arguments["rto_min"], client_arguments["rto_max"])
+
+        # Per-segment events go to binary trace instead of debug log, None when tracing is off
+        self.tracer : Optional[Tracer] = None
+        self.trace_id = 0
+        if client_arguments["trace"]:
+            self.tracer = Tracer(client_arguments["trace"], client_arguments["trace_size"], "Server")
 
         # File
         self.file = self.create_file()
@@ -28,6 +72,19 @@ class Client:
         # Logger
         self.logger = self.setup_logger()
 
+        # Counters, gauges and histograms of server connection, scraped from endpoint when address is given
+        self.metrics = MetricsRegistry("client")
+        self.metrics_endpoint : Optional[MetricsEndpoint] = None
+        self.handshake_start : Optional[float] = None
+        if client_arguments["metrics"]:
+            try:
+                self.metrics_endpoint = MetricsEndpoint(self.metrics, client_arguments["metrics"])
+                self.metrics_endpoint.start()
+                self.logger.info(f"[!] Metrics endpoint at {self.metrics_endpoint}")
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"[!] Metrics endpoint {client_arguments['metrics']} can't be started ({e})")
+                self.metrics_endpoint = None
+
     def setup_logger(self):
         # Set up logging configuration
         logger = logging.getLogger(__name__)
@@ -49,16 +106,41 @@ class Client:
         # Add formatter to ch
         ch.setFormatter(formatter)
 
-        # Add ch to logger
-        logger.addHandler(ch)
+        # Add ch to logger once, instance may be created many times in one process (lib.simulator)
+        if not logger.handlers:
+            logger.addHandler(ch)
         return logger
 
+    def get_receive_window(self, segment_size: int) -> int:
+        # Segments which fit in socket receive buffer (Linux reports twice the usable size), and in reorder buffer.
+        # Reorder buffer holds REORDER_BUFFER_SIZE segments of largest size, more when segments are smaller
+        return max(1, min(MAX_WINDOW, REORDER_BUFFER_SIZE * SEGMENT_SIZE // segment_size, self.receive_buffer // 2 // segment_size))
+
+    def answer_offer(self, payload) -> bytes:
+        # SYN-ACK payload. Segment size is lowered to largest datagram client can receive, window follows it
+        if not self.options.choose_offer(payload, SEGMENT_SIZE):
+            return b""
+        if self.options.multicast == MULTICAST_GROUP and not self.connection.join_group(self.options.group):
+            self.options.multicast = MULTICAST_UNICAST
+        self.options.window = self.get_receive_window(self.options.segment_size or SEGMENT_SIZE)
+        return self.options.get_answer_bytes()
+
+    def send_probe_ack(self, server_address, size):
+        # Path MTU probe reached client, ACK it without padding
+        self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Received path MTU probe {size}")
+        response = Segment()
+        response.set_flag(["ACK"])
+        response.set_probe(size, padding=False)
+        self.connection.send_data(response.get_bytes(), server_address)
+
     def connect(self):
         # Initialize connection to server
         self.connection.send_data(self.segment.get_bytes(), (self.connection.ip, self.broadcast_port))
 
     def three_way_handshake(self):
         # Three Way Handshake Protocol, for client-side to establishing connection with server
+        # Handshake segments always use default checksum, negotiated one applies after handshake
+        self.segment.set_checksum_algorithm(DEFAULT_CHECKSUM)
         while True:
             data, server_address = None, ("127.0.0.1", self.broadcast_port)
             try:
@@ -66,11 +148,27 @@ class Client:
                 data, server_address = self.connection.listen_single_segment(TIMEOUT_LISTEN)
                 self.segment.set_from_bytes(data)
 
+                # Path MTU probe only comes after server received SYN-ACK, so handshake ACK was lost. Connection is established
+                if self.segment.is_probe():
+                    self.send_probe_ack(server_address, self.segment.seq_num)
+                    self.establish(server_address)
+                    break
+                # So does poll of one-to-many transfer, it is answered once file transfer listens
+                elif self.segment.is_nak():
+                    self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Received poll, handshake ACK was lost")
+                    self.establish(server_address)
+                    break
+                # Corrupt offer would be answered with options server never offered. Server resends SYN on timeout
+                elif self.segment.get_flag() == SYN_FLAG and not self.segment.valid_checksum():
+                    self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Received Corrupt SYN")
                 # Check flag in segment
                 # If segment flag is SYN, server want to establish connection. Send SYN-ACK flag.
-                if self.segment.get_flag() == SYN_FLAG:
-                    # Set SYN-ACK flag
+                elif self.segment.get_flag() == SYN_FLAG:
+                    if self.handshake_start is None:
+                        self.handshake_start = time.monotonic()
+                    # Set SYN-ACK flag, answer options offered in SYN payload
                     self.segment.set_flag(["SYN", "ACK"])
+                    self.segment.set_payload(self.answer_offer(self.segment.get_payload()))
 
                     # Initialize sequence and ACK number in segment header
                     segment_header = self.segment.get_header()
@@ -82,6 +180,7 @@ class Client:
 
                     # Send segment to server
                     self.connection.send_data(self.segment.get_bytes(), server_address)
+                    self.rtt.on_send("SYN-ACK")
                 # If segment flag is SYN-ACK, resend that flag to server.
                 elif self.segment.get_flag() == SYN_ACK_FLAG:
                     # Show status
@@ -93,17 +192,20 @@ class Client:
                 elif self.segment.get_flag() == ACK_FLAG:
                     # Show status
                     self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Received ACK")
-                    self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Connection established")
+                    self.rtt.on_ack("SYN-ACK")
+                    self.establish(server_address)
                     break
                 # Other than that, reset connection with server. Send SYN-ACK to server
                 else:
-                    # Set SYN-ACK flag
+                    # Set SYN-ACK flag, don't echo file segment back
                     self.segment.set_flag(["SYN", "ACK"])
+                    self.segment.set_payload(b"")
 
                     # Reset sequence and ACK number in segment header
                     segment_header = self.segment.get_header()
                     segment_header["ack_num"] = 1
                     segment_header["seq_num"] = 0
+                    self.segment.set_header(segment_header)
 
                     # Show status
                     self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Segment file received. Resetting connection to server")
@@ -119,32 +221,140 @@ class Client:
                 else:
                     self.logger.error(f"[!] [Server {server_address[0]}:{server_address[1]}] SYN response timeout")
 
+    def establish(self, server_address):
+        # Negotiated options apply from now on, receive buffers follow negotiated segment size
+        self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Connection established ({self.options})")
+        if self.handshake_start is not None:
+            self.metrics.get(server_address).on_handshake(time.monotonic() - self.handshake_start)
+            self.handshake_start = None
+        self.segment.set_checksum_algorithm(self.options.checksum)
+        self.connection.set_segment_size(self.options.segment_size or SEGMENT_SIZE)
+        self.ack_frames.clear()
+
     def listen_file_transfer(self):
         # File transfer, client-side
         metadata_number = 2
         metadata_received = False
         request_number = 3
-        data, server_address = None, None
+        data, server_address = None, (self.connection.ip, self.broadcast_port)
+
+        # Selective Repeat keeps out-of-order segments until the gap is filled. Go-Back-N does the same when
+        # SACK is negotiated, server learns from SACK blocks which segments it doesn't need to resend
+        selective_repeat = self.options.arq == ARQ_SELECTIVE_REPEAT
+        buffering = selective_repeat or self.options.sack == SACK_ON
+
+        # One-to-many transfer member doesn't ACK, it keeps every segment it can and reports losses when polled
+        multicast = self.options.multicast is not None
+        buffering = buffering or multicast
+
+        # Payload of every data segment is Hamming coded, decoded before checksum is verified
+        hamming = self.options.ecc == ECC_HAMMING
+        self.fec = RepairDecoder() if self.options.fec != FEC_NONE else None
+        fec = self.fec
+        self.reorder_buffer.clear()
+        self.last_buffered = None
+        tracer = self.tracer
+        if tracer is not None:
+            self.trace_id = tracer.get_id(server_address)
+        metrics = self.metrics.get(server_address)
+        metrics.start(self.rtt)
 
         while True:
+            # Datagram is received into pooled buffer, given back once payload is written or ACK is sent
+            buffer = None
             try:
-                data, server_address = self.connection.listen_single_segment(3)
+                data, server_address, buffer = self.connection.listen_pooled_segment(self.get_receive_timeout())
                 if server_address[1] == self.broadcast_port:
                     self.segment.set_from_bytes(data)
-                    if (self.segment.valid_checksum() and self.segment.get_header()["seq_num"] == metadata_number and metadata_received == False):
+                    if hamming and self.segment.get_flag() == 0 and not self.segment.extension:
+                        payload, corrected, uncorrectable = decode_hamming(self.segment.get_payload())
+                        self.segment.set_payload(payload)
+                        metrics.ecc_corrected += corrected
+                        metrics.ecc_uncorrectable += uncorrectable
+                    if self.segment.is_probe():
+                        # Probe ACK was lost, server probes again
+                        self.send_probe_ack(server_address, self.segment.seq_num)
+                        continue
+                    elif self.segment.is_nak():
+                        # Poll of one-to-many transfer, answer with what is still missing
+                        self.send_nak(server_address, request_number, metadata_received)
+                        continue
+                    elif self.segment.is_repair():
+                        # Repair segment of forward error correction, lost data segments of its block are rebuilt without retransmission
+                        if fec is not None and self.segment.valid_checksum():
+                            request_number = self.deliver_recovered(server_address, fec.add_repair(self.segment), request_number, metadata_received or not selective_repeat)
+                        continue
+                    elif (self.segment.valid_checksum() and self.segment.get_header()["seq_num"] == metadata_number and metadata_received == False):
                         payload = self.segment.get_payload()
-                        metadata = payload.decode().split(",")
+                        metadata = bytes(payload).decode().split(",")
                         self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Received Filename: {metadata[0]}, File Extension: {metadata[1]}, File Size: {metadata[2]}")
                         metadata_received = True
-                        self.send_ack(server_address, metadata_number + 1)
+                        self.allocate_file(metadata[-1])
+                        if selective_repeat:
+                            self.queue_ack(server_address, request_number, metadata_number)
+                        else:
+                            self.queue_ack(server_address, metadata_number + 1)
                         continue
                     elif self.segment.valid_checksum() and self.segment.get_header()["seq_num"] == request_number:
-                        payload = self.segment.get_payload()
-                        self.file.write(payload)
-                        self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Received Segment {request_number}")
-                        self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Sending ACK {request_number + 1}")
+                        recovered = fec.add_payload(request_number, self.segment.get_payload()) if fec is not None else None
+                        self.write_payload(request_number, self.segment.get_payload())
+                        self.rtt.clear_backoff()
+                        if tracer is not None:
+                            tracer.record(self.trace_id, TRACE_RECEIVE_SEGMENT, request_number, request_number + 1)
                         request_number += 1
-                        self.send_ack(server_address, request_number)
+                        filled = request_number in self.reorder_buffer
+                        # Write buffered segments which are now in order
+                        while request_number in self.reorder_buffer:
+                            payload = self.reorder_buffer.pop(request_number)
+                            if payload is not None:
+                                self.write_payload(request_number, payload)
+                            request_number += 1
+                        metrics.segments_received += 1
+                        metrics.bytes_delivered = self.get_file_offset(request_number)
+                        ack_number = self.get_cumulative_ack(request_number, metadata_received or not selective_repeat)
+                        seq_number = self.segment.get_header()["seq_num"] if selective_repeat else None
+                        if filled:
+                            # Gap is filled, server is waiting for this ACK
+                            self.send_ack(server_address, ack_number, seq_number)
+                        else:
+                            self.queue_ack(server_address, ack_number, seq_number)
+                        if fec is not None:
+                            fec.release(request_number)
+                            request_number = self.deliver_recovered(server_address, recovered, request_number, metadata_received or not selective_repeat)
+                        continue
+                    elif buffering and self.segment.valid_checksum() and request_number < self.segment.get_header()["seq_num"] < request_number + self.get_receive_window(len(data)):
+                        # Out-of-order segment within reorder buffer, write payload to its position (or copy it out of pooled buffer
+                        # while position is unknown) and ACK it now. Selective Repeat ACKs it individually, Go-Back-N sends
+                        # duplicate cumulative ACK with SACK blocks
+                        sequence = self.segment.get_header()["seq_num"]
+                        recovered = fec.add_payload(sequence, self.segment.get_payload()) if fec is not None else None
+                        metrics.segments_buffered += 1
+                        if tracer is not None:
+                            tracer.record(self.trace_id, TRACE_BUFFER_SEGMENT, sequence, request_number)
+                        if sequence in self.reorder_buffer:
+                            pass
+                        elif self.payload_size is None:
+                            self.reorder_buffer[sequence] = bytes(self.segment.get_payload())
+                        else:
+                            self.write_payload(sequence, self.segment.get_payload())
+                            self.reorder_buffer[sequence] = None
+                        self.last_buffered = sequence
+                        self.send_ack(server_address, self.get_cumulative_ack(request_number, metadata_received or not selective_repeat), sequence if selective_repeat else None)
+                        if fec is not None:
+                            request_number = self.deliver_recovered(server_address, recovered, request_number, metadata_received or not selective_repeat)
+                        continue
+                    elif self.segment.get_flag() == SYN_FLAG and not self.segment.valid_checksum(DEFAULT_CHECKSUM):
+                        self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Received Corrupt SYN")
+                        continue
+                    elif self.segment.get_flag() == SYN_FLAG:
+                        # Server restarted handshake (it got reset request, or lost our SYN-ACK). Answer and keep receiving.
+                        # Handshake segments use default checksum, not the negotiated one
+                        self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Received SYN. Resending SYN-ACK")
+                        self.segment.set_flag(["SYN", "ACK"])
+                        self.segment.set_payload(self.answer_offer(self.segment.get_payload()))
+                        self.segment.set_header({"seq_num": 0, "ack_num": 1})
+                        self.connection.send_data(self.segment.get_bytes(DEFAULT_CHECKSUM), server_address)
+                        self.rtt.on_send("SYN-ACK")
                         continue
                     elif self.segment.get_flag() == FIN_FLAG:
                         # Handle FIN segment
@@ -152,8 +362,19 @@ class Client:
                         break
                     elif self.segment.get_header()["seq_num"] < request_number:
                         self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Ignored Segment {self.segment.get_header()['seq_num']} [Duplicate]")
+                        if selective_repeat:
+                            # Previous ACK of this segment may be lost, acknowledge it again individually
+                            metrics.segments_ignored += 1
+                            self.send_ack(server_address, self.get_cumulative_ack(request_number, metadata_received), self.segment.get_header()["seq_num"])
+                            continue
                     elif self.segment.get_header()["seq_num"] > request_number:
                         self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Ignored Segment {self.segment.get_header()['seq_num']} [Out-Of-Order]")
+                        if fec is not None and self.segment.get_flag() == 0 and self.segment.valid_checksum():
+                            # Go-Back-N without buffering still keeps its payload for forward error correction of its block
+                            recovered = fec.add_payload(self.segment.get_header()["seq_num"], self.segment.get_payload())
+                            if recovered:
+                                request_number = self.deliver_recovered(server_address, recovered, request_number, metadata_received or not selective_repeat)
+                                continue
                     else:
                         if not self.segment.valid_checksum():
                             self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Ignored Segment {self.segment.get_header()['seq_num']} [Invalid-Checksum]")
@@ -162,65 +383,224 @@ class Client:
                 else:
                     # Ignore segments with wrong port
                     self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Ignored Segment {self.segment.get_header()['seq_num']} [Wrong-Port]")
-                
-                self.send_ack(server_address, request_number)
+
+                metrics.segments_ignored += 1
+                self.send_ack(server_address, self.get_cumulative_ack(request_number, metadata_received or not selective_repeat))
             
             except socket.timeout:
-                self.logger.error(f"[!] [Server {server_address[0]}:{server_address[1]}] Timeout error. Resending previous sequence number")
-                self.send_ack(server_address, request_number)
+                if multicast:
+                    # Member only speaks when polled, server may be busy with other client
+                    continue
+                if self.pending_ack is not None and time.monotonic() >= self.ack_deadline:
+                    # Delayed ACK timer, not a lost segment
+                    self.send_ack(server_address, *self.pending_ack)
+                    continue
+                self.rtt.backoff()
+                self.logger.error(f"[!] [Server {server_address[0]}:{server_address[1]}] Timeout error. Resending previous sequence number ({self.rtt})")
+                self.send_ack(server_address, self.get_cumulative_ack(request_number, metadata_received or not selective_repeat))
+            finally:
+                self.connection.release_buffer(buffer)
+
+        metrics.end()
 
         # Send FIN-ACK
         self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Sending FIN-ACK")
         finack = Segment()
         finack.set_header({"ack_num": request_number, "seq_num": request_number})
         finack.set_flag(["FIN", "ACK"])
+        finack.set_checksum_algorithm(self.options.checksum)
         self.connection.send_data(finack.get_bytes(), server_address)
+        self.rtt.on_send("FIN-ACK")
 
         ack = False
         timeout = time.time() + TIMEOUT_LISTEN
+        ack_segment = Segment()
         while not ack:
             try:
-                (data, server_address) = self.connection.listen_single_segment()
-                ack_segment = Segment()
+                # Backed off timeout never waits past overall deadline
+                wait = min(self.rtt.get_timeout(), max(timeout - time.time(), 0.001))
+                (data, server_address) = self.connection.listen_single_segment(wait)
                 ack_segment.set_from_bytes(data)
 
                 if ack_segment.get_flag() == ACK_FLAG:
                     self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Received ACK. Tearing down connection.")
+                    self.rtt.on_ack("FIN-ACK")
                     ack = True
                     
             except socket.timeout:
                 if time.time() > timeout:
                     self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Waiting for too long. Connection closed")
                     break
+                self.rtt.backoff()
                 self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] Timeout error. Resending FIN-ACK")
                 self.connection.send_data(finack.get_bytes(), server_address)
+                self.rtt.on_send("FIN-ACK")
 
-        self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Data received successfully")
-        self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Writing file to out/{self.pathfile_output}")
+        self.logger.debug(f"[!] Receive buffer pool | {self.connection.pool}")
+        self.logger.debug(f"[!] RTT | {self.rtt}")
 
-    def create_file(self):
+        # Only in-order part of file is kept, durability policy applies here
+        length = self.get_file_offset(request_number)
+        self.file.close(length)
+        self.logger.debug(f"[!] Output file | {self.file}")
+        complete = self.file.size is None or length == self.file.size
+        if self.file.size is None:
+            # Without file size from metadata, in-order part can't be checked against whole file
+            self.logger.warning(f"[!] [Server {server_address[0]}:{server_address[1]}] File size unknown, received {length} bytes. Writing file to out/{self.pathfile_output}")
+        elif complete:
+            self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Data received successfully")
+            self.logger.info(f"[!] [Server {server_address[0]}:{server_address[1]}] Writing file to out/{self.pathfile_output}")
+        else:
+            # FIN came before every segment did (server gave up on lost segment). Partial file never takes name of output
+            os.replace(f"out/{self.pathfile_output}", f"out/{self.pathfile_output}{INCOMPLETE_SUFFIX}")
+            self.logger.error(f"[!] [Server {server_address[0]}:{server_address[1]}] Incomplete file, received {length} of {self.file.size} bytes. Partial file kept as out/{self.pathfile_output}{INCOMPLETE_SUFFIX}")
+        if self.tracer is not None:
+            try:
+                records = self.tracer.dump()
+                self.logger.debug(f"[!] Trace | {records} events dumped ({self.tracer})")
+            except OSError as e:
+                self.logger.warning(f"[!] Trace can't be dumped ({e})")
+        return complete
+
+    def create_file(self) -> FileWriter:
         # Create file to store received data
         try:
-            file = open(f"out/{self.pathfile_output}", "wb")
-            return file
+            return FileWriter(f"out/{self.pathfile_output}", self.durability)
         except FileNotFoundError:
             self.logger.error(f"[!] {self.pathfile_output} doesn't exist. Exiting...")
             exit(1)
 
-    def send_ack(self, server_address, ack_number):
-        # Send ack to server
+    def allocate_file(self, filesize: str):
+        # Metadata carries file size, preallocate output with it
+        try:
+            self.file.allocate(int(filesize))
+        except ValueError:
+            self.logger.warning(f"[!] Invalid file size {filesize} in metadata. Output file isn't preallocated")
+        except OSError as e:
+            self.logger.warning(f"[!] Output file can't be preallocated ({e})")
+
+    def get_file_offset(self, sequence: int) -> int:
+        # File offset of segment seq_num, furthest write past last segment (it may be short). File size from metadata bounds it
+        offset = min((sequence - 3) * (self.payload_size or 0), self.file.end)
+        return offset if self.file.size is None else min(offset, self.file.size)
+
+    def write_payload(self, sequence: int, payload):
+        # First data segment is always written in order, so every other segment is written after payload size is known.
+        # Every segment but the last is full, so the first one shows payload size
+        if self.payload_size is None:
+            self.payload_size = len(payload)
+        self.file.write_at((sequence - 3) * self.payload_size, payload)
+
+    def deliver_recovered(self, server_address, recovered, request_number, metadata_received) -> int:
+        # Block rebuilt by forward error correction (seq_num -> payload) goes through reorder buffer, in-order part is written
+        # and acknowledged right away. Return new request number
+        if not recovered:
+            return request_number
+        metrics = self.metrics.get(server_address)
+        metrics.segments_recovered = self.fec.recovered
+        for sequence, payload in recovered.items():
+            if sequence < request_number or sequence in self.reorder_buffer:
+                continue
+            if sequence == request_number or self.payload_size is None:
+                self.reorder_buffer[sequence] = payload
+            else:
+                self.write_payload(sequence, payload)
+                self.reorder_buffer[sequence] = None
+            self.last_buffered = max(self.last_buffered or sequence, sequence)
+        while request_number in self.reorder_buffer:
+            payload = self.reorder_buffer.pop(request_number)
+            if payload is not None:
+                self.write_payload(request_number, payload)
+            request_number += 1
+        self.fec.release(request_number)
+        metrics.bytes_delivered = self.get_file_offset(request_number)
+        self.send_ack(server_address, self.get_cumulative_ack(request_number, metadata_received))
+        return request_number
+
+    def get_cumulative_ack(self, request_number, metadata_received):
+        # Selective Repeat never acknowledge metadata (seq_num 2) cumulatively before it arrives
+        return request_number if metadata_received else 2
+
+    def send_ack(self, server_address, ack_number, seq_number=None):
+        # Send ack to server now. Every ACK is cumulative, so it also covers delayed ACK
+        # seq_num is the segment being acknowledged (previous one by default), ack_num is next expected segment
+        self.pending_ack = None
+        self.pending_count = 0
+        if self.options.multicast is not None:
+            # One-to-many transfer member answers poll with NAK instead
+            return
+        self.metrics.get(server_address).acks_sent += 1
+        if self.tracer is not None:
+            self.tracer.record(self.trace_id, TRACE_SEND_ACK, ack_number - 1 if seq_number is None else seq_number, ack_number, self.options.window or 0)
+        if self.options.sack == SACK_ON and self.reorder_buffer:
+            # Segments held past the gap are reported in SACK blocks, this frame is not cached
+            self.connection.send_data(self.get_sack_frame(ack_number, seq_number), server_address)
+            return
+        self.connection.send_data(self.get_ack_frame(ack_number, seq_number), server_address)
+
+    def send_nak(self, server_address, request_number, metadata_received):
+        # Answer poll of one-to-many transfer: cumulative ACK, missing ranges after it and horizon past which nothing arrived
+        ack_number = self.get_cumulative_ack(request_number, metadata_received)
+        received = self.reorder_buffer if metadata_received else chain(range(3, request_number), self.reorder_buffer)
+        blocks, horizon = get_nak_blocks(ack_number, received)
+        self.logger.debug(f"[!] [Server {server_address[0]}:{server_address[1]}] Received poll. Sending NAK {ack_number} (horizon {horizon}, {len(blocks)} missing ranges)")
         response = Segment()
         response.set_flag(["ACK"])
-        header = response.get_header()
-        header["seq_num"] = ack_number - 1
-        header["ack_num"] = ack_number
-        response.set_header(header)
+        response.set_checksum_algorithm(self.options.checksum)
+        response.set_header({"seq_num": horizon, "ack_num": ack_number})
+        response.set_nak_blocks(blocks)
         self.connection.send_data(response.get_bytes(), server_address)
 
+    def queue_ack(self, server_address, ack_number, seq_number=None):
+        # ACK of in-order segment. Delayed policy sends every DELAYED_ACK_COUNT-th one, or when timer expires
+        if self.options.ack != ACK_DELAYED or self.options.multicast is not None:
+            self.send_ack(server_address, ack_number, seq_number)
+            return
+        self.pending_ack = (ack_number, seq_number)
+        self.pending_count += 1
+        if self.pending_count >= DELAYED_ACK_COUNT:
+            self.send_ack(server_address, ack_number, seq_number)
+        elif self.pending_count == 1:
+            self.ack_deadline = time.monotonic() + DELAYED_ACK_TIMEOUT
+
+    def get_receive_timeout(self) -> float:
+        # Wait for next segment, but not past delayed ACK timer
+        timeout = self.rtt.get_timeout()
+        if self.pending_ack is not None:
+            timeout = min(timeout, max(self.ack_deadline - time.monotonic(), 0.001))
+        return timeout
+
+    def get_ack_frame(self, ack_number, seq_number=None) -> bytes:
+        # ACK frame is encoded once per (seq_num, ack_num), oldest frame is dropped when cache is full
+        key = (ack_number - 1 if seq_number is None else seq_number, ack_number)
+        frame = self.ack_frames.get(key)
+        if frame is None:
+            response = self.ack_segment
+            response.set_flag(["ACK"])
+            response.set_checksum_algorithm(self.options.checksum)
+            response.set_header({"seq_num": key[0], "ack_num": key[1]})
+            frame = response.get_bytes()
+            if len(self.ack_frames) >= ACK_FRAME_CACHE_SIZE:
+                del self.ack_frames[next(iter(self.ack_frames))]
+            self.ack_frames[key] = frame
+        return frame
+
+    def get_sack_frame(self, ack_number, seq_number=None) -> bytes:
+        response = self.ack_segment
+        response.set_flag(["ACK"])
+        response.set_checksum_algorithm(self.options.checksum)
+        response.set_header({"seq_num": ack_number - 1 if seq_number is None else seq_number, "ack_num": ack_number})
+        response.set_sack_blocks(get_sack_blocks(self.reorder_buffer, self.last_buffered))
+        frame = response.get_bytes()
+        response.set_sack_blocks(())
+        return frame
+
     def shutdown(self):
-        # Close file and connection
+        # Close file, connection and metrics endpoint
         self.file.close()
         self.connection.close_socket()
+        if self.metrics_endpoint is not None:
+            self.metrics_endpoint.stop()
 
 if __name__ == "__main__":
     main = Client()
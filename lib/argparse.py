@@ -1,17 +1,52 @@
 import argparse
 
+from .constant import CHECKSUM_ALGORITHMS, DEFAULT_CHECKSUM, FRAME_CACHE_SIZE, SERVER_ENGINES, ENGINE_THREAD, OVERFLOW_POLICIES, OVERFLOW_DROP_OLDEST, ARQ_MODES, DEFAULT_ARQ, RTO_MIN, RTO_MAX, CONGESTION_CONTROLS, DEFAULT_CONGESTION, ACK_POLICIES, ACK_DELAYED, DUPLICATE_ACK_THRESHOLD, SACK_MODES, SACK_ON, SEGMENT_SIZE, PMTU_PROBE_MODES, PMTU_PROBE_ON, MULTICAST_MODES, MULTICAST_OFF, DEFAULT_WORKERS, FSYNC_POLICIES, FSYNC_NONE, TRACE_SIZE, ECC_MODES, DEFAULT_ECC, FEC_MODES, DEFAULT_FEC, FEC_BLOCK_SIZE, FEC_REPAIR_COUNT
+
 class FileTransferArgumentParser:
+    # Parser of each side is built once per process and reused, simulator constructs Server and Client for every transfer
+    parsers = {}
+
     def __init__(self, is_server: bool = False):
         self.is_server = is_server
 
         # Dictionary to store server-specific arguments
         self.server_arguments = {"broadcast_port": 0, 
-                                 "pathfile_input": ""}
+                                 "pathfile_input": "",
+                                 "checksum": DEFAULT_CHECKSUM,
+                                 "cache_size": FRAME_CACHE_SIZE,
+                                 "engine": ENGINE_THREAD,
+                                 "overflow": OVERFLOW_DROP_OLDEST,
+                                 "arq": DEFAULT_ARQ,
+                                 "congestion": DEFAULT_CONGESTION,
+                                 "ack": ACK_DELAYED,
+                                 "sack": SACK_ON,
+                                 "dupack_threshold": DUPLICATE_ACK_THRESHOLD,
+                                 "ecc": DEFAULT_ECC,
+                                 "fec": DEFAULT_FEC,
+                                 "fec_block": FEC_BLOCK_SIZE,
+                                 "fec_repair": FEC_REPAIR_COUNT,
+                                 "window": None,
+                                 "segment_size": SEGMENT_SIZE,
+                                 "pmtu_probe": PMTU_PROBE_ON,
+                                 "multicast": MULTICAST_OFF,
+                                 "multicast_group": None,
+                                 "workers": DEFAULT_WORKERS,
+                                 "metrics": None,
+                                 "trace": None,
+                                 "trace_size": TRACE_SIZE,
+                                 "rto_min": RTO_MIN,
+                                 "rto_max": RTO_MAX}
 
         # Dictionary to store client-specific arguments
         self.client_arguments = {"client_port": 0,
                                  "broadcast_port": 0,
-                                 "pathfile_output": ""}
+                                 "pathfile_output": "",
+                                 "fsync": FSYNC_NONE,
+                                 "metrics": None,
+                                 "trace": None,
+                                 "trace_size": TRACE_SIZE,
+                                 "rto_min": RTO_MIN,
+                                 "rto_max": RTO_MAX}
 
         self._parse_arguments()
 
@@ -23,6 +58,42 @@ class FileTransferArgumentParser:
             self._parse_client_arguments()
 
     def _parse_server_arguments(self):
+        parser = self.parsers.get("server")
+        if parser is None:
+            parser = self.parsers["server"] = self._build_server_parser()
+
+        # Parse server arguments
+        args = parser.parse_args()
+        self.server_arguments = {
+            "broadcast_port": args.broadcast_port,
+            "pathfile_input": args.pathfile_input,
+            "checksum": args.checksum,
+            "cache_size": args.cache_size,
+            "engine": args.engine,
+            "overflow": args.overflow,
+            "arq": args.arq,
+            "congestion": args.congestion,
+            "ack": args.ack,
+            "sack": args.sack,
+            "dupack_threshold": args.dupack_threshold,
+            "ecc": args.ecc,
+            "fec": args.fec,
+            "fec_block": args.fec_block,
+            "fec_repair": args.fec_repair,
+            "window": args.window,
+            "segment_size": args.segment_size,
+            "pmtu_probe": args.pmtu_probe,
+            "multicast": args.multicast,
+            "multicast_group": args.multicast_group,
+            "workers": args.workers,
+            "metrics": args.metrics,
+            "trace": args.trace,
+            "trace_size": args.trace_size,
+            "rto_min": args.rto_min,
+            "rto_max": args.rto_max,
+        }
+
+    def _build_server_parser(self) -> argparse.ArgumentParser:
         # Argument parser for server application
         parser = argparse.ArgumentParser(
             description="Server for handling file transfer connection to client"
@@ -41,15 +112,150 @@ class FileTransferArgumentParser:
             type=str,
             help="Path to the file to send",
         )
+        parser.add_argument(
+            "--checksum",
+            choices=CHECKSUM_ALGORITHMS,
+            default=DEFAULT_CHECKSUM,
+            help="Checksum algorithm offered to clients at handshake",
+        )
+        parser.add_argument(
+            "--cache-size",
+            type=int,
+            default=FRAME_CACHE_SIZE,
+            help="Byte budget of encoded frame cache, least recently used frame is evicted (0 for unlimited)",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=SERVER_ENGINES,
+            default=ENGINE_THREAD,
+            help="Engine used when paralelization is enabled, thread per client or single asyncio event loop",
+        )
+        parser.add_argument(
+            "--overflow",
+            choices=OVERFLOW_POLICIES,
+            default=OVERFLOW_DROP_OLDEST,
+            help="Segment dropped when client inbox is full in parallel mode",
+        )
+        parser.add_argument(
+            "--arq",
+            choices=ARQ_MODES,
+            default=DEFAULT_ARQ,
+            help="Retransmission mode offered to clients, Go-Back-N or Selective Repeat",
+        )
+        parser.add_argument(
+            "--congestion",
+            choices=CONGESTION_CONTROLS,
+            default=DEFAULT_CONGESTION,
+            help="Congestion control of send window, fixed window or adaptive",
+        )
+        parser.add_argument(
+            "--ack",
+            choices=ACK_POLICIES,
+            default=ACK_DELAYED,
+            help="ACK policy offered to clients, ACK every segment or delayed cumulative ACK",
+        )
+        parser.add_argument(
+            "--sack",
+            choices=SACK_MODES,
+            default=SACK_ON,
+            help="Offer selective ACK blocks, so only segments missing at client are resent",
+        )
+        parser.add_argument(
+            "--dupack-threshold",
+            type=int,
+            default=DUPLICATE_ACK_THRESHOLD,
+            help="Duplicate ACKs which trigger fast retransmit, 0 disables it",
+        )
+        parser.add_argument(
+            "--ecc",
+            choices=ECC_MODES,
+            default=DEFAULT_ECC,
+            help="Error correcting code offered to clients, Hamming SECDED payload corrects single bit error of every byte",
+        )
+        parser.add_argument(
+            "--fec",
+            choices=FEC_MODES,
+            default=DEFAULT_FEC,
+            help="Forward error correction offered to clients, repair segments of every block rebuild lost data segments without retransmission",
+        )
+        parser.add_argument(
+            "--fec-block",
+            metavar="SEGMENTS",
+            type=int,
+            default=FEC_BLOCK_SIZE,
+            help="Data segments of every forward error correction block",
+        )
+        parser.add_argument(
+            "--fec-repair",
+            metavar="SEGMENTS",
+            type=int,
+            default=FEC_REPAIR_COUNT,
+            help="Reed-Solomon repair segments of every block, lost data segments of block it can rebuild (XOR parity is always 1)",
+        )
+        parser.add_argument(
+            "--window",
+            metavar="SEGMENTS",
+            type=int,
+            default=None,
+            help="Largest send window, also the window of fixed congestion control (default receive window of client)",
+        )
+        parser.add_argument(
+            "--segment-size",
+            type=int,
+            default=SEGMENT_SIZE,
+            help="Segment size in bytes (header included) offered at handshake, client may lower it",
+        )
+        parser.add_argument(
+            "--pmtu-probe",
+            choices=PMTU_PROBE_MODES,
+            default=PMTU_PROBE_ON,
+            help="Probe path of every client for largest segment which isn't fragmented",
+        )
+        parser.add_argument(
+            "--multicast",
+            choices=MULTICAST_MODES,
+            default=MULTICAST_OFF,
+            help="Sequential mode sends every segment once per round to all clients, which report missing segments with NAK",
+        )
+        parser.add_argument(
+            "--multicast-group",
+            metavar="ADDRESS:PORT",
+            type=str,
+            default=None,
+            help="IP multicast group of one-to-many transfer, every client gets unicast copy when not given",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=DEFAULT_WORKERS,
+            help="Worker processes sharing broadcast port (SO_REUSEPORT), more than 1 always runs parallel mode",
+        )
+        self._add_metrics_argument(parser)
+        self._add_trace_arguments(parser)
+        self._add_rto_arguments(parser)
 
-        # Parse server arguments
+        return parser
+
+    def _parse_client_arguments(self):
+        parser = self.parsers.get("client")
+        if parser is None:
+            parser = self.parsers["client"] = self._build_client_parser()
+
+        # Parse client arguments
         args = parser.parse_args()
-        self.server_arguments = {
+        self.client_arguments = {
+            "client_port": args.client_port,
             "broadcast_port": args.broadcast_port,
-            "pathfile_input": args.pathfile_input,
+            "pathfile_output": args.pathfile_output,
+            "fsync": args.fsync,
+            "metrics": args.metrics,
+            "trace": args.trace,
+            "trace_size": args.trace_size,
+            "rto_min": args.rto_min,
+            "rto_max": args.rto_max,
         }
 
-    def _parse_client_arguments(self):
+    def _build_client_parser(self) -> argparse.ArgumentParser:
         # Argument parser for component application
         parser = argparse.ArgumentParser(
             description="Client for handling file transfer connection from server"
@@ -74,14 +280,59 @@ class FileTransferArgumentParser:
             type=str,
             help="Output file path",
         )
+        parser.add_argument(
+            "--fsync",
+            choices=FSYNC_POLICIES,
+            default=FSYNC_NONE,
+            help="Durability of output file, leave writeback to kernel, sync in background while receiving or sync once at the end",
+        )
+        self._add_metrics_argument(parser)
+        self._add_trace_arguments(parser)
+        self._add_rto_arguments(parser)
 
-        # Parse client arguments
-        args = parser.parse_args()
-        self.client_arguments = {
-            "client_port": args.client_port,
-            "broadcast_port": args.broadcast_port,
-            "pathfile_output": args.pathfile_output,
-        }
+        return parser
+
+    def _add_metrics_argument(self, parser):
+        # Prometheus text endpoint, shared by server and client
+        parser.add_argument(
+            "--metrics",
+            metavar="ADDRESS",
+            type=str,
+            default=None,
+            help="Serve metrics of every connection in Prometheus text format at host:port (TCP) or unix:path",
+        )
+
+    def _add_trace_arguments(self, parser):
+        # Binary event trace, shared by server and client
+        parser.add_argument(
+            "--trace",
+            metavar="PATH",
+            type=str,
+            default=None,
+            help="Record every segment and ACK into binary trace dumped to PATH, read it with python -m lib.trace",
+        )
+        parser.add_argument(
+            "--trace-size",
+            metavar="EVENTS",
+            type=int,
+            default=TRACE_SIZE,
+            help="Events kept in trace ring buffer, oldest is overwritten",
+        )
+
+    def _add_rto_arguments(self, parser):
+        # Retransmission timeout clamps, shared by server and client
+        parser.add_argument(
+            "--rto-min",
+            type=float,
+            default=RTO_MIN,
+            help="Minimum retransmission timeout in seconds",
+        )
+        parser.add_argument(
+            "--rto-max",
+            type=float,
+            default=RTO_MAX,
+            help="Maximum retransmission timeout in seconds",
+        )
 
     def get_value(self):
         if self.is_server:
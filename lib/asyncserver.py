@@ -0,0 +1,355 @@
+import asyncio
+import logging
+from typing import Dict, Tuple
+
+from .segment import Segment
+from .options import ConnectionOptions
+from .pmtu import PathMTUSearch
+from .trace import TRACE_SEND_SEGMENT, TRACE_RESEND_SEGMENT, TRACE_RECEIVE_ACK, TRACE_DUPLICATE_ACK, TRACE_TIMEOUT
+from .constant import SYN_ACK_FLAG, ACK_FLAG, FIN_ACK_FLAG, TIMEOUT_PARALLEL, CLIENT_QUEUE_SIZE, ARQ_GO_BACK_N
+
+class ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine : "AsyncServerEngine"):
+        # Protocol only hands every datagram over to engine
+        self.engine = engine
+
+    def connection_made(self, transport):
+        self.engine.transport = transport
+
+    def datagram_received(self, data : bytes, address : Tuple[str, int]):
+        self.engine.route(data, address)
+
+    def error_received(self, exc : Exception):
+        self.engine.logger.warning(f"[!] Socket error: {exc}")
+
+class AsyncServerEngine:
+    def __init__(self, server, idle_timeout : float = TIMEOUT_PARALLEL):
+        # Parallel server mode on single event loop, every client is a coroutine instead of a thread.
+        # server gives broadcast socket, frame cache and handshake options
+        self.server = server
+        self.logger : logging.Logger = server.logger
+        self.idle_timeout = idle_timeout
+
+        # Engine only implements Go-Back-N, selective repeat is turned down once instead of being silently left out of offer
+        if server.options.arq != ARQ_GO_BACK_N:
+            self.logger.warning("[!] Selective repeat isn't available in asyncio engine. Using Go-Back-N")
+
+        self.transport : asyncio.DatagramTransport = None
+        self.loop : asyncio.AbstractEventLoop = None
+        self.done : asyncio.Future = None
+
+        # Inbox of every active client, datagram is routed by source address
+        self.sessions: Dict[Tuple[str, int], asyncio.Queue] = {}
+        self.last_activity = 0.0
+
+    # -- Event Loop --
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        # Own broadcast socket until no client is active for idle_timeout
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()
+        self.last_activity = self.loop.time()
+        await self.loop.create_datagram_endpoint(lambda: ServerProtocol(self), sock=self.server.connection.socket)
+        self.logger.debug("[!] Listening to broadcast address for clients (asyncio engine).")
+
+        self.loop.call_later(self.idle_timeout, self.check_idle)
+        try:
+            await self.done
+        finally:
+            self.transport.abort()
+
+    def check_idle(self):
+        # Timer callback, stop when nothing happened since last check
+        if self.done.done():
+            return
+        idle = self.loop.time() - self.last_activity
+        # Worker of multi-process server waits until every worker is idle
+        if not self.sessions and idle >= self.idle_timeout and (self.server.workers is None or self.server.workers.on_idle()):
+            self.logger.error("[!] Timeout error for listening client. Exiting")
+            self.done.set_result(None)
+        else:
+            self.loop.call_later(max(self.idle_timeout - idle, 0.1), self.check_idle)
+
+    def route(self, data : bytes, address : Tuple[str, int]):
+        # Called by protocol for every datagram
+        self.last_activity = self.loop.time()
+        if self.server.workers is not None:
+            self.server.workers.on_activity()
+        queue = self.sessions.get(address)
+        if queue is not None:
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] Inbox full. Dropping segment")
+            return
+
+        # Only connect request (no flag) starts new session, late FIN-ACK or ACK of finished client is ignored
+        segment = Segment()
+        segment.set_from_bytes(data)
+        if segment.get_flag() != 0:
+            return
+        self.logger.debug(f"[!] Received request from {address[0]}:{address[1]}")
+        self.sessions[address] = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.loop.create_task(self.handle_client(address))
+
+    def send(self, frame : bytes, address : Tuple[str, int]):
+        self.transport.sendto(frame, address)
+
+    async def receive(self, address : Tuple[str, int], segment : Segment, timeout : float) -> bool:
+        # Wait for next datagram of client and parse into segment, False on timeout
+        try:
+            data = await asyncio.wait_for(self.sessions[address].get(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        segment.set_from_bytes(data)
+        return True
+
+    # -- Client State Machine --
+    async def handle_client(self, address : Tuple[str, int]):
+        self.logger.debug("[!] Commencing file transfer...")
+        try:
+            while True:
+                await self.three_way_handshake(address)
+                if not await self.file_transfer(address):
+                    break
+            self.server.metrics.get(address).end()
+            await self.teardown(address)
+        finally:
+            self.sessions.pop(address, None)
+            self.last_activity = self.loop.time()
+
+    async def three_way_handshake(self, address : Tuple[str, int]):
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Initiating three way handshake")
+        syn = Segment()
+        syn.set_flag(["SYN"])
+        syn.set_payload(self.get_offer().get_offer_bytes())
+        syn_frame = syn.get_bytes()
+        segment = Segment()
+        rtt = self.server.get_rtt(address)
+        rtt.discard_pending()
+        handshake_start = self.loop.time()
+
+        while True:
+            self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Sending SYN")
+            self.send(syn_frame, address)
+            rtt.on_send("SYN")
+            if not await self.receive(address, segment, rtt.get_timeout()):
+                rtt.backoff()
+                self.logger.error(f"[!] [Client {address[0]}:{address[1]}] SYN-ACK response timeout. Resending SYN")
+                continue
+            # Empty SYN-ACK is a leftover reset request, not an answer to this SYN
+            if segment.get_flag() != SYN_ACK_FLAG or len(segment.get_payload()) == 0:
+                continue
+            # Corrupt or malformed answer is never defaulted, offer again
+            options = ConnectionOptions.from_answer(segment.get_payload()) if segment.valid_checksum() else None
+            if options is not None:
+                break
+            self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] Received Corrupt SYN-ACK. Resending SYN")
+
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Receive SYN-ACK")
+        rtt.on_ack("SYN")
+        self.server.metrics.get(address).on_handshake(self.loop.time() - handshake_start)
+        self.server.client_options[address] = options
+
+        self.send_handshake_ack(address)
+        await self.probe_path_mtu(address, options)
+        self.logger.info(f"[!] [Client {address[0]}:{address[1]}] Handshake established ({options})")
+
+    def get_offer(self) -> ConnectionOptions:
+        # Server options this engine can serve, error correction and FEC frames come from the same frame cache as threaded mode
+        options = self.server.options
+        return ConnectionOptions(checksum=options.checksum, arq=ARQ_GO_BACK_N, ack=options.ack, sack=options.sack, ecc=options.ecc, fec=options.fec, segment_size=self.server.segment_size)
+
+    async def probe_path_mtu(self, address : Tuple[str, int], options : ConnectionOptions):
+        # Same search as threaded server, client which doesn't negotiate segment size gets size of server
+        if options.segment_size is None:
+            options.segment_size = self.server.segment_size
+            return
+        if not self.server.pmtu_probe:
+            return
+
+        search = PathMTUSearch(options.segment_size)
+        self.server.client_pmtu[address] = search
+        rtt = self.server.get_rtt(address)
+        probe = Segment()
+        segment = Segment()
+        while not search.done:
+            for size in search.get_probe_sizes():
+                probe.set_probe(size)
+                self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Sending path MTU probe {size}")
+                try:
+                    if not self.server.connection.send_probe(probe.get_bytes(), address):
+                        search.on_too_big(size)
+                except OSError as e:
+                    self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] Path MTU probe {size} failed ({e})")
+
+            deadline = self.loop.time() + rtt.get_timeout()
+            while search.get_pending() and self.loop.time() < deadline:
+                if not await self.receive(address, segment, max(deadline - self.loop.time(), 0.001)):
+                    break
+                if segment.is_probe() and segment.get_flag() == ACK_FLAG:
+                    search.on_ack(segment.ack_num)
+                elif segment.get_flag() == SYN_ACK_FLAG and len(segment.get_payload()) > 0:
+                    self.send_handshake_ack(address)
+            search.end_round()
+
+        self.server.set_segment_size(options, search.get_size())
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Path MTU | {search}")
+
+    def send_handshake_ack(self, address : Tuple[str, int]):
+        ack = Segment()
+        ack.set_flag(["ACK"])
+        ack.set_header({"seq_num": 1, "ack_num": 1})
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Sending ACK")
+        self.send(ack.get_bytes(), address)
+
+    async def file_transfer(self, address : Tuple[str, int]) -> bool:
+        # Go-Back-N sender with continuous sliding window, timer runs on oldest unacknowledged segment.
+        # Return True when client asks to reset connection
+        options = self.server.client_options.get(address, ConnectionOptions())
+        frame_cache = self.server.get_frame_cache(options.segment_size, options.ecc, options.fec)
+        repairs = self.server.get_repair_encoder(options.segment_size, options.ecc, options.fec)
+        num_of_segment = len(frame_cache.segments) + 2
+        sequence_base = 2
+        next_sequence = 2
+        highest_sequence = 2
+        timer_start = 0.0
+        segment = Segment()
+        segment.set_checksum_algorithm(options.checksum)
+        rtt = self.server.get_rtt(address)
+        rtt.discard_pending()
+        congestion = self.server.new_congestion_control(address, options)
+        scoreboard = self.server.new_sack_scoreboard(address)
+        recovery_point = 2
+        retransmitted_base = None
+        sack_recovery = False
+        tracer = self.server.tracer
+        trace_id = tracer.get_id(address) if tracer is not None else 0
+        metrics = self.server.start_metrics(address, rtt, congestion, options)
+
+        while sequence_base < num_of_segment:
+            # New segments go out as soon as window has room
+            window_end = min(sequence_base + congestion.get_window(), num_of_segment)
+            if next_sequence < window_end and next_sequence == sequence_base:
+                timer_start = self.loop.time()
+            while next_sequence < window_end:
+                if next_sequence in scoreboard:
+                    scoreboard.skipped += 1
+                else:
+                    if tracer is not None:
+                        tracer.record(trace_id, TRACE_SEND_SEGMENT, next_sequence, sequence_base, congestion.get_window())
+                    self.send(frame_cache.get_frame(next_sequence - 2, options.checksum), address)
+                    rtt.on_send(next_sequence)
+                    metrics.segments_sent += 1
+                    if repairs is not None and next_sequence >= highest_sequence:
+                        # First send of segment closing a block, its repairs follow right behind
+                        for frame in repairs.get_frames(next_sequence, options.checksum):
+                            self.send(frame, address)
+                            metrics.repairs_sent += 1
+                next_sequence += 1
+            highest_sequence = max(highest_sequence, next_sequence)
+            metrics.next = next_sequence
+
+            if not await self.receive(address, segment, max(timer_start + rtt.get_timeout() - self.loop.time(), 0.001)):
+                rtt.backoff()
+                congestion.on_timeout()
+                self.logger.error(f"[!] [Client {address[0]}:{address[1]}] ACK {sequence_base + 1} timeout. Resending from Segment {sequence_base} ({rtt}, window: {congestion.get_window()})")
+                if tracer is not None:
+                    tracer.record(trace_id, TRACE_TIMEOUT, sequence_base, sequence_base + 1, congestion.get_window())
+                recovery_point = highest_sequence
+                retransmitted_base = None
+                sack_recovery = False
+                scoreboard.reset()
+                next_sequence = sequence_base
+            elif segment.get_flag() == SYN_ACK_FLAG and len(segment.get_payload()) == 0:
+                self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Received SYN ACK Flag, client ask to reset connection")
+                return True
+            elif segment.get_flag() == SYN_ACK_FLAG:
+                self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Received duplicate SYN ACK, handshake ACK was lost")
+                self.send_handshake_ack(address)
+            elif segment.is_probe():
+                self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Received late path MTU probe ACK")
+            elif segment.get_flag() != ACK_FLAG:
+                self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] Received Wrong Flag")
+            elif not segment.valid_checksum():
+                # Corrupt SACK blocks must not reach scoreboard, RTT estimator or congestion control
+                self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] Received Corrupt ACK")
+            elif sequence_base <= segment.ack_num <= highest_sequence:
+                metrics.acks_received += 1
+                scoreboard.update(segment.get_sack_blocks(), sequence_base, highest_sequence)
+                if segment.ack_num > sequence_base:
+                    # Cumulative ACK slides window and restarts timer, may cover segments sent before going back
+                    if tracer is not None:
+                        tracer.record(trace_id, TRACE_RECEIVE_ACK, segment.seq_num, segment.ack_num, congestion.get_window())
+                    for sequence in range(sequence_base, segment.ack_num - 1):
+                        rtt.forget(sequence)
+                    rtt.on_ack(segment.ack_num - 1)
+                    congestion.on_ack(segment.ack_num - sequence_base)
+                    sequence_base = segment.ack_num
+                    next_sequence = max(next_sequence, sequence_base)
+                    metrics.base = sequence_base
+                    scoreboard.advance(sequence_base)
+                    timer_start = self.loop.time()
+                    if retransmitted_base is not None and sequence_base > retransmitted_base:
+                        congestion.on_recovery()
+                        retransmitted_base = None
+                else:
+                    metrics.duplicate_acks += 1
+                    if tracer is not None:
+                        tracer.record(trace_id, TRACE_DUPLICATE_ACK, segment.seq_num, segment.ack_num, congestion.get_window())
+                    if congestion.on_duplicate_ack() and sequence_base >= recovery_point:
+                        # Fast retransmit without waiting for timer. Only SACK holes are resent when client reports them
+                        self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] {congestion.duplicate_acks} duplicate ACK {sequence_base}. Fast retransmit from Segment {sequence_base}")
+                        congestion.on_fast_retransmit()
+                        recovery_point = highest_sequence
+                        retransmitted_base = sequence_base
+                        scoreboard.end_recovery()
+                        sack_recovery = scoreboard.has_holes(sequence_base)
+                        if not sack_recovery:
+                            next_sequence = sequence_base
+
+                if sack_recovery and sequence_base < recovery_point:
+                    for sequence in scoreboard.next_holes(sequence_base):
+                        self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] SACK. Resending Segment {sequence}")
+                        self.send(frame_cache.get_frame(sequence - 2, options.checksum), address)
+                        rtt.on_send(sequence)
+                        metrics.segments_sent += 1
+                        if tracer is not None:
+                            tracer.record(trace_id, TRACE_RESEND_SEGMENT, sequence, sequence_base, congestion.get_window())
+                else:
+                    sack_recovery = False
+            else:
+                self.logger.warning(f"[!] [Client {address[0]}:{address[1]}] Received Wrong ACK")
+        return False
+
+    async def teardown(self, address : Tuple[str, int]):
+        self.logger.info(f"[!] [Client {address[0]}:{address[1]}] File transfer complete. Sending FIN")
+        fin = Segment()
+        fin.set_flag(["FIN"])
+        fin_frame = fin.get_bytes()
+        segment = Segment()
+        rtt = self.server.get_rtt(address)
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] RTT | {rtt}")
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Congestion control | {self.server.client_congestion.get(address)}")
+        self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] SACK | {self.server.client_sack.get(address)}")
+
+        self.send(fin_frame, address)
+        rtt.on_send("FIN")
+        while True:
+            if not await self.receive(address, segment, rtt.get_timeout()):
+                rtt.backoff()
+                self.logger.error(f"[!] [Client {address[0]}:{address[1]}] ACK response timeout. Resending FIN")
+                self.send(fin_frame, address)
+                rtt.on_send("FIN")
+            elif segment.get_flag() == FIN_ACK_FLAG:
+                self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] Received FIN-ACK")
+                rtt.on_ack("FIN")
+                break
+
+        self.logger.info(f"[!] [Client {address[0]}:{address[1]}] Sending ACK. Tearing down connection.")
+        ack = Segment()
+        ack.set_flag(["ACK"])
+        self.send(ack.get_bytes(), address)
+        self.server.dump_trace()
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import shlex
+import signal
+import socket
+import filecmp
+import platform
+import tempfile
+import itertools
+import threading
+import subprocess
+from typing import Dict, List
+
+from .relay import ImpairmentRelay
+
+# Impairment of each direction applied by relay between client and server. Every cell goes through relay,
+# so clean profile is the baseline of relay overhead itself
+PROFILES: Dict[str, Dict[str, float]] = {
+    "clean": {},
+    "delay": {"delay": 0.01},
+    "loss": {"loss": 0.01},
+    "reorder": {"reorder": 0.05, "reorder_delay": 0.002},
+    "wan": {"delay": 0.02, "loss": 0.005, "reorder": 0.01, "reorder_delay": 0.005, "rate": 12.5 * 1024 * 1024},
+}
+
+SERVER_PORT = 9970
+RELAY_PORT = 9971
+CLIENT_PORT = 8970
+CELL_TIMEOUT = 600
+CONNECT_TIMEOUT = 0.5
+CONNECT_ATTEMPTS = 20
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_size(value : str) -> int:
+    # "1K", "64M", "1G" or plain bytes -> bytes
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+def format_size(size : int) -> str:
+    for unit in ("G", "M", "K"):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+def get_revision() -> Dict[str, object]:
+    # Commit the numbers belong to, dirty when tree has uncommitted change
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+def create_source(directory : str, size : int) -> str:
+    # Random file written in chunks, so 1 GB source doesn't need 1 GB memory
+    path = os.path.join(directory, f"source_{format_size(size)}.bin")
+    if not os.path.exists(path):
+        with open(path, "wb") as file:
+            remaining = size
+            while remaining > 0:
+                chunk = os.urandom(min(remaining, 16 * 1024 * 1024))
+                file.write(chunk)
+                remaining -= len(chunk)
+    return path
+
+def run_cell(cell : Dict[str, object]) -> Dict[str, object]:
+    # Child side of one cell, real Server and Client in this process talk through relay run by parent.
+    # Elapsed time is taken when server finishes FIN teardown, client lingering for lost final ACK isn't counted
+    import logging
+    from server import Server
+    from client import Client
+
+    logging.disable(logging.CRITICAL)
+    output = f"benchmark_{os.getpid()}.bin"
+    sys.argv = ["server.py", str(SERVER_PORT), cell["source"], "--segment-size", str(cell["segment_size"]), "--pmtu-probe", "off"]
+    if cell["window"] is not None:
+        sys.argv += ["--window", str(cell["window"])]
+    sys.argv += shlex.split(cell["server_args"])
+    server = Server()
+    sys.argv = ["client.py", str(CLIENT_PORT), str(RELAY_PORT), output]
+    client = Client()
+
+    # SYN may be dropped by relay too
+    for attempt in range(CONNECT_ATTEMPTS):
+        client.connect()
+        try:
+            data, address = server.connection.listen_single_segment(CONNECT_TIMEOUT)
+            break
+        except socket.timeout:
+            continue
+    else:
+        raise TimeoutError("server never received SYN")
+    server.client_list.append(address)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    receiver = threading.Thread(target=lambda: (client.three_way_handshake(), client.listen_file_transfer(), client.shutdown()))
+    receiver.start()
+    server.start_file_transfer()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    receiver.join()
+
+    totals = server.metrics.snapshot()["process"]
+    received = os.path.join("out", output)
+    match = filecmp.cmp(cell["source"], received, shallow=False)
+    os.remove(received)
+    server.connection.close_socket()
+    server.list_segment.close()
+    server.file.close()
+    return {
+        "elapsed": elapsed,
+        "goodput": cell["size"] / elapsed,
+        "cpu_time": cpu,
+        "segments_sent": totals["segments_sent_total"],
+        "segments_resent": totals["segments_resent_total"],
+        "retransmission_ratio": totals["segments_resent_total"] / totals["segments_sent_total"] if totals["segments_sent_total"] else 0.0,
+        "timeouts": totals["timeouts_total"],
+        "match": match,
+    }
+
+def spawn_cell(cell : Dict[str, object], timeout : float) -> Dict[str, object]:
+    # Parent side of one cell. Child process per cell, so peak RSS (high-water mark of whole process) belongs to this cell only
+    profile = PROFILES[cell["profile"]]
+    relay = ImpairmentRelay(RELAY_PORT, SERVER_PORT, profile.get("delay", 0.0), profile.get("rate"),
+                            loss=profile.get("loss", 0.0), reorder=profile.get("reorder", 0.0),
+                            reorder_delay=profile.get("reorder_delay", 0.0), seed=cell["seed"])
+    relay.start()
+    child = subprocess.Popen([sys.executable, "-m", "lib.benchmark", "--cell", json.dumps(cell)], stdout=subprocess.PIPE)
+    timer = threading.Timer(timeout, lambda: child.send_signal(signal.SIGKILL))
+    timer.start()
+    try:
+        output = child.stdout.read()
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        timer.cancel()
+        child.stdout.close()
+        relay.stop()
+
+    result = dict(cell)
+    del result["source"]
+    if child.returncode == 0:
+        result.update(json.loads(output))
+    else:
+        result["error"] = f"exit code {child.returncode}"
+    result["peak_rss"] = usage.ru_maxrss * 1024   # Linux reports kilobytes
+    result["relay"] = {"forwarded": relay.forwarded, "dropped": relay.dropped, "reordered": relay.reordered}
+    return result
+
+def compare(results : List[Dict[str, object]], baseline_path : str):
+    # Goodput and CPU time of every cell against same cell of earlier run, first run of each cell is used
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    key = lambda result: (result["profile"], result["size"], result["window"], result["segment_size"], result["server_args"])
+    previous = {}
+    for result in baseline["results"]:
+        previous.setdefault(key(result), result)
+    print(f"\nAgainst {baseline['meta']['commit'] or baseline_path}", file=sys.stderr)
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or "error" in old or "error" in result:
+            continue
+        # Tiny file may not use measurable CPU time
+        cpu = f"{result['cpu_time'] / old['cpu_time']:5.2f}x" if old["cpu_time"] else "    -"
+        print(f"{result['profile']:8}| {format_size(result['size']):>5} | window {str(result['window']):>7} | segment {result['segment_size']:>6} | "
+              f"goodput {result['goodput'] / old['goodput']:5.2f}x | cpu {cpu}", file=sys.stderr)
+
+
+# End-to-end benchmark of real server and client on loopback, matrix of file size, window, segment size and impairment profile.
+# JSON result carries commit, so runs of different commits can be compared with --baseline
+# Run with: python -m lib.benchmark [--sizes 1K,1M,64M] [--windows default,16] [--segment-sizes 1472,32768] [--profiles clean,loss] [--output PATH]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Loopback benchmark of server and client through impairment relay")
+    parser.add_argument("--cell", help=argparse.SUPPRESS)
+    parser.add_argument("--sizes", default="1K,1M,16M", help="File sizes, K/M/G suffix (default 1K,1M,16M)")
+    parser.add_argument("--windows", default="default", help="Largest send windows in segments, default is receive window of client (default default)")
+    parser.add_argument("--segment-sizes", default="32768", help="Segment sizes in bytes, header included (default 32768)")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"Impairment profiles, any of {','.join(PROFILES)} (default all)")
+    parser.add_argument("--server-args", default="", help="Extra server options of every cell, e.g. \"--arq sr --congestion cubic\"")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of every cell, each with its own relay seed (default 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Relay seed of first run (default 0)")
+    parser.add_argument("--timeout", type=float, default=CELL_TIMEOUT, help=f"Seconds before cell is killed (default {CELL_TIMEOUT})")
+    parser.add_argument("--output", default=None, help="JSON result path (default stdout)")
+    parser.add_argument("--baseline", default=None, help="JSON result of earlier run to compare with")
+    args = parser.parse_args()
+
+    if args.cell is not None:
+        print(json.dumps(run_cell(json.loads(args.cell))))
+        sys.exit(0)
+
+    profiles = args.profiles.split(",")
+    unknown = [profile for profile in profiles if profile not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profile {','.join(unknown)}")
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    windows = [None if window == "default" else int(window) for window in args.windows.split(",")]
+    segment_sizes = [int(size) for size in args.segment_sizes.split(",")]
+
+    directory = tempfile.mkdtemp(prefix="benchmark_")
+    results = []
+    meta = {**get_revision(), "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "profiles": {profile: PROFILES[profile] for profile in profiles}}
+    print(f"{'profile':8}| {'size':>5} | {'window':>7} | {'segment':>7} | {'goodput':>12} | {'resent':>6} | {'cpu':>7} | {'rss':>8}", file=sys.stderr)
+    try:
+        for size, window, segment_size, profile, run in itertools.product(sizes, windows, segment_sizes, profiles, range(args.repeat)):
+            cell = {"profile": profile, "size": size, "window": window, "segment_size": segment_size, "server_args": args.server_args,
+                    "run": run, "seed": args.seed + run, "source": create_source(directory, size)}
+            result = spawn_cell(cell, args.timeout)
+            results.append(result)
+            if "error" in result:
+                print(f"{profile:8}| {format_size(size):>5} | {str(window):>7} | {segment_size:>7} | {result['error']}", file=sys.stderr)
+                continue
+            print(f"{profile:8}| {format_size(size):>5} | {str(window):>7} | {segment_size:>7} | {result['goodput'] / (1024 * 1024):7.2f} MB/s | "
+                  f"{result['retransmission_ratio']:6.3f} | {result['cpu_time']:6.2f}s | {result['peak_rss'] / (1024 * 1024):5.1f} MB"
+                  f"{'' if result['match'] else ' | MISMATCH'}", file=sys.stderr)
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    report = json.dumps({"meta": meta, "results": results}, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    if args.baseline is not None:
+        compare(results, args.baseline)
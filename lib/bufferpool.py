@@ -0,0 +1,35 @@
+from collections import deque
+
+class BufferPool:
+    def __init__(self, count : int, size : int):
+        # Preallocated receive buffers, filled with recvfrom_into instead of allocating bytes per datagram
+        self.size = size
+        self.count = count
+        self.free = deque(bytearray(size) for i in range(count))
+
+        # Statistic
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquired = 0
+        self.exhausted = 0
+
+    def acquire(self) -> bytearray:
+        # Borrow buffer. When every buffer is lent, allocate a temporary one and count it
+        self.acquired += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            return self.free.pop()
+        except IndexError:
+            self.exhausted += 1
+            return bytearray(self.size)
+
+    def release(self, buffer : bytearray):
+        # Give buffer back after payload is written or ACK is processed. Temporary buffer is kept only if pool has room,
+        # buffer of previous pool (before segment size changed) is dropped
+        self.in_use -= 1
+        if len(self.free) < self.count and len(buffer) == self.size:
+            self.free.append(buffer)
+
+    def __str__(self):
+        return f"in use: {self.in_use}/{self.count}, peak: {self.peak_in_use}, acquired: {self.acquired}, exhausted: {self.exhausted}"
@@ -0,0 +1,230 @@
+import abc
+import binascii
+import zlib
+from typing import Dict, Type, Union
+
+from .constant import CRC_POLYNOM, CRC_START, CRC32C_POLYNOM, CHECKSUM_CRC16, CHECKSUM_CRC32, CHECKSUM_CRC32C
+
+# Optional C implementation of CRC32C (pip install crc32c)
+try:
+    import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+# -- Lookup Tables --
+def _build_crc16_table():
+    # MSB-first table for CRC-16/CCITT, one entry for every possible leading byte
+    table = []
+    for byte in range(256):
+        crc_val = byte << 8
+        for i in range(8):
+            if crc_val & 0x8000:
+                crc_val = ((crc_val << 1) ^ CRC_POLYNOM) & 0xFFFF
+            else:
+                crc_val = (crc_val << 1) & 0xFFFF
+        table.append(crc_val)
+    return tuple(table)
+
+def _build_crc32c_table():
+    # LSB-first (reflected) table for CRC32C Castagnoli polynom
+    table = []
+    for byte in range(256):
+        crc_val = byte
+        for i in range(8):
+            if crc_val & 1:
+                crc_val = (crc_val >> 1) ^ CRC32C_POLYNOM
+            else:
+                crc_val = crc_val >> 1
+        table.append(crc_val)
+    return tuple(table)
+
+CRC16_TABLE = _build_crc16_table()
+CRC32C_TABLE = _build_crc32c_table()
+
+
+# -- Streaming Checksum --
+class Checksum(abc.ABC):
+    # Base class of every backend. Data can be fed in pieces with update(), result read with digest()
+    name = ""
+    width = 16
+
+    def __init__(self, data : Buffer = b""):
+        self.reset()
+        if data:
+            self.update(data)
+
+    @abc.abstractmethod
+    def reset(self):
+        pass
+
+    @abc.abstractmethod
+    def update(self, data : Buffer) -> "Checksum":
+        pass
+
+    @abc.abstractmethod
+    def digest(self) -> int:
+        pass
+
+    def digest16(self) -> int:
+        # Segment header only has 16 bit for checksum, fold wider checksum into it
+        value = self.digest()
+        if self.width == 32:
+            value = (value >> 16) ^ (value & 0xFFFF)
+        return value & 0xFFFF
+
+class CRC16Bitwise(Checksum):
+    # Original bit by bit implementation, kept as reference for benchmark
+    name = "crc16-bitwise"
+
+    def reset(self):
+        self.crc_val = CRC_START
+
+    def update(self, data : Buffer) -> "Checksum":
+        crc_val = self.crc_val
+        for byte in data:
+            target_byte = byte
+            for i in range(8):
+                crc_msb = (crc_val & 0x8000) >> 8
+                byte_msb = (target_byte & 0x80)
+                crc_val = (crc_val << 1) & 0xFFFF
+                if crc_msb ^ byte_msb:
+                    crc_val = crc_val ^ CRC_POLYNOM
+                target_byte = (target_byte << 1) & 0xFF
+        self.crc_val = crc_val
+        return self
+
+    def digest(self) -> int:
+        return self.crc_val & 0xFFFF
+
+class CRC16Table(Checksum):
+    # Pure python fallback, one table lookup per byte
+    name = "crc16-table"
+
+    def reset(self):
+        self.crc_val = CRC_START
+
+    def update(self, data : Buffer) -> "Checksum":
+        crc_val = self.crc_val
+        table = CRC16_TABLE
+        for byte in data:
+            crc_val = ((crc_val << 8) & 0xFFFF) ^ table[(crc_val >> 8) ^ byte]
+        self.crc_val = crc_val
+        return self
+
+    def digest(self) -> int:
+        return self.crc_val
+
+class CRC16Binascii(Checksum):
+    # binascii.crc_hqx is the same CRC-16/CCITT (0x1021, start 0xFFFF) written in C
+    name = "crc16"
+
+    def reset(self):
+        self.crc_val = CRC_START
+
+    def update(self, data : Buffer) -> "Checksum":
+        self.crc_val = binascii.crc_hqx(data, self.crc_val)
+        return self
+
+    def digest(self) -> int:
+        return self.crc_val
+
+class CRC32(Checksum):
+    # zlib CRC32 (IEEE), C implementation
+    name = "crc32"
+    width = 32
+
+    def reset(self):
+        self.crc_val = 0
+
+    def update(self, data : Buffer) -> "Checksum":
+        self.crc_val = zlib.crc32(data, self.crc_val)
+        return self
+
+    def digest(self) -> int:
+        return self.crc_val
+
+class CRC32CTable(Checksum):
+    # Pure python CRC32C, used when crc32c extension is not installed
+    name = "crc32c-table"
+    width = 32
+
+    def reset(self):
+        self.crc_val = 0xFFFFFFFF
+
+    def update(self, data : Buffer) -> "Checksum":
+        crc_val = self.crc_val
+        table = CRC32C_TABLE
+        for byte in data:
+            crc_val = (crc_val >> 8) ^ table[(crc_val ^ byte) & 0xFF]
+        self.crc_val = crc_val
+        return self
+
+    def digest(self) -> int:
+        return self.crc_val ^ 0xFFFFFFFF
+
+class CRC32CNative(Checksum):
+    # CRC32C from crc32c extension (hardware accelerated when CPU supports it)
+    name = "crc32c"
+    width = 32
+
+    def reset(self):
+        self.crc_val = 0
+
+    def update(self, data : Buffer) -> "Checksum":
+        self.crc_val = _crc32c.crc32c(data, self.crc_val)
+        return self
+
+    def digest(self) -> int:
+        return self.crc_val
+
+
+# -- Registry --
+# Every backend which can be benchmarked, slowest first
+BACKENDS = [CRC16Bitwise, CRC16Table, CRC16Binascii, CRC32, CRC32CTable]
+if _crc32c is not None:
+    BACKENDS.append(CRC32CNative)
+
+# Algorithm name on the wire -> fastest backend for it
+ALGORITHMS: Dict[str, Type[Checksum]] = {
+    CHECKSUM_CRC16: CRC16Binascii,
+    CHECKSUM_CRC32: CRC32,
+    CHECKSUM_CRC32C: CRC32CNative if _crc32c is not None else CRC32CTable,
+}
+
+def get_checksum(algorithm : str) -> Type[Checksum]:
+    # Get backend class for negotiated algorithm name
+    try:
+        return ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown checksum algorithm {algorithm}")
+
+def calculate_checksum(data : Buffer, algorithm : str = CHECKSUM_CRC16) -> int:
+    # One shot checksum for segment header
+    return get_checksum(algorithm)(data).digest16()
+
+
+# Benchmark
+# Run with: python -m lib.checksum
+if __name__ == "__main__":
+    import time
+    from .constant import PAYLOAD_SIZE
+
+    payload = bytes(range(256)) * (PAYLOAD_SIZE // 256)
+    view = memoryview(payload)
+    for backend in BACKENDS:
+        # Slow backends get fewer rounds so benchmark finishes quickly
+        rounds = 3 if backend in (CRC16Bitwise, CRC16Table, CRC32CTable) else 2000
+
+        start = time.perf_counter()
+        for i in range(rounds):
+            checksum = backend()
+            checksum.update(view[:PAYLOAD_SIZE // 2])
+            checksum.update(view[PAYLOAD_SIZE // 2:])
+            checksum.digest16()
+        elapsed = time.perf_counter() - start
+
+        throughput = (len(payload) * rounds) / elapsed / (1024 * 1024)
+        print(f"{backend.name:16}| {throughput:10.2f} MB/s")
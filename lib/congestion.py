@@ -0,0 +1,159 @@
+import time
+from typing import Dict, Optional, Type
+
+from .constant import WINDOW_SIZE, INITIAL_WINDOW, INITIAL_SSTHRESH, MAX_WINDOW, DUPLICATE_ACK_THRESHOLD, CUBIC_C, CUBIC_BETA, CONGESTION_FIXED, CONGESTION_AIMD, CONGESTION_CUBIC
+
+class CongestionControl:
+    # Sender window (in segments) which grows on ACK and shrinks on loss. Base class is slow start + AIMD (Reno)
+    name = CONGESTION_AIMD
+
+    def __init__(self, receive_window : Optional[int] = None, initial_window : int = INITIAL_WINDOW, duplicate_threshold : int = DUPLICATE_ACK_THRESHOLD):
+        # receive_window is limit advertised by client at handshake, None when client doesn't advertise.
+        # duplicate_threshold duplicate ACKs trigger fast retransmit, 0 disables it
+        self.receive_window = receive_window
+        self.cwnd = float(initial_window)
+        self.ssthresh = float(INITIAL_SSTHRESH)
+        self.duplicate_acks = 0
+        self.duplicate_threshold = duplicate_threshold
+
+        # Statistic. Fast retransmit is recovered when retransmitted segment is acknowledged before timer expires
+        self.peak_window = self.get_window()
+        self.fast_retransmits = 0
+        self.fast_recoveries = 0
+        self.timeouts = 0
+
+    def get_limit(self) -> int:
+        if self.receive_window is None:
+            return MAX_WINDOW
+        return max(1, min(self.receive_window, MAX_WINDOW))
+
+    def get_window(self) -> int:
+        # Segments allowed in flight right now
+        return max(1, min(int(self.cwnd), self.get_limit()))
+
+    def set_window(self, cwnd : float):
+        # Window never grows past what receiver can take, so it doesn't overshoot when limited by receiver
+        self.cwnd = min(max(cwnd, 1.0), float(self.get_limit()))
+        self.peak_window = max(self.peak_window, self.get_window())
+
+    # -- Events --
+    def on_ack(self, acked : int = 1, now : float = None, advanced : bool = True):
+        # acked new segments are acknowledged. Selective ACK which doesn't move base (advanced False) keeps duplicate count
+        if advanced:
+            self.duplicate_acks = 0
+        if self.cwnd < self.ssthresh:
+            # Slow start, one segment per acknowledged segment
+            self.set_window(self.cwnd + acked)
+        else:
+            self.congestion_avoidance(acked, time.monotonic() if now is None else now)
+
+    def on_duplicate_ack(self) -> bool:
+        # ACK which doesn't move the window. Return True once when threshold is reached, sender should fast retransmit
+        self.duplicate_acks += 1
+        return self.duplicate_acks == self.duplicate_threshold
+
+    def on_fast_retransmit(self, now : float = None):
+        # Missing segment is resent without waiting for timer, window is reduced once for this loss
+        self.fast_retransmits += 1
+        self.on_loss(time.monotonic() if now is None else now)
+
+    def on_recovery(self):
+        self.fast_recoveries += 1
+
+    def on_timeout(self):
+        # Retransmission timer expired, nothing is known about the pipe anymore. Restart from slow start
+        self.timeouts += 1
+        self.duplicate_acks = 0
+        self.ssthresh = max(self.get_window() / 2, 2.0)
+        self.set_window(1.0)
+
+    # -- Policy --
+    def congestion_avoidance(self, acked : int, now : float):
+        # Additive increase, about one segment per window
+        self.set_window(self.cwnd + acked / self.cwnd)
+
+    def on_loss(self, now : float):
+        # Multiplicative decrease
+        self.ssthresh = max(self.get_window() / 2, 2.0)
+        self.set_window(self.ssthresh)
+
+    def __str__(self):
+        limit = "-" if self.receive_window is None else self.receive_window
+        return f"{self.name} window: {self.get_window()}, cwnd: {self.cwnd:.2f}, ssthresh: {self.ssthresh:.1f}, receive window: {limit}, peak: {self.peak_window}, fast retransmits: {self.fast_retransmits} (recovered: {self.fast_recoveries}), timeouts: {self.timeouts}"
+
+class FixedWindow(CongestionControl):
+    # Static WINDOW_SIZE window of previous version, doesn't react to anything
+    name = CONGESTION_FIXED
+
+    def __init__(self, receive_window : Optional[int] = None, initial_window : int = WINDOW_SIZE, duplicate_threshold : int = DUPLICATE_ACK_THRESHOLD):
+        super().__init__(receive_window, initial_window, duplicate_threshold)
+
+    def on_ack(self, acked : int = 1, now : float = None, advanced : bool = True):
+        if advanced:
+            self.duplicate_acks = 0
+
+    def on_loss(self, now : float):
+        pass
+
+    def on_timeout(self):
+        self.timeouts += 1
+        self.duplicate_acks = 0
+
+class Cubic(CongestionControl):
+    # Window grows as cubic function of time since last loss, centered on window size where loss happened
+    name = CONGESTION_CUBIC
+
+    def __init__(self, receive_window : Optional[int] = None, initial_window : int = INITIAL_WINDOW, duplicate_threshold : int = DUPLICATE_ACK_THRESHOLD):
+        super().__init__(receive_window, initial_window, duplicate_threshold)
+        self.window_max = 0.0
+        self.epoch_start : Optional[float] = None
+        self.epoch_origin = 0.0
+        self.reno_window = 0.0
+
+    def congestion_avoidance(self, acked : int, now : float):
+        if self.epoch_start is None:
+            # First ACK after loss (or after slow start) starts new growth epoch
+            self.epoch_start = now
+            self.epoch_origin = max(self.window_max, self.cwnd)
+            self.reno_window = self.cwnd
+        elapsed = now - self.epoch_start
+        k = (self.epoch_origin * (1 - CUBIC_BETA) / CUBIC_C) ** (1 / 3)
+        target = CUBIC_C * (elapsed - k) ** 3 + self.epoch_origin
+
+        # TCP friendly region, never slower than Reno with the same decrease factor
+        self.reno_window += 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * acked / self.cwnd
+        if target > self.cwnd:
+            cwnd = self.cwnd + (target - self.cwnd) / self.cwnd * acked
+        else:
+            cwnd = self.cwnd + 0.01 * acked / self.cwnd
+        self.set_window(max(cwnd, self.reno_window))
+
+    def on_loss(self, now : float):
+        # Fast convergence, release bandwidth when loss comes before previous maximum is reached
+        window = float(self.get_window())
+        if window < self.window_max:
+            self.window_max = window * (1 + CUBIC_BETA) / 2
+        else:
+            self.window_max = window
+        self.ssthresh = max(window * CUBIC_BETA, 2.0)
+        self.set_window(self.ssthresh)
+        self.epoch_start = None
+
+    def on_timeout(self):
+        self.window_max = float(self.get_window())
+        self.epoch_start = None
+        super().on_timeout()
+
+CONTROLLERS: Dict[str, Type[CongestionControl]] = {
+    FixedWindow.name: FixedWindow,
+    CongestionControl.name: CongestionControl,
+    Cubic.name: Cubic,
+}
+
+def get_congestion_control(name : str, receive_window : Optional[int] = None, duplicate_threshold : int = DUPLICATE_ACK_THRESHOLD, initial_window : Optional[int] = None) -> CongestionControl:
+    # New controller for single transfer, initial_window None keeps default of controller
+    if name not in CONTROLLERS:
+        raise ValueError(f"Unknown congestion control {name}")
+    if initial_window is None:
+        return CONTROLLERS[name](receive_window, duplicate_threshold=duplicate_threshold)
+    return CONTROLLERS[name](receive_window, initial_window, duplicate_threshold=duplicate_threshold)
@@ -1,12 +1,35 @@
+import sys
+import errno
+import select
 import socket
+import struct
+import threading
 import logging
 import colorlog
-from typing import Tuple
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from . import mmsg
 from .segment import Segment
-from .constant import DEFAULT_BROADCAST_PORT, DEFAULT_IP, DEFAULT_PORT, SEGMENT_SIZE, TIMEOUT
+from .bufferpool import BufferPool
+from .constant import DEFAULT_BROADCAST_PORT, DEFAULT_IP, DEFAULT_PORT, SEGMENT_SIZE, TIMEOUT, RECV_POOL_SIZE, RECV_BATCH_SIZE, MULTICAST_TTL
+
+# UDP generic segmentation offload (linux/udp.h), not exported by socket module
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_MAX_SEGMENTS = 64
+UDP_MAX_PAYLOAD = 65507
+
+# Refusal of GSO itself (no kernel or driver support). Anything else, e.g. ENOBUFS of full queue, is retried
+GSO_UNSUPPORTED = {errno.EINVAL, errno.EOPNOTSUPP, errno.EIO}
+TRANSIENT_ERRORS = {errno.ENOBUFS, errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR}
+SEND_RETRIES = 3
+
+# Path MTU discovery mode (linux/in.h). PROBE sets DF bit and ignores cached path MTU, so oversized datagram is dropped
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_PROBE = getattr(socket, "IP_PMTUDISC_PROBE", 3)
 
 class Connection:
-    def __init__(self, ip : str = DEFAULT_IP, broadcast_port : int = DEFAULT_BROADCAST_PORT, port : int = DEFAULT_PORT, is_server : bool = False):
+    def __init__(self, ip : str = DEFAULT_IP, broadcast_port : int = DEFAULT_BROADCAST_PORT, port : int = DEFAULT_PORT, is_server : bool = False, reuse_port : bool = False):
         # Logger
         self.logger = self.setup_logger()
 
@@ -17,6 +40,9 @@ class Connection:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             # Source : https://docs.python.org/3/library/socket.html
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                # Worker of multi-process server, kernel spreads clients over every socket bound to this port
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.socket.bind((ip, broadcast_port))
             self.logger.info(f"[!] Server started at {self.ip}:{self.port}")
         else:
@@ -27,6 +53,28 @@ class Connection:
             self.socket.bind((ip, port))
             self.logger.info(f"[!] Client started at {self.ip}:{self.port}")
 
+        # Current socket timeout, settimeout is only called when it changes
+        self.timeout = None
+
+        # Largest datagram expected, and receive buffers of that size reused across datagrams
+        self.segment_size = SEGMENT_SIZE
+        self.pool = BufferPool(RECV_POOL_SIZE, SEGMENT_SIZE)
+
+        # Probe changes DF mode of whole socket for a moment, other client thread must not send meanwhile
+        self.send_lock = threading.Lock()
+        self.mtu_discovery = sys.platform.startswith("linux")
+
+        # Send window with single sendmsg, disabled when kernel refuses GSO. Frames too large to share GSO buffer
+        # (default segment size) go with sendmmsg instead, disabled the same way
+        self.gso = sys.platform.startswith("linux") and hasattr(self.socket, "sendmsg")
+        self.mmsg = sys.platform.startswith("linux") and mmsg.available()
+
+        # Datagrams drained by recvmmsg after the one waited for, handed out before socket is read again
+        self.pending: Deque[Tuple[memoryview, Tuple[str, int], bytearray]] = deque()
+
+        # Client socket bound to multicast group port, read together with own socket
+        self.group_socket : Optional[socket.socket] = None
+
     def setup_logger(self):
         # Set up logging configuration
         logger = logging.getLogger(__name__)
@@ -54,18 +102,206 @@ class Connection:
     
     def send_data(self, msg: Segment, dest: Tuple[str, int]):
         # Send single segment into destination
-        self.socket.sendto(msg, dest)
+        with self.send_lock:
+            self.socket.sendto(msg, dest)
 
-    def listen_single_segment(self, timeout=TIMEOUT) -> Segment:
-        # Listen single UDP datagram within timeout and convert into segment
+    def send_batch(self, frames: List[bytes], dest: Tuple[str, int]) -> int:
+        # Send many datagrams into one destination with as few syscalls as possible, return number of datagram sent
+        with self.send_lock:
+            return self._send_batch(frames, dest)
+
+    def send_probe(self, frame: bytes, dest: Tuple[str, int]) -> bool:
+        # Send path MTU probe with DF bit, never fragmented. Return False when it doesn't fit local link (EMSGSIZE).
+        # Other error is raised, caller treats it as lost probe
+        with self.send_lock:
+            previous = self.socket.getsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER)
+            self.socket.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+            try:
+                self.socket.sendto(frame, dest)
+            except OSError as e:
+                if e.errno == errno.EMSGSIZE:
+                    return False
+                raise
+            finally:
+                self.socket.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, previous)
+        return True
+
+    def _send_batch(self, frames: List[bytes], dest: Tuple[str, int]) -> int:
+        sent = 0
+        retries = 0
+        while sent < len(frames):
+            end = self.get_gso_group(frames, sent) if self.gso else sent + 1
+            gso = end - sent > 1
+            if not gso and self.mmsg:
+                end = self.get_mmsg_group(frames, sent)
+            try:
+                if end - sent == 1:
+                    self.socket.sendto(frames[sent], dest)
+                elif gso:
+                    # Kernel split buffer into datagrams of gso size, last one may be shorter
+                    gso_size = struct.pack("H", len(frames[sent]))
+                    self.socket.sendmsg(frames[sent:end], [(SOL_UDP, UDP_SEGMENT, gso_size)], 0, dest)
+                else:
+                    # Kernel may take only part of the group, the rest goes in next round
+                    end = sent + mmsg.sendmmsg(self.socket, frames[sent:end], dest)
+            except OSError as e:
+                if end - sent > 1 and e.errno in TRANSIENT_ERRORS and retries < SEND_RETRIES:
+                    retries += 1
+                    continue
+                if end - sent > 1 and e.errno not in TRANSIENT_ERRORS:
+                    self.disable_batch(gso, e)
+                    continue
+                if end - sent == 1:
+                    raise
+                # Queue still full after retries, rest of group goes per datagram with batching kept on
+                for frame in frames[sent:end]:
+                    self.socket.sendto(frame, dest)
+            retries = 0
+            sent = end
+        return sent
+
+    def disable_batch(self, gso: bool, error: OSError):
+        # Kernel refused the way this group was sent, that way is off for the rest of the connection
+        if gso:
+            if error.errno in GSO_UNSUPPORTED:
+                self.gso = False
+                self.logger.warning(f"[!] UDP segmentation offload unavailable ({error}). Sending per datagram")
+                return
+        elif self.mmsg:
+            self.mmsg = False
+            self.logger.warning(f"[!] sendmmsg unavailable ({error}). Sending per datagram")
+            return
+        raise error
+
+    def get_gso_group(self, frames: List[bytes], start: int) -> int:
+        # Longest run from start which kernel accepts as one GSO send: same size frames, last one not bigger
+        gso_size = len(frames[start])
+        total = gso_size
+        end = start + 1
+        while end < len(frames) and end - start < UDP_MAX_SEGMENTS:
+            size = len(frames[end])
+            if size > gso_size or total + size > UDP_MAX_PAYLOAD:
+                break
+            total += size
+            end += 1
+            if size < gso_size:
+                break
+        return end
+
+    def get_mmsg_group(self, frames: List[bytes], start: int) -> int:
+        # Run from start of frames which can't share one GSO buffer, sent with single sendmmsg
+        end = start + 1
+        while end < len(frames) and end - start < mmsg.MMSG_MAX and (not self.gso or len(frames[end]) * 2 > UDP_MAX_PAYLOAD):
+            end += 1
+        return end
+
+    def set_receive_buffer(self, size: int) -> int:
+        # Ask kernel for bigger receive buffer, return size actually granted (capped by net.core.rmem_max)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        except OSError as e:
+            self.logger.warning(f"[!] Unable to set receive buffer ({e})")
+        return self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def set_multicast(self, ttl: int = MULTICAST_TTL):
+        # Server side of one-to-many transfer, group datagram leaves through interface of this address and loops back to local member
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.ip))
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    def join_group(self, group: Tuple[str, int]) -> bool:
+        # Client side of one-to-many transfer. Every member on this host binds group port, so address is reused.
+        # Return False when group can't be joined, server sends unicast copy instead
+        if self.group_socket is not None:
+            return True
+        group_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
+            group_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            group_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2)
+            group_socket.bind(("", group[1]))
+            group_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group[0]) + socket.inet_aton(self.ip))
+        except OSError as e:
+            self.logger.warning(f"[!] Unable to join multicast group {group[0]}:{group[1]} ({e})")
+            group_socket.close()
+            return False
+        self.group_socket = group_socket
+        return True
+
+    def select_socket(self, timeout) -> socket.socket:
+        # Socket which has datagram queued. Group socket goes first, so poll sent after a round never overtakes its segments.
+        # Raise socket.timeout when none within timeout
+        ready, _, _ = select.select([self.group_socket, self.socket], [], [], timeout)
+        if not ready:
+            raise socket.timeout("timed out")
+        return ready[0]
+
+    def set_segment_size(self, size: int):
+        # Negotiated segment size, receive buffers shrink to fit it
+        if size != self.segment_size:
+            self.segment_size = size
+            self.pool = BufferPool(RECV_POOL_SIZE, size)
+
+    def set_timeout(self, timeout):
+        # settimeout is a syscall, skip it when nothing changes
+        if timeout != self.timeout:
             self.socket.settimeout(timeout)
-            return self.socket.recvfrom(SEGMENT_SIZE)
+            self.timeout = timeout
+
+    def listen_single_segment(self, timeout=TIMEOUT) -> Segment:
+        # Listen single UDP datagram within timeout and convert into segment. Datagram already drained comes first
+        if self.pending:
+            data, address, buffer = self.pending.popleft()
+            data = bytes(data)
+            self.release_buffer(buffer)
+            return data, address
+        try:
+            self.set_timeout(timeout)
+            return self.socket.recvfrom(self.segment_size)
         except TimeoutError as e:
             raise e
 
+    def listen_pooled_segment(self, timeout=TIMEOUT) -> Tuple[memoryview, Tuple[str, int], bytearray]:
+        # Listen single UDP datagram into pooled buffer, no allocation per datagram.
+        # Returned view is only valid until release_buffer(buffer) is called
+        if self.pending:
+            return self.pending.popleft()
+        self.set_timeout(timeout)
+        sock = self.socket if self.group_socket is None else self.select_socket(timeout)
+        buffer = self.pool.acquire()
+        try:
+            size, address = sock.recvfrom_into(buffer)
+        except BaseException:
+            self.pool.release(buffer)
+            raise
+        if self.mmsg and self.group_socket is None:
+            self.drain()
+        return memoryview(buffer)[:size], address, buffer
+
+    def drain(self):
+        # Whatever else is queued (window of ACKs or segments) is read with one non-blocking recvmmsg into free pooled
+        # buffers, next calls are served without syscall. Unused buffers go straight back
+        buffers = [self.pool.acquire() for _ in range(min(RECV_BATCH_SIZE, len(self.pool.free)))]
+        received = []
+        try:
+            received = mmsg.recvmmsg(self.socket, buffers)
+        except OSError as e:
+            self.mmsg = False
+            self.logger.warning(f"[!] recvmmsg unavailable ({e}). Receiving per datagram")
+        for buffer, (size, address) in zip(buffers, received):
+            self.pending.append((memoryview(buffer)[:size], address, buffer))
+        for buffer in buffers[len(received):]:
+            self.pool.release(buffer)
+
+    def release_buffer(self, buffer: bytearray):
+        # Return buffer from listen_pooled_segment into pool
+        if buffer is not None:
+            self.pool.release(buffer)
+
     def close_socket(self):
-        # Release UDP socket
+        # Release UDP socket, leaving multicast group too
+        if self.group_socket is not None:
+            self.group_socket.close()
+            self.group_socket = None
         self.socket.close()
         
     def __str__(self):
@@ -11,12 +11,151 @@ DEFAULT_PORT = 8000
 DEFAULT_BROADCAST_PORT = 9999
 WINDOW_SIZE = 3
 
-# Segment constant
+# Segment constant. SEGMENT_SIZE is largest datagram (header included) and default segment size offered at handshake
 SEGMENT_SIZE = 32768
 PAYLOAD_SIZE = SEGMENT_SIZE - 12
+MIN_SEGMENT_SIZE = 1200
 TIMEOUT = 5
 TIMEOUT_LISTEN = 30
+TIMEOUT_PARALLEL = 15
+RECV_POOL_SIZE = 16
+RECV_BATCH_SIZE = 8
+
+# Retransmission timeout constant (RFC 6298, in seconds)
+RTO_INITIAL = 1.0
+RTO_MIN = 0.2
+RTO_MAX = 60.0
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+RTO_K = 4
+CLOCK_GRANULARITY = 0.001
+
+# ARQ constant
+ARQ_GO_BACK_N = "gbn"
+ARQ_SELECTIVE_REPEAT = "sr"
+ARQ_MODES = [ARQ_GO_BACK_N, ARQ_SELECTIVE_REPEAT]
+DEFAULT_ARQ = ARQ_GO_BACK_N
+REORDER_BUFFER_SIZE = 64
+
+# ACK policy constant
+ACK_IMMEDIATE = "immediate"
+ACK_DELAYED = "delayed"
+ACK_POLICIES = [ACK_IMMEDIATE, ACK_DELAYED]
+DEFAULT_ACK_POLICY = ACK_IMMEDIATE
+DELAYED_ACK_COUNT = 2
+DELAYED_ACK_TIMEOUT = 0.04
+ACK_FRAME_CACHE_SIZE = 256
+
+# Path MTU probing constant (RFC 8899). Candidates are datagram size of common link MTU without IPv4 and UDP header
+# (jumbo, FDDI, Ethernet, PPPoE, IPv6 minimum), largest first. MIN_SEGMENT_SIZE is the base size assumed to always work
+PMTU_PROBE_ON = "on"
+PMTU_PROBE_OFF = "off"
+PMTU_PROBE_MODES = [PMTU_PROBE_ON, PMTU_PROBE_OFF]
+PMTU_CANDIDATES = [9000 - 28, 4352 - 28, 1500 - 28, 1492 - 28, 1280 - 28]
+PMTU_MAX_PROBES = 3
+
+# Selective ACK constant. Blocks travel in header extension, byte 9 of header is
+# extension version (high nibble, 0 for plain header) and number of blocks (low nibble)
+SACK_ON = "on"
+SACK_OFF = "off"
+SACK_MODES = [SACK_ON, SACK_OFF]
+DEFAULT_SACK = SACK_OFF
+EXTENSION_NONE = 0
+EXTENSION_SACK = 1
+EXTENSION_PROBE = 2
+EXTENSION_NAK = 3
+EXTENSION_REPAIR = 4
+MAX_SACK_BLOCKS = 4
+
+# Per-segment error correcting code offered at handshake. Hamming SECDED encodes every nibble of data segment payload
+# into one byte, so payload carries half as much file data. NumPy path is used from HAMMING_NUMPY_THRESHOLD bytes
+ECC_NONE = "none"
+ECC_HAMMING = "hamming"
+ECC_MODES = [ECC_NONE, ECC_HAMMING]
+DEFAULT_ECC = ECC_NONE
+HAMMING_NUMPY_THRESHOLD = 4096
+
+# Packet-level forward error correction offered at handshake. Every block of FEC_BLOCK_SIZE data segments gets repair
+# segments (XOR parity is one, Reed-Solomon FEC_REPAIR_COUNT), so lost data segment is rebuilt without retransmission.
+# Repair carries payload length, data segment payload is FEC_LENGTH_SIZE bytes shorter so repair fits segment size
+FEC_NONE = "none"
+FEC_XOR = "xor"
+FEC_RS = "rs"
+FEC_MODES = [FEC_NONE, FEC_XOR, FEC_RS]
+DEFAULT_FEC = FEC_NONE
+FEC_BLOCK_SIZE = 8
+FEC_REPAIR_COUNT = 2
+FEC_LENGTH_SIZE = 2
+
+# One-to-many transfer constant. Every segment goes once per round to IP multicast group, or as unicast copy to member
+# which can't join it. Server polls members after every round, member answers with NAK blocks of missing ranges
+MULTICAST_ON = "on"
+MULTICAST_OFF = "off"
+MULTICAST_MODES = [MULTICAST_ON, MULTICAST_OFF]
+MULTICAST_GROUP = "group"
+MULTICAST_UNICAST = "unicast"
+MULTICAST_TTL = 1
+MULTICAST_MAX_POLLS = 5
+MAX_NAK_BLOCKS = 15
+
+# Congestion control constant (window in segments)
+CONGESTION_FIXED = "fixed"
+CONGESTION_AIMD = "aimd"
+CONGESTION_CUBIC = "cubic"
+CONGESTION_CONTROLS = [CONGESTION_FIXED, CONGESTION_AIMD, CONGESTION_CUBIC]
+DEFAULT_CONGESTION = CONGESTION_AIMD
+INITIAL_WINDOW = WINDOW_SIZE
+INITIAL_SSTHRESH = 64
+MAX_WINDOW = 1024
+DUPLICATE_ACK_THRESHOLD = 3
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+# Client receive buffer requested from kernel, bounds receive window advertised at handshake
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Client output file durability. none leaves writeback to kernel, interval syncs in background every
+# FSYNC_INTERVAL_BYTES written, close syncs once before transfer is reported successful
+FSYNC_NONE = "none"
+FSYNC_INTERVAL = "interval"
+FSYNC_CLOSE = "close"
+FSYNC_POLICIES = [FSYNC_NONE, FSYNC_INTERVAL, FSYNC_CLOSE]
+FSYNC_INTERVAL_BYTES = 16 * 1024 * 1024
+
+# Output which ends short of file size in metadata is kept under this suffix, never under its own name
+INCOMPLETE_SUFFIX = ".part"
+
+# Parallel server constant
+ENGINE_THREAD = "thread"
+ENGINE_ASYNCIO = "asyncio"
+SERVER_ENGINES = [ENGINE_THREAD, ENGINE_ASYNCIO]
+CLIENT_QUEUE_SIZE = 64
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_POLICIES = [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST]
+
+# Multi-process server constant, worker processes sharing broadcast port
+DEFAULT_WORKERS = 1
+
+# Event trace constant, ring buffer holds last TRACE_SIZE events (24 bytes each)
+TRACE_SIZE = 64 * 1024
+
+# Metrics constant, prefix of every metric name and histogram bucket upper bounds (in seconds)
+METRICS_PREFIX = "tcp_over_udp"
+RTT_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+HANDSHAKE_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0]
+
+# Frame cache constant (in bytes, 0 means unlimited)
+FRAME_CACHE_SIZE = 64 * 1024 * 1024
 
 # CRC constant
 CRC_POLYNOM = 0x1021
-CRC_START = 0xFFFF
\ No newline at end of file
+CRC_START = 0xFFFF
+CRC32C_POLYNOM = 0x82F63B78
+
+# Checksum constant
+CHECKSUM_CRC16 = "crc16"
+CHECKSUM_CRC32 = "crc32"
+CHECKSUM_CRC32C = "crc32c"
+CHECKSUM_ALGORITHMS = [CHECKSUM_CRC16, CHECKSUM_CRC32, CHECKSUM_CRC32C]
+DEFAULT_CHECKSUM = CHECKSUM_CRC16
\ No newline at end of file
@@ -0,0 +1,97 @@
+import socket
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+from .constant import CLIENT_QUEUE_SIZE, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST
+
+class ClientInbox:
+    def __init__(self, capacity : int, policy : str):
+        # Bounded datagram queue of single client, waiting worker is woken by condition
+        self.items = deque()
+        self.capacity = capacity
+        self.policy = policy
+        self.condition = threading.Condition()
+
+        # Statistic
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, data : bytes) -> bool:
+        # Called by listener thread, return False when datagram is dropped
+        with self.condition:
+            self.received += 1
+            if len(self.items) >= self.capacity:
+                self.dropped += 1
+                if self.policy == OVERFLOW_DROP_NEWEST:
+                    return False
+                self.items.popleft()
+            self.items.append(data)
+            self.condition.notify()
+            return True
+
+    def get(self, timeout : float) -> bytes:
+        # Called by worker thread, block until datagram arrive or raise socket.timeout
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                raise socket.timeout
+            return self.items.popleft()
+
+class Demultiplexer:
+    def __init__(self, capacity : int = CLIENT_QUEUE_SIZE, policy : str = OVERFLOW_DROP_OLDEST):
+        # Route datagrams of broadcast socket into inbox of each client
+        if policy not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            raise ValueError(f"Unknown overflow policy {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.inboxes: Dict[Tuple[str, int], ClientInbox] = {}
+        self.lock = threading.Lock()
+
+        # Statistic of datagram without registered client, and of already unregistered clients
+        self.unrouted = 0
+        self.retired_received = 0
+        self.retired_dropped = 0
+
+    def __contains__(self, address : Tuple[str, int]) -> bool:
+        return address in self.inboxes
+
+    def register(self, address : Tuple[str, int]):
+        with self.lock:
+            self.inboxes[address] = ClientInbox(self.capacity, self.policy)
+
+    def unregister(self, address : Tuple[str, int]) -> ClientInbox:
+        with self.lock:
+            inbox = self.inboxes.pop(address, None)
+            if inbox is not None:
+                self.retired_received += inbox.received
+                self.retired_dropped += inbox.dropped
+            return inbox
+
+    def dispatch(self, data : bytes, address : Tuple[str, int]) -> bool:
+        # Put datagram into client inbox, False when client unknown or inbox overflow
+        inbox = self.inboxes.get(address)
+        if inbox is None:
+            self.unrouted += 1
+            return False
+        return inbox.put(data)
+
+    def get(self, address : Tuple[str, int], timeout : float) -> bytes:
+        # Blocking receive for client worker
+        inbox = self.inboxes.get(address)
+        if inbox is None:
+            raise socket.timeout
+        return inbox.get(timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            inboxes = list(self.inboxes.values())
+        return {
+            "clients": len(inboxes),
+            "queued": sum(len(inbox.items) for inbox in inboxes),
+            "received": self.retired_received + sum(inbox.received for inbox in inboxes),
+            "dropped": self.retired_dropped + sum(inbox.dropped for inbox in inboxes),
+            "unrouted": self.unrouted,
+        }
+
+    def __str__(self):
+        return ", ".join(f"{key}: {value}" for key, value in self.get_stats().items())
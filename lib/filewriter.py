@@ -0,0 +1,101 @@
+import os
+import mmap
+import threading
+from typing import Optional
+
+from .constant import FSYNC_NONE, FSYNC_INTERVAL, FSYNC_INTERVAL_BYTES
+
+class FileWriter:
+    def __init__(self, path : str, durability : str = FSYNC_NONE, interval : int = FSYNC_INTERVAL_BYTES):
+        # Output file written by position, so out-of-order payload lands where it belongs instead of waiting in memory.
+        # Once size is known (metadata segment) file is preallocated and memory mapped, write is a copy into page cache
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.size : Optional[int] = None
+        self.end = 0    # Highest offset written, file size when metadata is lost
+        self.mmap : Optional[mmap.mmap] = None
+        self.durability = durability
+
+        # Interval policy: writes only count bytes, fdatasync runs in background thread so receiving never waits for disk
+        self.interval = interval
+        self.unsynced = 0
+        self.sync_event = threading.Event()
+        self.closed = False
+        self.syncer : Optional[threading.Thread] = None
+        if durability == FSYNC_INTERVAL:
+            self.syncer = threading.Thread(target=self.run_syncer, daemon=True)
+            self.syncer.start()
+
+        # Statistic
+        self.written = 0
+        self.mapped_writes = 0
+        self.positional_writes = 0
+        self.syncs = 0
+
+    def allocate(self, size : int):
+        # Reserve blocks of whole file up front (no fragmentation, ENOSPC now rather than mid transfer).
+        # File system without fallocate support still gets its size from ftruncate
+        if self.size is not None or size < 0:
+            return
+        if size > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, size)
+            except OSError:
+                pass
+        os.ftruncate(self.fd, size)
+        self.size = size
+
+        # Empty file can't be memory mapped
+        if size > 0:
+            self.mmap = mmap.mmap(self.fd, size, access=mmap.ACCESS_WRITE)
+
+    def write_at(self, offset : int, data):
+        # Payload may be view of pooled receive buffer, it is copied before buffer is given back.
+        # Write before size is known, or past it, falls back to pwrite
+        end = offset + len(data)
+        if self.mmap is not None and end <= self.size:
+            self.mmap[offset:end] = data
+            self.mapped_writes += 1
+        else:
+            os.pwrite(self.fd, data, offset)
+            self.positional_writes += 1
+        self.written += len(data)
+        self.end = max(self.end, end)
+
+        self.unsynced += len(data)
+        if self.syncer is not None and self.unsynced >= self.interval:
+            self.unsynced = 0
+            self.sync_event.set()
+
+    def run_syncer(self):
+        # Dirty pages of shared mapping are written back by fdatasync of the file as well
+        while True:
+            self.sync_event.wait()
+            self.sync_event.clear()
+            if self.closed:
+                return
+            os.fdatasync(self.fd)
+            self.syncs += 1
+
+    def close(self, length : Optional[int] = None):
+        # length is the in-order part of file, preallocated tail of unfinished transfer is cut off.
+        # Sync policy other than none makes sure file is on disk before returning
+        if self.closed:
+            return
+        self.closed = True
+        if self.syncer is not None:
+            self.sync_event.set()
+            self.syncer.join()
+        if self.mmap is not None:
+            if self.durability != FSYNC_NONE:
+                self.mmap.flush()
+            self.mmap.close()
+            self.mmap = None
+        if length is not None and (self.size is None or length < self.size):
+            os.ftruncate(self.fd, length)
+        if self.durability != FSYNC_NONE:
+            os.fsync(self.fd)
+            self.syncs += 1
+        os.close(self.fd)
+
+    def __str__(self):
+        return f"size: {self.size}, written: {self.written}, mapped: {self.mapped_writes}, positional: {self.positional_writes}, durability: {self.durability}, syncs: {self.syncs}"
@@ -0,0 +1,115 @@
+import mmap
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Tuple
+
+from .segment import Segment
+
+class FrameCache:
+    def __init__(self, segments : Sequence[Segment], max_bytes : int = 0, encoder : Optional[Callable[[bytes], bytes]] = None):
+        # File segments never change after breakdown, so every wire frame only needs to be encoded once.
+        # max_bytes = 0 means no limit, otherwise least recently used frame is evicted over budget.
+        # encoder transforms every frame after checksum, e.g. error correcting code of payload
+        self.segments = segments
+        self.max_bytes = max_bytes
+        self.encoder = encoder
+        self.frames: "OrderedDict[Tuple[int, str], bytes]" = OrderedDict()
+        self.size = 0
+
+        # Shared by every client thread in parallel mode
+        self.lock = threading.Lock()
+
+        # Statistic
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_frame(self, index : int, checksum_algorithm : str) -> bytes:
+        # Frame of segment index, encoded with client checksum algorithm
+        key = (index, checksum_algorithm)
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.hits += 1
+                if self.max_bytes:
+                    self.frames.move_to_end(key)
+                return frame
+            self.misses += 1
+
+        # Encode outside lock, another thread may do the same frame but result is identical
+        frame = bytes(self.segments[index].get_bytes(checksum_algorithm))
+        if self.encoder is not None:
+            frame = self.encoder(frame)
+
+        with self.lock:
+            if key not in self.frames:
+                self.frames[key] = frame
+                self.size += len(frame)
+                self.evict()
+        return frame
+
+    def evict(self):
+        # Drop least recently used frames until cache fits budget, newest frame is always kept
+        if not self.max_bytes:
+            return
+        while self.size > self.max_bytes and len(self.frames) > 1:
+            key, frame = self.frames.popitem(last=False)
+            self.size -= len(frame)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __str__(self):
+        return f"frames: {len(self.frames)}, size: {self.size} bytes, hits: {self.hits}, misses: {self.misses}, evictions: {self.evictions}"
+
+class SharedFrameCache(FrameCache):
+    def __init__(self, segments : Sequence[Segment], segment_size : int, checksum_algorithm : str, max_bytes : int = 0):
+        # Frames of one checksum algorithm live in anonymous shared mapping created before workers fork, so every worker
+        # reads and fills the same copy. Every segment has slot of segment_size bytes, and its frame length (0 until
+        # encoded) in table in front of the slots. Frame of other algorithm goes to private cache of this worker
+        # Shared mapping is never evicted, so it is only made when it fits max_bytes (see fits())
+        super().__init__(segments, max_bytes)
+        self.checksum_algorithm = checksum_algorithm
+        self.slot_size = segment_size
+        self.offset = len(segments) * 4
+        self.memory = mmap.mmap(-1, max(self.get_size(segments, segment_size), 1))
+        self.lengths = memoryview(self.memory)[:self.offset].cast("I")
+        self.view = memoryview(self.memory)
+
+        # Statistic of this worker
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    @staticmethod
+    def get_size(segments : Sequence[Segment], segment_size : int) -> int:
+        # Length table and one slot per segment
+        return len(segments) * (4 + segment_size)
+
+    @classmethod
+    def fits(cls, segments : Sequence[Segment], segment_size : int, max_bytes : int) -> bool:
+        # Whole file fits cache budget (0 means no limit). Otherwise every worker keeps its own bounded FrameCache
+        return not max_bytes or cls.get_size(segments, segment_size) <= max_bytes
+
+    def get_frame(self, index : int, checksum_algorithm : str) -> bytes:
+        # View into shared slot. Length is written after frame, so other worker never sees half encoded frame.
+        # Two workers may encode the same slot at once, result is identical
+        if checksum_algorithm != self.checksum_algorithm:
+            return super().get_frame(index, checksum_algorithm)
+        start = self.offset + index * self.slot_size
+        length = self.lengths[index]
+        if length:
+            self.shared_hits += 1
+        else:
+            self.shared_misses += 1
+            length = self.segments[index].pack_into(self.memory, start, checksum_algorithm)
+            self.lengths[index] = length
+        return self.view[start:start + length]
+
+    def __str__(self):
+        return f"shared: {len(self.memory)} bytes, hits: {self.shared_hits}, misses: {self.shared_misses} | private {super().__str__()}"
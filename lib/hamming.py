@@ -1,183 +1,170 @@
-# Functions to do hamming ecc
-# Implemented using most popular, 7-bit hamming encoding
-def encode_hamming(plain_data):
-    # Initial processing the plain data
-    data = list(plain_data)
-    data.reverse()      # reversing
-    num_parity, num_parity_processed, data_pos, redundant, encoded = 0, 0, 0, 0, []
-
-    # Calculate numbers of redundant bit
-    while ((len(plain_data) + redundant + 1) > (pow(2, redundant))):
-        redundant += 1
-
-    # Filling the encoded with data and 0 if it is parity
-    for i in range (0, (redundant + len(data))):
-        parity_pos = (2 ** num_parity)
-        
-        if (parity_pos == (i + 1)):
-            encoded.append(0)   # Init with 0
-            num_parity += 1
-        else:
-            encoded.append(int(data[data_pos])) # Just insert the data
-            data_pos += 1
-
-    # Calculating the parity value
-    for parity in range (0, (len(encoded))):
-        parity_pos_onprocess = (2 ** num_parity_processed)
-        
-        # Searching the parity positions
-        if (parity_pos_onprocess == (parity + 1)):
-            startIndex = parity_pos_onprocess - 1
-            i = startIndex
-            toXor = []  # Array to init every value to be xor-ed
-
-            while (i < len(encoded)):
-                block = encoded[i:i + parity_pos_onprocess]
-                toXor.extend(block)
-                i += 2 * parity_pos_onprocess
-            
-            # Doing xor
-            for z in range (1, len(toXor)):
-                encoded[startIndex] = encoded[startIndex] ^ toXor[z]
-            
-            num_parity_processed += 1
-
-    # Return the encoded
-    encoded.reverse()
-    return ''.join(map(str, encoded))
-
-def detect_error(encoded_data) :
-    # Initial process the encoded data
-    data = list(encoded_data)
-    data.reverse()
-    num_parity, num_parity_processed, error, encoded, parity_list, h_copy = 0, 0, 0, [], [], []
-
-    # Calculating numbers of parity bit
-    for k in range (0, len(data)):
-        parity_pos = (2 ** num_parity)
-        encoded.append(int(data[k]))
-        h_copy.append(data[k])
-        if (parity_pos == (k + 1)):
-            num_parity += 1
-    
-    # Try to xor-ing the parity with data using rules applied using 7-bit hamming     
-    for parity in range (0, (len(encoded))):
-        parity_pos_onprocess = (2 ** num_parity_processed)
-        if (parity_pos_onprocess == (parity + 1)):
-            startIndex = parity_pos_onprocess - 1
-            i = startIndex
-            toXor = []
-
-            while (i < len(encoded)):
-                block = encoded[i:i + parity_pos_onprocess]
-                toXor.extend(block)
-                i += 2 * parity_pos_onprocess
-
-            for z in range (1, len(toXor)):
-                encoded[startIndex] = encoded[startIndex] ^ toXor[z]
-            parity_list.append(encoded[parity])
-            num_parity_processed += 1
-    
-    parity_list.reverse()
-    error = sum(int(parity_list) * (2 ** i) for i, parity_list in enumerate(parity_list[::-1]))
-    
-    # Return error position and he hamming copy
-    return error, h_copy
-
-def fix_error(error, hamming):
-    # Turn the bits
-    if (hamming[error - 1] == '0'):
-        hamming[error - 1] = '1'
-    elif (hamming[error - 1] == '1'):
-        hamming[error - 1] = '0'
-
-    hamming.reverse()
-    
-    # Return the fixed encoded hamming
-    return ''.join(map(str, hamming))
-
-def decode_hamming(encoded_data):
-    # Initial processing the encoded data
-    data = list(encoded_data)
-    data.reverse()
-    num_parity, decoded = 0, []
-
-    # Calculating numbers of parity bit
-    for k in range (0, len(data)):
-        parity_pos = (2 ** num_parity)
-        decoded.append(data[k])
-        if (parity_pos == (k + 1)):
-            num_parity += 1
-            
-    # Retrieve the original data from the Hamming code
-    original_data = [decoded[i] for i in range(len(decoded)) if (i + 1) not in [2**j for j in range(num_parity)]]
-    original_data.reverse()
-    return ''.join(map(str, original_data))
-
-
-# Utils
-# Convert bytes to binary string
-def binary_to_bytes(binary_str):
-    # Ensure the binary string length is a multiple of 8 by adding padding
-    padding = (8 - len(binary_str) % 8) % 8
-    binary_str = '0' * padding + binary_str
-
-    # Convert binary string to bytes
-    byte_array = bytearray()
-    for i in range(0, len(binary_str), 8):
-        byte = int(binary_str[i:i+8], 2)
-        byte_array.append(byte)
-
-    return bytes(byte_array)
-
-
-def bytes_to_binary(byte_data):
-    # Converts bytes to a binary string.
-    binary_str = ''.join(format(byte, '08b') for byte in byte_data)
-    return binary_str
-
-
-# Test
-# 1. Initial
+# Hamming SECDED error correcting code, bytes in and bytes out.
+# Every nibble becomes one code byte: Hamming(7,4) in bit 0-6 plus overall parity in bit 7 (extended Hamming(8,4)),
+# so single bit error of code byte is corrected and double bit error is detected. Encoded data is twice as long,
+# code of high nibble first. Whole buffer goes through bytes.translate with lookup tables, no per-bit Python loop
+from typing import Tuple, Union
+
+from .constant import HAMMING_NUMPY_THRESHOLD
+
+# Optional vectorized path over whole buffer (pip install numpy)
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Code byte status
+HAMMING_OK = 0
+HAMMING_CORRECTED = 1
+HAMMING_UNCORRECTABLE = 2
+
+
+# -- Lookup Tables --
+def _encode_nibble(nibble : int) -> int:
+    # Data bit d1-d4 at position 3, 5, 6, 7, parity p1, p2, p4 at position 1, 2, 4 (bit = position - 1)
+    d1, d2, d3, d4 = (nibble >> 0) & 1, (nibble >> 1) & 1, (nibble >> 2) & 1, (nibble >> 3) & 1
+    p1 = d1 ^ d2 ^ d4
+    p2 = d1 ^ d3 ^ d4
+    p4 = d2 ^ d3 ^ d4
+    code = p1 | p2 << 1 | d1 << 2 | p4 << 3 | d2 << 4 | d3 << 5 | d4 << 6
+    return code | (bin(code).count("1") & 1) << 7
+
+def _build_tables():
+    # Encode table of every nibble, and for every possible code byte its nearest codeword (nibble) and status.
+    # Codewords are 4 bits apart, so distance 1 is correctable and distance 2 is only detected
+    codewords = [_encode_nibble(nibble) for nibble in range(16)]
+    decode = []
+    status = []
+    for code in range(256):
+        distance, nibble = min((bin(code ^ codeword).count("1"), nibble) for nibble, codeword in enumerate(codewords))
+        decode.append(nibble)
+        status.append(HAMMING_OK if distance == 0 else (HAMMING_CORRECTED if distance == 1 else HAMMING_UNCORRECTABLE))
+    return codewords, decode, status
+
+_CODEWORDS, _DECODE, _STATUS = _build_tables()
+
+# Data byte -> code byte of its high or low nibble
+ENCODE_HIGH = bytes(_CODEWORDS[byte >> 4] for byte in range(256))
+ENCODE_LOW = bytes(_CODEWORDS[byte & 0x0F] for byte in range(256))
+
+# Code byte -> corrected nibble already shifted into place, OR of both is data byte
+DECODE_HIGH = bytes(_DECODE[code] << 4 for code in range(256))
+DECODE_LOW = bytes(_DECODE[code] for code in range(256))
+
+# Code byte -> HAMMING_OK, HAMMING_CORRECTED or HAMMING_UNCORRECTABLE, and every valid code byte (deleted by translate)
+CODE_STATUS = bytes(_STATUS)
+VALID_CODES = bytes(_CODEWORDS)
+
+
+# -- Codec --
+def encode(data : Buffer, vectorized : bool = None) -> bytes:
+    # Data -> code, twice as long. vectorized None uses NumPy for large buffer when it is installed
+    if _use_numpy(len(data), vectorized):
+        return _encode_numpy(data)
+    data = bytes(data)
+    code = bytearray(len(data) * 2)
+    code[0::2] = data.translate(ENCODE_HIGH)
+    code[1::2] = data.translate(ENCODE_LOW)
+    return bytes(code)
+
+def decode(code : Buffer, vectorized : bool = None) -> Tuple[bytes, int, int]:
+    # Code -> (data, corrected code bytes, uncorrectable code bytes). Data is still returned when some code byte is
+    # uncorrectable, caller finds it out with checksum. Odd trailing byte isn't a whole data byte and is ignored
+    code = bytes(code[:len(code) & ~1])
+    corrected, uncorrectable = get_errors(code)
+    if _use_numpy(len(code), vectorized):
+        return _decode_numpy(code), corrected, uncorrectable
+    length = len(code) // 2
+    high = int.from_bytes(code[0::2].translate(DECODE_HIGH), "little")
+    low = int.from_bytes(code[1::2].translate(DECODE_LOW), "little")
+    return (high | low).to_bytes(length, "little"), corrected, uncorrectable
+
+def get_errors(code : bytes) -> Tuple[int, int]:
+    # (corrected, uncorrectable) code bytes. Error free buffer, the common case, is only one translate
+    invalid = code.translate(None, VALID_CODES)
+    if not invalid:
+        return 0, 0
+    status = invalid.translate(CODE_STATUS)
+    return status.count(HAMMING_CORRECTED), status.count(HAMMING_UNCORRECTABLE)
+
+def get_encoded_size(size : int) -> int:
+    return size * 2
+
+def get_data_size(size : int) -> int:
+    # Data which fits in code of size bytes
+    return size // 2
+
+
+# -- NumPy Path --
+def _use_numpy(size : int, vectorized : bool = None) -> bool:
+    if _numpy is None:
+        return False
+    return size >= HAMMING_NUMPY_THRESHOLD if vectorized is None else vectorized
+
+def _encode_numpy(data : Buffer) -> bytes:
+    data = _numpy.frombuffer(data, dtype=_numpy.uint8)
+    code = _numpy.empty(len(data) * 2, dtype=_numpy.uint8)
+    code[0::2] = _NUMPY_ENCODE_HIGH[data]
+    code[1::2] = _NUMPY_ENCODE_LOW[data]
+    return code.tobytes()
+
+def _decode_numpy(code : bytes) -> bytes:
+    code = _numpy.frombuffer(code, dtype=_numpy.uint8)
+    return (_NUMPY_DECODE_HIGH[code[0::2]] | _NUMPY_DECODE_LOW[code[1::2]]).tobytes()
+
+if _numpy is not None:
+    _NUMPY_ENCODE_HIGH = _numpy.frombuffer(ENCODE_HIGH, dtype=_numpy.uint8)
+    _NUMPY_ENCODE_LOW = _numpy.frombuffer(ENCODE_LOW, dtype=_numpy.uint8)
+    _NUMPY_DECODE_HIGH = _numpy.frombuffer(DECODE_HIGH, dtype=_numpy.uint8)
+    _NUMPY_DECODE_LOW = _numpy.frombuffer(DECODE_LOW, dtype=_numpy.uint8)
+
+
+# -- Segment Frame --
+def encode_frame(frame : bytes, header_size : int) -> bytes:
+    # Header stays plain, payload is encoded. Checksum in header covers plain payload, so it is checked after decoding
+    return frame[:header_size] + encode(memoryview(frame)[header_size:])
+
+def decode_frame(frame : Buffer, header_size : int) -> Tuple[bytes, int, int]:
+    # Inverse of encode_frame, (frame with decoded payload, corrected, uncorrectable)
+    payload, corrected, uncorrectable = decode(frame[header_size:])
+    return bytes(frame[:header_size]) + payload, corrected, uncorrectable
+
+
+# Benchmark of codec in MB/s of data, lookup table path and NumPy path when it is installed, and error correction check
+# Run with: python -m lib.hamming
 if __name__ == "__main__":
-    message = b"hello world"
-    print("Initial message:", message)
-
-    # 2. Convert into binary
-    binary_msg = bytes_to_binary(message)
-    print("Binary message:", binary_msg)
-
-    # 3. Applying 7-bit hamming encoding
-    encoded = encode_hamming(binary_msg)
-    print("Hamming encoded:", encoded)
-
-    # 4. Simulating error during message sending
-    encoded = list(encoded)
-    encoded[6] = '1'
-    encoded = ''.join(encoded)
-    print("Error result:", encoded)
-
-    # 5. Detecting error and recovery mechanism
-    error, copies = detect_error(encoded)
-    if (error == 0):
-        print('There is no error in the hamming code received')
-    elif (error >= len(copies) or error < 0):
-        print('Error cannot be detected')
-    else:
-        print('Error is in bit', error)
-        print("Error copies:", copies)
-
-        fixed = fix_error(error, copies)
-        print("Fixed hamming:", fixed)
-        encoded = fixed
-
-    # 6. Decoding hamming encoded
-    decoded = decode_hamming(encoded)
-    print("Decoded message:", decoded)
-
-    # 7. Convert back to original message
-    original_msg = binary_to_bytes(decoded)
-    print("Original message:", original_msg)
-
-    # 8. Final check, is the result original?
-    print("Result:", original_msg == message)
+    import os
+    import time
+    import random
+
+    SIZE = 16 * 1024
+    ROUNDS = 2000
+    data = os.urandom(SIZE)
+
+    # Every single bit error of code is corrected, every double bit error within one code byte is detected
+    code = encode(data)
+    rng = random.Random(0)
+    for _ in range(1000):
+        damaged = bytearray(code)
+        index = rng.randrange(len(damaged))
+        damaged[index] ^= 1 << rng.randrange(8)
+        assert decode(damaged) == (data, 1, 0)
+        first, second = rng.sample(range(8), 2)
+        damaged[index] = code[index] ^ (1 << first) ^ (1 << second)
+        assert decode(damaged)[1:] == (0, 1)
+    print("Single bit errors corrected, double bit errors detected")
+
+    paths = [("table", False)] + ([("numpy", True)] if _numpy is not None else [])
+    for name, vectorized in paths:
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            code = encode(data, vectorized)
+        encoding = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            decoded, corrected, uncorrectable = decode(code, vectorized)
+        decoding = time.perf_counter() - start
+        assert decoded == data
+        megabytes = SIZE * ROUNDS / (1024 * 1024)
+        print(f"{name:6}| {SIZE // 1024} KB buffer | encode {megabytes / encoding:8.1f} MB/s | decode {megabytes / decoding:8.1f} MB/s")
@@ -0,0 +1,314 @@
+import os
+import time
+import socket
+import threading
+import socketserver
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .constant import METRICS_PREFIX, RTT_BUCKETS, HANDSHAKE_BUCKETS
+
+# Scalar metric of every connection: name, Prometheus type, help. Counters are summed into process total
+METRICS: List[Tuple[str, str, str]] = [
+    ("segments_sent_total", "counter", "Data segments sent, retransmissions included"),
+    ("segments_resent_total", "counter", "Data segments sent again before being acknowledged"),
+    ("acks_received_total", "counter", "ACKs received during file transfer"),
+    ("duplicate_acks_total", "counter", "ACKs which didn't move window"),
+    ("timeouts_total", "counter", "Retransmission timer expirations"),
+    ("fast_retransmits_total", "counter", "Fast retransmits triggered by duplicate ACKs"),
+    ("segments_received_total", "counter", "In-order data segments received"),
+    ("segments_buffered_total", "counter", "Out-of-order data segments held past the gap"),
+    ("segments_ignored_total", "counter", "Data segments dropped as duplicate, corrupt or out of window"),
+    ("acks_sent_total", "counter", "ACKs sent during file transfer"),
+    ("ecc_corrected_total", "counter", "Payload bytes with bit error corrected by error correcting code"),
+    ("ecc_uncorrectable_total", "counter", "Payload bytes with double bit error detected but not corrected, segment is left to checksum"),
+    ("repairs_sent_total", "counter", "Forward error correction repair segments sent"),
+    ("segments_recovered_total", "counter", "Lost data segments rebuilt from forward error correction repair segments"),
+    ("bytes_delivered_total", "counter", "File bytes acknowledged by client (server) or written in order (client)"),
+    ("window_segments", "gauge", "Send window of congestion control"),
+    ("in_flight_segments", "gauge", "Segments sent but not acknowledged"),
+    ("srtt_seconds", "gauge", "Smoothed round trip time"),
+    ("rto_seconds", "gauge", "Retransmission timeout including backoff"),
+    ("goodput_bytes_per_second", "gauge", "Delivered file bytes over transfer time"),
+    ("transfer_seconds", "gauge", "Time since file transfer started, until it ended"),
+]
+
+class Histogram:
+    def __init__(self, buckets : Sequence[float]):
+        # Fixed upper bounds, observe is one bisect and two additions
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value : float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other : "Histogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def get_cumulative(self) -> List[Tuple[str, int]]:
+        # (le, cumulative count) pairs as Prometheus bucket series, +Inf last
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return result
+
+class ConnectionMetrics:
+    def __init__(self, address : Tuple[str, int]):
+        # Numbers of single connection. Hot path only increments plain attributes, values already kept by RTT estimator
+        # and congestion control are read when metrics are collected
+        self.address = address
+        self.created = time.monotonic()
+        self.started : Optional[float] = None
+        self.ended : Optional[float] = None
+
+        # Counters updated by sender or receiver loop
+        self.segments_sent = 0
+        self.acks_received = 0
+        self.duplicate_acks = 0
+        self.segments_received = 0
+        self.segments_buffered = 0
+        self.segments_ignored = 0
+        self.acks_sent = 0
+        self.ecc_corrected = 0
+        self.ecc_uncorrectable = 0
+        self.repairs_sent = 0
+        self.segments_recovered = 0
+
+        # Delivered part of file. Sender sets acknowledged base sequence and payload size, bytes are derived from it
+        self.base = 2
+        self.next = 2
+        self.payload_size = 0
+        self.filesize = 0
+        self.bytes_delivered = 0
+
+        # Sources owned by transfer, attached when it starts
+        self.rtt = None
+        self.congestion = None
+
+        self.rtt_histogram = Histogram(RTT_BUCKETS)
+        self.handshake_histogram = Histogram(HANDSHAKE_BUCKETS)
+
+    def start(self, rtt, congestion=None, payload_size : int = 0, filesize : int = 0):
+        # File transfer starts (again after reset), RTT samples from now on go to histogram
+        self.started = time.monotonic()
+        self.ended = None
+        self.rtt = rtt
+        self.congestion = congestion
+        self.payload_size = payload_size
+        self.filesize = filesize
+        rtt.histogram = self.rtt_histogram
+
+    def end(self):
+        self.ended = time.monotonic()
+
+    def on_handshake(self, seconds : float):
+        self.handshake_histogram.observe(seconds)
+
+    def get_delivered(self) -> int:
+        if self.payload_size:
+            return min(max(self.base - 3, 0) * self.payload_size, self.filesize)
+        return self.bytes_delivered
+
+    def get_values(self) -> Dict[str, float]:
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.ended or time.monotonic()) - self.started
+        delivered = self.get_delivered()
+        congestion = self.congestion
+        rtt = self.rtt
+        return {
+            "segments_sent_total": self.segments_sent,
+            "segments_resent_total": rtt.resent if rtt is not None else 0,
+            "acks_received_total": self.acks_received,
+            "duplicate_acks_total": self.duplicate_acks,
+            "timeouts_total": congestion.timeouts if congestion is not None else 0,
+            "fast_retransmits_total": congestion.fast_retransmits if congestion is not None else 0,
+            "segments_received_total": self.segments_received,
+            "segments_buffered_total": self.segments_buffered,
+            "segments_ignored_total": self.segments_ignored,
+            "acks_sent_total": self.acks_sent,
+            "ecc_corrected_total": self.ecc_corrected,
+            "ecc_uncorrectable_total": self.ecc_uncorrectable,
+            "repairs_sent_total": self.repairs_sent,
+            "segments_recovered_total": self.segments_recovered,
+            "bytes_delivered_total": delivered,
+            "window_segments": congestion.get_window() if congestion is not None else 0,
+            "in_flight_segments": max(self.next - self.base, 0),
+            "srtt_seconds": (rtt.srtt or 0.0) if rtt is not None else 0.0,
+            "rto_seconds": rtt.get_timeout() if rtt is not None else 0.0,
+            "goodput_bytes_per_second": delivered / elapsed if elapsed > 0 else 0.0,
+            "transfer_seconds": elapsed,
+        }
+
+class MetricsRegistry:
+    def __init__(self, role : str):
+        # Every connection of this process, finished ones are kept so process totals never go down.
+        # role ("server" or "client") labels every series
+        self.role = role
+        self.connections: Dict[Tuple[str, int], ConnectionMetrics] = {}
+        self.lock = threading.Lock()
+        self.created = time.monotonic()
+
+    def get(self, address : Tuple[str, int]) -> ConnectionMetrics:
+        # Metrics of address, created on first use
+        metrics = self.connections.get(address)
+        if metrics is None:
+            with self.lock:
+                metrics = self.connections.setdefault(address, ConnectionMetrics(address))
+        return metrics
+
+    # -- Python API --
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        # "ip:port" of every connection -> metric values, "process" -> totals
+        with self.lock:
+            connections = list(self.connections.values())
+        result = {f"{metrics.address[0]}:{metrics.address[1]}": metrics.get_values() for metrics in connections}
+        result["process"] = self.get_totals(list(result.values()), connections)
+        return result
+
+    def get_totals(self, values : List[Dict[str, float]], connections : List[ConnectionMetrics]) -> Dict[str, float]:
+        totals = {name: sum(value[name] for value in values) for name, kind, _ in METRICS if kind == "counter"}
+        totals["connections"] = len(connections)
+        totals["connections_active"] = sum(metrics.started is not None and metrics.ended is None for metrics in connections)
+        totals["goodput_bytes_per_second"] = sum(value["goodput_bytes_per_second"] for metrics, value in zip(connections, values) if metrics.ended is None)
+        totals["uptime_seconds"] = time.monotonic() - self.created
+        return totals
+
+    # -- Prometheus Text Format --
+    def render(self) -> str:
+        with self.lock:
+            connections = list(self.connections.values())
+        values = [metrics.get_values() for metrics in connections]
+        totals = self.get_totals(values, connections)
+        lines = []
+        role = f'role="{self.role}"'
+
+        for name, kind, help in METRICS:
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {kind}")
+            if name in totals:
+                lines.append(f"{METRICS_PREFIX}_{name}{{{role}}} {totals[name]}")
+            for metrics, value in zip(connections, values):
+                lines.append(f'{METRICS_PREFIX}_{name}{{{role},peer="{metrics.address[0]}:{metrics.address[1]}"}} {value[name]}')
+
+        for name, help in (("connections", "Connections seen by this process"), ("connections_active", "Connections in file transfer"), ("uptime_seconds", "Time since process started")):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} gauge")
+            lines.append(f"{METRICS_PREFIX}_{name}{{{role}}} {totals[name]}")
+
+        for name, attribute, help in (("rtt_seconds", "rtt_histogram", "Round trip time samples"), ("handshake_seconds", "handshake_histogram", "Three way handshake latency")):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} histogram")
+            total = None
+            for metrics in connections:
+                histogram = getattr(metrics, attribute)
+                if total is None:
+                    total = Histogram(histogram.buckets)
+                total.merge(histogram)
+                self.render_histogram(lines, name, f'{role},peer="{metrics.address[0]}:{metrics.address[1]}"', histogram)
+            if total is not None:
+                self.render_histogram(lines, name, role, total)
+        return "\n".join(lines) + "\n"
+
+    def render_histogram(self, lines : List[str], name : str, labels : str, histogram : Histogram):
+        for bound, count in histogram.get_cumulative():
+            lines.append(f'{METRICS_PREFIX}_{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{METRICS_PREFIX}_{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{METRICS_PREFIX}_{name}_count{{{labels}}} {histogram.count}")
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Unix socket peer has no address
+        return str(self.client_address or "unix")
+
+    def log_message(self, format, *args):
+        # Scrape isn't worth a log line
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Stale socket file of previous run would make bind fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+class MetricsEndpoint:
+    def __init__(self, registry : MetricsRegistry, address : str):
+        # Scrape endpoint in daemon thread. "host:port" listens on TCP, anything with "/" (or "unix:" prefix) on Unix socket
+        self.registry = registry
+        self.address = address
+        if address.startswith("unix:") or "/" in address:
+            self.httpd = UnixHTTPServer(address.removeprefix("unix:"), MetricsRequestHandler)
+        else:
+            host, _, port = address.rpartition(":")
+            self.httpd = ThreadingHTTPServer((host or "127.0.0.1", int(port)), MetricsRequestHandler)
+            self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if isinstance(self.httpd, UnixHTTPServer) and os.path.exists(self.httpd.server_address):
+            os.unlink(self.httpd.server_address)
+
+    def __str__(self):
+        if isinstance(self.httpd, UnixHTTPServer):
+            return f"unix:{self.httpd.server_address}"
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+def scrape(address : str, timeout : float = 1.0) -> str:
+    # Fetch metrics text from endpoint, same address format as MetricsEndpoint
+    if address.startswith("unix:") or "/" in address:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(address.removeprefix("unix:"))
+    else:
+        host, _, port = address.rpartition(":")
+        connection = socket.create_connection((host or "127.0.0.1", int(port)), timeout)
+    with connection:
+        connection.sendall(b"GET /metrics HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).partition(b"\r\n\r\n")[2].decode()
+
+
+# Print metrics of running server or client
+# Run with: python -m lib.metrics [address]
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        print("Usage: python -m lib.metrics [host:port | unix:path]")
+        sys.exit(1)
+    print(scrape(sys.argv[1]), end="")
@@ -0,0 +1,106 @@
+import os
+import errno
+import ctypes
+import ctypes.util
+import socket
+import struct
+from typing import List, Sequence, Tuple
+
+# sendmmsg(2) and recvmmsg(2) through libc, socket module has neither. Many datagrams per syscall when they can't share
+# one GSO buffer (frames together over UDP_MAX_PAYLOAD), and draining receive queue. None where libc lacks them (not Linux)
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    _sendmmsg = _libc.sendmmsg
+    _recvmmsg = _libc.recvmmsg
+except (OSError, AttributeError):
+    _libc = _sendmmsg = _recvmmsg = None
+
+# Largest vector of one call (UIO_MAXIOV)
+MMSG_MAX = 1024
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+# struct sockaddr_in: family (native order), port and address (network order), zero padding
+_SOCKADDR_IN = struct.Struct("=H2s4s8x")
+
+def available() -> bool:
+    return _sendmmsg is not None and _recvmmsg is not None
+
+def _raise_errno():
+    error = ctypes.get_errno()
+    raise OSError(error, os.strerror(error))
+
+def _get_address(address : Tuple[str, int]) -> ctypes.Array:
+    return ctypes.create_string_buffer(_SOCKADDR_IN.pack(socket.AF_INET, address[1].to_bytes(2, "big"), socket.inet_aton(address[0])), _SOCKADDR_IN.size)
+
+def _get_pointer(frame, keep : list) -> int:
+    # Address of frame without copy. bytes is read only, so its buffer is taken from c_char_p, writable buffer
+    # (bytearray, view of shared mmap) directly. Anything else is copied once
+    if isinstance(frame, memoryview) and frame.readonly:
+        frame = bytes(frame)
+    if isinstance(frame, bytes):
+        pointer = ctypes.c_char_p(frame)
+        keep.append((frame, pointer))
+        return ctypes.cast(pointer, ctypes.c_void_p).value
+    array = (ctypes.c_char * len(frame)).from_buffer(frame)
+    keep.append(array)
+    return ctypes.addressof(array)
+
+def sendmmsg(sock : socket.socket, frames : Sequence, dest : Tuple[str, int]) -> int:
+    # Send frames as separate datagrams to dest in one call, return number sent (may be less than all)
+    count = min(len(frames), MMSG_MAX)
+    address = _get_address(dest)
+    keep = []
+    vectors = (_IOVec * count)()
+    messages = (_MMsgHdr * count)()
+    for index in range(count):
+        vectors[index].iov_base = _get_pointer(frames[index], keep)
+        vectors[index].iov_len = len(frames[index])
+        header = messages[index].msg_hdr
+        header.msg_name = ctypes.addressof(address)
+        header.msg_namelen = _SOCKADDR_IN.size
+        header.msg_iov = ctypes.pointer(vectors[index])
+        header.msg_iovlen = 1
+    sent = _sendmmsg(sock.fileno(), messages, count, 0)
+    if sent < 0:
+        _raise_errno()
+    return sent
+
+def recvmmsg(sock : socket.socket, buffers : Sequence[bytearray], flags : int = MSG_DONTWAIT) -> List[Tuple[int, Tuple[str, int]]]:
+    # Receive up to len(buffers) queued datagrams in one call, (size, source) for each filled buffer in order.
+    # Default flag never blocks, empty list when nothing is queued
+    count = min(len(buffers), MMSG_MAX)
+    keep = []
+    vectors = (_IOVec * count)()
+    names = (ctypes.c_char * (_SOCKADDR_IN.size * count))()
+    messages = (_MMsgHdr * count)()
+    for index in range(count):
+        vectors[index].iov_base = _get_pointer(buffers[index], keep)
+        vectors[index].iov_len = len(buffers[index])
+        header = messages[index].msg_hdr
+        header.msg_name = ctypes.addressof(names) + index * _SOCKADDR_IN.size
+        header.msg_namelen = _SOCKADDR_IN.size
+        header.msg_iov = ctypes.pointer(vectors[index])
+        header.msg_iovlen = 1
+    received = _recvmmsg(sock.fileno(), messages, count, flags, None)
+    if received < 0:
+        if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+            # Nothing queued
+            return []
+        _raise_errno()
+    result = []
+    for index in range(received):
+        _, port, ip = _SOCKADDR_IN.unpack_from(names, index * _SOCKADDR_IN.size)
+        result.append((messages[index].msg_len, (socket.inet_ntoa(ip), int.from_bytes(port, "big"))))
+    return result
@@ -0,0 +1,137 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .constant import MAX_NAK_BLOCKS, MULTICAST_MAX_POLLS
+
+def get_nak_blocks(base : int, received : Iterable[int], limit : int = MAX_NAK_BLOCKS) -> Tuple[List[Tuple[int, int]], int]:
+    # Sequence numbers held past cumulative base -> missing ranges (start, end exclusive) and horizon.
+    # When ranges don't fit, horizon stops at first unreported one, so sender resends everything from there
+    blocks: List[Tuple[int, int]] = []
+    horizon = base
+    for sequence in sorted(received):
+        if sequence < horizon:
+            continue
+        if sequence > horizon:
+            if len(blocks) >= limit:
+                break
+            blocks.append((horizon, sequence))
+        horizon = sequence + 1
+    return blocks, horizon
+
+def parse_group(value : str) -> Optional[Tuple[str, int]]:
+    # "239.1.2.3:5007" -> ("239.1.2.3", 5007), None when invalid
+    host, _, port = (value or "").rpartition(":")
+    try:
+        return (host, int(port)) if host and 0 < int(port) < 65536 else None
+    except ValueError:
+        return None
+
+class MulticastMember:
+    def __init__(self, address : Tuple[str, int], end : int, group : bool):
+        # Sender view of single client in one-to-many transfer. Until first NAK every segment from 2 is missing.
+        # group is False when client receives unicast copy instead of joining multicast group
+        self.address = address
+        self.group = group
+        self.end = end
+        self.base = 2
+        self.horizon = 2
+        self.holes: Tuple[Tuple[int, int], ...] = ()
+
+        # Poll round state, member which doesn't answer MULTICAST_MAX_POLLS polls in a row is dropped
+        self.answered = False
+        self.silent = 0
+        self.dropped = False
+
+        # Statistic
+        self.naks = 0
+        self.received = 0   # Segments sent to this member, by group or unicast
+
+    @property
+    def complete(self) -> bool:
+        return self.base >= self.end
+
+    def on_nak(self, base : int, horizon : int, blocks : Iterable[Tuple[int, int]]) -> bool:
+        # Merge NAK. Older answer (lower base or horizon) arriving late is ignored, return False for it
+        horizon = min(max(horizon, base), self.end)
+        if base < self.base or (base == self.base and horizon < self.horizon):
+            return False
+        self.base = base
+        self.horizon = horizon
+        self.holes = tuple((max(start, base), min(end, horizon)) for start, end in blocks if max(start, base) < min(end, horizon))
+        self.answered = True
+        self.silent = 0
+        self.naks += 1
+        return True
+
+    def on_silent(self) -> bool:
+        # Poll round ended without answer, return True when member is dropped
+        self.silent += 1
+        self.dropped = self.silent >= MULTICAST_MAX_POLLS
+        return self.dropped
+
+    def get_missing(self, limit : int) -> List[int]:
+        # Lowest limit segments this member still needs, holes first then everything from horizon
+        missing: List[int] = []
+        for start, end in self.holes:
+            missing.extend(range(start, min(end, start + limit - len(missing))))
+            if len(missing) >= limit:
+                return missing
+        missing.extend(range(self.horizon, min(self.end, self.horizon + limit - len(missing))))
+        return missing
+
+    def __str__(self):
+        state = "dropped" if self.dropped else ("complete" if self.complete else f"next {self.base}")
+        return f"{state}, {'group' if self.group else 'unicast'}, segments: {self.received}, naks: {self.naks}"
+
+class MulticastSession:
+    def __init__(self, members : Iterable[MulticastMember]):
+        # Every member of one-to-many transfer, keyed by address NAK comes from
+        self.members: Dict[Tuple[str, int], MulticastMember] = {member.address: member for member in members}
+        self.rounds = 0
+
+        # Statistic
+        self.transmitted: Set[int] = set()
+        self.sent = 0   # Datagrams sent, one group send counts once
+        self.resent = 0 # Segments sent again in later round
+
+    def __contains__(self, address : Tuple[str, int]) -> bool:
+        return address in self.members
+
+    def get(self, address : Tuple[str, int]) -> MulticastMember:
+        return self.members[address]
+
+    def get_active(self) -> List[MulticastMember]:
+        # Members still receiving
+        return [member for member in self.members.values() if not member.complete and not member.dropped]
+
+    def get_missing(self, limit : int) -> Tuple[List[int], Dict[Tuple[str, int], Set[int]]]:
+        # Next round: lowest limit segments of union of what active members miss, and which of them each member misses
+        needed = {member.address: set(member.get_missing(limit)) for member in self.get_active()}
+        union: Set[int] = set()
+        for missing in needed.values():
+            union.update(missing)
+        sequences = sorted(union)[:limit]
+        return sequences, {address: missing.intersection(sequences) for address, missing in needed.items()}
+
+    def on_send(self, sequences : Iterable[int], datagrams : int):
+        # Round is sent, datagrams counts group send once and every unicast copy
+        sequences = list(sequences)
+        self.resent += sum(sequence in self.transmitted for sequence in sequences)
+        self.transmitted.update(sequences)
+        self.sent += datagrams
+
+    def start_round(self):
+        self.rounds += 1
+        for member in self.get_active():
+            member.answered = False
+
+    def get_unanswered(self) -> List[MulticastMember]:
+        return [member for member in self.get_active() if not member.answered]
+
+    @property
+    def done(self) -> bool:
+        return not self.get_active()
+
+    def __str__(self):
+        complete = sum(member.complete for member in self.members.values())
+        dropped = sum(member.dropped for member in self.members.values())
+        return f"members: {len(self.members)}, complete: {complete}, dropped: {dropped}, rounds: {self.rounds}, sent: {self.sent}, resent: {self.resent}"
@@ -0,0 +1,163 @@
+from typing import Dict, List, Optional, Tuple
+
+from .constant import CHECKSUM_ALGORITHMS, DEFAULT_CHECKSUM, ARQ_MODES, DEFAULT_ARQ, ACK_POLICIES, DEFAULT_ACK_POLICY, SACK_MODES, DEFAULT_SACK, MULTICAST_GROUP, MULTICAST_UNICAST, ECC_MODES, DEFAULT_ECC, FEC_MODES, DEFAULT_FEC
+from .multicast import parse_group
+
+# Handshake payload prefix. Old client echoes SYN payload back in SYN-ACK,
+# so answer must be distinguishable from offer
+OFFER_PREFIX = b"?"
+ANSWER_PREFIX = b"!"
+
+def encode_options(options : Dict[str, List[str]]) -> bytes:
+    # {"checksum": ["crc32", "crc16"]} -> b"checksum=crc32,crc16"
+    return ";".join(f"{key}={','.join(values)}" for key, values in options.items()).encode()
+
+def decode_options(payload : bytes) -> Dict[str, List[str]]:
+    # Inverse of encode_options, unknown garbage is skipped
+    options = {}
+    for item in bytes(payload).decode(errors="ignore").split(";"):
+        if "=" in item:
+            key, values = item.split("=", 1)
+            options[key] = values.split(",")
+    return options
+
+def choose_option(offered : List[str], supported : List[str], default : str) -> str:
+    # First offered value which is supported, otherwise default
+    for value in offered or []:
+        if value in supported:
+            return value
+    return default
+
+def parse_count(values : List[str]) -> Optional[int]:
+    # Positive number option, None when missing or invalid
+    try:
+        count = int(values[0])
+    except (TypeError, IndexError, ValueError):
+        return None
+    return count if count > 0 else None
+
+# Option name -> (supported values, default). Chosen value is saved in attribute of same name
+CHOICE_OPTIONS = {
+    "checksum": (CHECKSUM_ALGORITHMS, DEFAULT_CHECKSUM),
+    "arq": (ARQ_MODES, DEFAULT_ARQ),
+    "ack": (ACK_POLICIES, DEFAULT_ACK_POLICY),
+    "sack": (SACK_MODES, DEFAULT_SACK),
+    "ecc": (ECC_MODES, DEFAULT_ECC),
+    "fec": (FEC_MODES, DEFAULT_FEC),
+}
+
+class ConnectionOptions:
+    def __init__(self, checksum : str = DEFAULT_CHECKSUM, arq : str = DEFAULT_ARQ, ack : str = DEFAULT_ACK_POLICY, sack : str = DEFAULT_SACK, ecc : str = DEFAULT_ECC, fec : str = DEFAULT_FEC, window : Optional[int] = None, segment_size : Optional[int] = None, multicast : Optional[str] = None, group : Optional[Tuple[str, int]] = None):
+        # Defaults are what both side use when peer doesn't negotiate (older version)
+        self.checksum = checksum
+        self.arq = arq
+        self.ack = ack
+        self.sack = sack
+        self.ecc = ecc
+        self.fec = fec
+
+        # Receive window (segments) advertised by client in its answer, not negotiated
+        self.window = window
+
+        # Segment size (bytes, header included) offered by server and lowered by client to what it can receive.
+        # None when peer doesn't negotiate it, client which answers it also answers path MTU probe
+        self.segment_size = segment_size
+
+        # One-to-many transfer, None when not offered or not supported by peer. Client joins group (MULTICAST_GROUP)
+        # or receives unicast copy (MULTICAST_UNICAST). Server offers group address, or unicast only when group is None
+        self.multicast = multicast
+        self.group = group
+
+    # -- Server Side --
+    def get_offer(self) -> Dict[str, List[str]]:
+        # Preferred value first, default last so older peer always have a choice
+        offer = {name: list(dict.fromkeys([getattr(self, name), default])) for name, (supported, default) in CHOICE_OPTIONS.items()}
+        if self.segment_size is not None:
+            offer["segment"] = [str(self.segment_size)]
+        if self.multicast is not None:
+            offer["multicast"] = [MULTICAST_UNICAST if self.group is None else f"{self.group[0]}:{self.group[1]}"]
+        return offer
+
+    def get_offer_bytes(self) -> bytes:
+        # SYN payload
+        return OFFER_PREFIX + encode_options(self.get_offer())
+
+    @classmethod
+    def from_answer(cls, payload : bytes) -> Optional["ConnectionOptions"]:
+        # Options for single client from its SYN-ACK payload, None when answer is malformed.
+        # Defaulting garbage would leave both side with different options, so server offers again instead
+        payload = bytes(payload)
+        if payload[:1] == OFFER_PREFIX:
+            # Older client echoes offer back, it doesn't negotiate
+            return cls()
+        if payload[:1] != ANSWER_PREFIX:
+            return None
+
+        # Anything decode_options() skips (no "=", invalid UTF-8, repeated option) doesn't encode back the same
+        answer = decode_options(payload[1:])
+        if encode_options(answer) != payload[1:]:
+            return None
+
+        # Option missing from answer is one client doesn't know yet, unknown option or value is never offered
+        options = cls()
+        known = set(CHOICE_OPTIONS) | {"window", "segment", "multicast"}
+        if not known.issuperset(answer):
+            return None
+        for name, (supported, default) in CHOICE_OPTIONS.items():
+            if name in answer:
+                if len(answer[name]) != 1 or answer[name][0] not in supported:
+                    return None
+                setattr(options, name, answer[name][0])
+        for name, attribute in (("window", "window"), ("segment", "segment_size")):
+            if name in answer:
+                count = parse_count(answer[name])
+                if count is None or len(answer[name]) != 1:
+                    return None
+                setattr(options, attribute, count)
+        if "multicast" in answer:
+            if answer["multicast"] not in ([MULTICAST_GROUP], [MULTICAST_UNICAST]):
+                return None
+            options.multicast = answer["multicast"][0]
+        return options
+
+    # -- Client Side --
+    def get_answer(self) -> Dict[str, List[str]]:
+        answer = {name: [getattr(self, name)] for name in CHOICE_OPTIONS}
+        if self.window is not None:
+            answer["window"] = [str(self.window)]
+        if self.segment_size is not None:
+            answer["segment"] = [str(self.segment_size)]
+        if self.multicast is not None:
+            answer["multicast"] = [self.multicast]
+        return answer
+
+    def choose_offer(self, payload : bytes, segment_limit : Optional[int] = None) -> bool:
+        # Choose options from SYN payload, False when it isn't an offer.
+        # Offered segment size is lowered to segment_limit, largest datagram this side can receive
+        if bytes(payload[:1]) != OFFER_PREFIX:
+            return False
+
+        offer = decode_options(payload[1:])
+        for name, (supported, default) in CHOICE_OPTIONS.items():
+            setattr(self, name, choose_option(offer.get(name), supported, default))
+        offered = parse_count(offer.get("segment"))
+        self.segment_size = None if offered is None or segment_limit is None else min(offered, segment_limit)
+
+        # Client still has to join offered group, it falls back to unicast copy when it can't
+        multicast = (offer.get("multicast") or [None])[0]
+        self.group = parse_group(multicast)
+        self.multicast = MULTICAST_GROUP if self.group is not None else (MULTICAST_UNICAST if multicast == MULTICAST_UNICAST else None)
+        return True
+
+    def get_answer_bytes(self) -> bytes:
+        # SYN-ACK payload
+        return ANSWER_PREFIX + encode_options(self.get_answer())
+
+    def accept_offer(self, payload : bytes, segment_limit : Optional[int] = None) -> bytes:
+        # Choose options from SYN payload, return SYN-ACK payload
+        if not self.choose_offer(payload, segment_limit):
+            return b""
+        return self.get_answer_bytes()
+
+    def __str__(self):
+        return ", ".join(f"{key}={','.join(values)}" for key, values in self.get_answer().items())
@@ -0,0 +1,55 @@
+from typing import List, Optional
+
+from .constant import MIN_SEGMENT_SIZE, PMTU_CANDIDATES, PMTU_MAX_PROBES
+
+class PathMTUSearch:
+    def __init__(self, max_size : int, candidates : List[int] = PMTU_CANDIDATES, max_probes : int = PMTU_MAX_PROBES, base_size : int = MIN_SEGMENT_SIZE):
+        # Packetization layer path MTU search of single client (RFC 8899). Sizes are datagram size, header included.
+        # Every round probes negotiated size and every candidate below it at once, so search takes one round trip
+        # when largest probe passes and max_probes timeouts at most. Largest acknowledged size is the result
+        self.max_size = max_size
+        self.sizes = [max_size] + [size for size in candidates if base_size <= size < max_size]
+        self.max_probes = max_probes
+        self.rounds = 0
+        self.size : Optional[int] = None
+
+        # Statistic
+        self.probes = 0
+        self.lost = 0
+
+    @property
+    def done(self) -> bool:
+        return self.rounds >= self.max_probes or not self.get_pending()
+
+    def get_pending(self) -> List[int]:
+        # Sizes still worth probing, larger than what already passed
+        return [size for size in self.sizes if self.size is None or size > self.size]
+
+    def get_probe_sizes(self) -> List[int]:
+        # Probes of next round
+        sizes = self.get_pending()
+        self.probes += len(sizes)
+        return sizes
+
+    def on_ack(self, size : int):
+        # Probe reached client unfragmented
+        if size in self.sizes and (self.size is None or size > self.size):
+            self.size = size
+
+    def on_too_big(self, size : int):
+        # Local link refused probe (EMSGSIZE), no reason to try again
+        if size in self.sizes:
+            self.sizes.remove(size)
+
+    def end_round(self):
+        # Probe which isn't acknowledged within timeout is dropped somewhere on path, or just lost
+        self.lost += len(self.get_pending())
+        self.rounds += 1
+
+    def get_size(self) -> int:
+        # Largest confirmed size. When nothing passed, probes are blocked (DF packets dropped) rather than path
+        # being that narrow, so negotiated size is kept. Data segment never has DF bit and can still be fragmented
+        return self.max_size if self.size is None else self.size
+
+    def __str__(self):
+        return f"segment size: {self.get_size()}, probes: {self.probes}, lost: {self.lost}, rounds: {self.rounds}"
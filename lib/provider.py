@@ -0,0 +1,94 @@
+import os
+import mmap
+from math import ceil
+from typing import BinaryIO
+
+from .segment import Segment
+from .constant import PAYLOAD_SIZE
+
+class SegmentProvider:
+    def __init__(self, file : BinaryIO, metadata : bytes, payload_size : int = PAYLOAD_SIZE):
+        # Segment list built on demand from memory mapped file.
+        # Index 0 is metadata segment (seq_num 2), index i is file chunk i - 1 (seq_num i + 2)
+        self.file = file
+        self.fd = file.fileno()
+        self.metadata = metadata
+        self.payload_size = payload_size
+        self.filesize = os.fstat(self.fd).st_size
+        self.num_of_chunk = ceil(self.filesize / payload_size)
+
+        # Empty file can't be memory mapped
+        self.mmap = None
+        if self.filesize > 0:
+            self.mmap = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+            self.advise_file(0, 0, "POSIX_FADV_SEQUENTIAL")
+
+    def __len__(self):
+        return self.num_of_chunk + 1
+
+    def __getitem__(self, index : int) -> Segment:
+        # Build segment, same layout as eager breakdown
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+
+        segment = Segment()
+        if index == 0:
+            segment.set_payload(self.metadata)
+            segment.set_header({"seq_num": 2, "ack_num": 0})
+        else:
+            segment.set_payload(self.get_chunk(index - 1))
+            segment.set_header({"seq_num": index + 2, "ack_num": 3})
+        return segment
+
+    def get_chunk(self, chunk : int) -> bytes:
+        # Payload of file chunk, offset is (seq_num - 3) * payload_size
+        offset = chunk * self.payload_size
+        return self.mmap[offset:offset + self.payload_size]
+
+    # -- Page Cache Hint --
+    def advise_file(self, offset : int, length : int, advice : str):
+        # posix_fadvise is only a hint, ignore platform without it
+        if hasattr(os, "posix_fadvise") and hasattr(os, advice):
+            try:
+                os.posix_fadvise(self.fd, offset, length, getattr(os, advice))
+            except OSError:
+                pass
+
+    def advise_mmap(self, offset : int, length : int, advice : str):
+        # madvise needs page aligned start
+        if self.mmap is None or not hasattr(mmap, advice):
+            return
+        start = (offset // mmap.PAGESIZE) * mmap.PAGESIZE
+        length = min(offset + length, self.filesize) - start
+        if length > 0:
+            try:
+                self.mmap.madvise(getattr(mmap, advice), start, length)
+            except OSError:
+                pass
+
+    def prefetch(self, index : int, count : int):
+        # Ask kernel to read segments [index, index + count) in background, called just past send window
+        first = max(index, 1) - 1
+        last = min(index + count, len(self)) - 1
+        if self.mmap is None or last <= first:
+            return
+        offset = first * self.payload_size
+        length = (last - first) * self.payload_size
+        self.advise_file(offset, length, "POSIX_FADV_WILLNEED")
+        self.advise_mmap(offset, length, "MADV_WILLNEED")
+
+    def release(self, index : int, count : int):
+        # Segments [index, index + count) are acknowledged, unmap their pages so RSS stays bounded.
+        # Pages stay in page cache, so other client can still read them cheaply
+        first = max(index, 1) - 1
+        last = min(index + count, len(self)) - 1
+        if self.mmap is None or last <= first:
+            return
+        self.advise_mmap(first * self.payload_size, (last - first) * self.payload_size, "MADV_DONTNEED")
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
@@ -0,0 +1,171 @@
+import heapq
+import random
+import socket
+import selectors
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .constant import DEFAULT_IP, RECEIVE_BUFFER_SIZE
+
+class ImpairmentRelay:
+    def __init__(self, listen_port : int, server_port : int, delay : float = 0.0, rate : Optional[float] = None, ip : str = DEFAULT_IP, mtu : Optional[int] = None,
+                 loss : float = 0.0, reorder : float = 0.0, reorder_delay : float = 0.002, seed : Optional[int] = None):
+        # UDP relay between single client and server, adds one-way delay (second) and limits bandwidth (bytes per second)
+        # of each direction. Datagram larger than mtu (bytes, UDP payload) is dropped like DF packet on narrow link.
+        # loss is drop probability of each datagram, reorder is probability datagram is held reorder_delay longer so
+        # later ones overtake it. Same seed gives same impairment pattern for same traffic.
+        # Client uses listen_port as broadcast port, server sees relay as the client
+        self.delay = delay
+        self.rate = rate
+        self.mtu = mtu
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.random = random.Random(seed)
+        self.server_address = (ip, server_port)
+        self.client_address : Optional[Tuple[str, int]] = None
+
+        # front faces client, back faces server
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.front.bind((ip, listen_port))
+        self.back = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.back.bind((ip, 0))
+
+        # Large socket buffers, so whole window burst is queued by relay instead of dropped by kernel
+        for sock in (self.front, self.back):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+
+        # Datagrams waiting for their due time, and when each outgoing link finishes previous datagram
+        self.queue: List[Tuple[float, int, socket.socket, bytes, Tuple[str, int]]] = []
+        self.link_free: Dict[socket.socket, float] = {self.front: 0.0, self.back: 0.0}
+        self.order = 0
+
+        self.running = False
+        self.thread : Optional[threading.Thread] = None
+
+        # Statistic
+        self.forwarded = 0
+        self.oversized = 0
+        self.dropped = 0
+        self.reordered = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.front.close()
+        self.back.close()
+
+    def schedule(self, sock : socket.socket, data : bytes, dest : Tuple[str, int]):
+        # Datagram leaves after previous one on same link is serialized, then arrives after delay
+        if self.mtu and len(data) > self.mtu:
+            self.oversized += 1
+            return
+        if self.loss and self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        now = time.monotonic()
+        departure = max(now, self.link_free[sock])
+        if self.rate:
+            departure += len(data) / self.rate
+        self.link_free[sock] = departure
+        arrival = departure + self.delay
+        if self.reorder and self.random.random() < self.reorder:
+            # Held datagram doesn't occupy link longer, it only arrives later
+            arrival += self.reorder_delay
+            self.reordered += 1
+        heapq.heappush(self.queue, (arrival, self.order, sock, data, dest))
+        self.order += 1
+
+    def flush(self):
+        # Send every datagram which is due
+        now = time.monotonic()
+        while self.queue and self.queue[0][0] <= now:
+            due, order, sock, data, dest = heapq.heappop(self.queue)
+            sock.sendto(data, dest)
+            self.forwarded += 1
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.front, selectors.EVENT_READ)
+        selector.register(self.back, selectors.EVENT_READ)
+        while self.running:
+            timeout = 0.05
+            if self.queue:
+                timeout = min(max(self.queue[0][0] - time.monotonic(), 0), timeout)
+            for key, event in selector.select(timeout):
+                data, address = key.fileobj.recvfrom(65535)
+                if key.fileobj is self.front:
+                    self.client_address = address
+                    self.schedule(self.back, data, self.server_address)
+                elif self.client_address is not None:
+                    self.schedule(self.front, data, self.client_address)
+            self.flush()
+        selector.close()
+
+
+# Benchmark of Go-Back-N sender, window-at-a-time loop against sliding window, at several round trip times
+# Run with: python -m lib.relay
+if __name__ == "__main__":
+    import os
+    import sys
+    import logging
+    import tempfile
+
+    from server import Server
+    from client import Client
+
+    SERVER_PORT = 9990
+    RELAY_PORT = 9991
+    CLIENT_PORT = 8990
+    FILE_SIZE = 8 * 1024 * 1024
+    RATE = 20 * 1024 * 1024
+
+    source = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+    source.write(os.urandom(FILE_SIZE))
+    source.close()
+    argv = sys.argv
+    logging.disable(logging.CRITICAL)
+
+    def transfer(rtt : float, sliding_window : bool) -> float:
+        relay = ImpairmentRelay(RELAY_PORT, SERVER_PORT, rtt / 2, RATE)
+        relay.start()
+        sys.argv = ["server.py", str(SERVER_PORT), source.name]
+        server = Server()
+        server.sliding_window = sliding_window
+        sys.argv = ["client.py", str(CLIENT_PORT), str(RELAY_PORT), "relay_benchmark.bin"]
+        client = Client()
+
+        client.connect()
+        data, address = server.connection.listen_single_segment(5)
+        server.client_list.append(address)
+        start = time.perf_counter()
+        receiver = threading.Thread(target=lambda: (client.three_way_handshake(), client.listen_file_transfer(), client.shutdown()))
+        receiver.start()
+        server.start_file_transfer()
+        receiver.join()
+        elapsed = time.perf_counter() - start
+
+        server.connection.close_socket()
+        server.list_segment.close()
+        server.file.close()
+        relay.stop()
+        os.remove("out/relay_benchmark.bin")
+        return elapsed
+
+    try:
+        print(f"{FILE_SIZE // (1024 * 1024)} MB file, {RATE // (1024 * 1024)} MB/s link")
+        for rtt in (0.0, 0.01, 0.05, 0.1):
+            batch = transfer(rtt, False)
+            sliding = transfer(rtt, True)
+            size = FILE_SIZE / (1024 * 1024)
+            print(f"RTT {rtt * 1000:5.0f} ms | batch {size / batch:8.2f} MB/s | sliding {size / sliding:8.2f} MB/s | {batch / sliding:5.2f}x")
+    finally:
+        sys.argv = argv
+        os.remove(source.name)
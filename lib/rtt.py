@@ -0,0 +1,93 @@
+import time
+from typing import Dict, Hashable, Optional, Set
+
+from .constant import RTO_INITIAL, RTO_MIN, RTO_MAX, RTT_ALPHA, RTT_BETA, RTO_K, CLOCK_GRANULARITY
+
+class RTTEstimator:
+    def __init__(self, rto_min : float = RTO_MIN, rto_max : float = RTO_MAX, rto_initial : float = RTO_INITIAL):
+        # Retransmission timeout of single connection, computed as RFC 6298
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.srtt : Optional[float] = None
+        self.rttvar : Optional[float] = None
+        self.rto = self.clamp(rto_initial)
+        self.backoff_count = 0
+
+        # Karn's rule: send time of every segment waiting for ACK, and segments which were ever resent
+        self.send_time: Dict[Hashable, float] = {}
+        self.retransmitted: Set[Hashable] = set()
+
+        # Statistic, every sample also goes to histogram of connection metrics when one is attached
+        self.samples = 0
+        self.discarded = 0
+        self.resent = 0
+        self.histogram = None
+
+    def clamp(self, rto : float) -> float:
+        return min(max(rto, self.rto_min), self.rto_max)
+
+    # -- Estimation --
+    def update(self, sample : float):
+        # New RTT measurement (second), RFC 6298 section 2
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - sample)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample
+        self.rto = self.clamp(self.srtt + max(CLOCK_GRANULARITY, RTO_K * self.rttvar))
+        self.backoff_count = 0
+        self.samples += 1
+        if self.histogram is not None:
+            self.histogram.observe(sample)
+
+    def get_timeout(self, backoff_count : int = None) -> float:
+        # Current timeout including exponential backoff. Sender with timer per segment gives its own backoff count
+        if backoff_count is None:
+            backoff_count = self.backoff_count
+        return min(self.rto * (2 ** backoff_count), self.rto_max)
+
+    def backoff(self):
+        # Timer expired, double timeout until it reaches maximum
+        if self.get_timeout() < self.rto_max:
+            self.backoff_count += 1
+
+    def clear_backoff(self):
+        # Peer shows progress without giving a valid sample
+        self.backoff_count = 0
+
+    # -- Sampling --
+    def on_send(self, key : Hashable, now : float = None):
+        # Segment (or handshake/FIN step) identified by key is sent. Second send marks it retransmitted
+        if key in self.send_time:
+            self.retransmitted.add(key)
+            self.resent += 1
+        else:
+            self.send_time[key] = time.monotonic() if now is None else now
+
+    def on_ack(self, key : Hashable, now : float = None) -> Optional[float]:
+        # Segment is acknowledged. Sample RTT only if it was never resent (ambiguous otherwise)
+        sent = self.send_time.pop(key, None)
+        if sent is None:
+            return None
+        if key in self.retransmitted:
+            self.retransmitted.discard(key)
+            self.discarded += 1
+            return None
+        sample = (time.monotonic() if now is None else now) - sent
+        self.update(sample)
+        return sample
+
+    def discard_pending(self):
+        # Connection restarts, segments still waiting will never give valid sample
+        self.send_time.clear()
+        self.retransmitted.clear()
+
+    def forget(self, key : Hashable):
+        # Segment acknowledged without own sample (covered by cumulative ACK)
+        self.send_time.pop(key, None)
+        self.retransmitted.discard(key)
+
+    def __str__(self):
+        srtt = "-" if self.srtt is None else f"{self.srtt * 1000:.2f} ms"
+        return f"srtt: {srtt}, rto: {self.get_timeout() * 1000:.1f} ms, samples: {self.samples}, discarded: {self.discarded}"
@@ -0,0 +1,78 @@
+from typing import Iterable, List, Set, Tuple
+
+from .constant import MAX_SACK_BLOCKS
+
+def get_sack_blocks(received : Iterable[int], latest : int = None, limit : int = MAX_SACK_BLOCKS) -> List[Tuple[int, int]]:
+    # Out-of-order sequence numbers held by receiver -> ranges (start, end exclusive).
+    # Range with latest segment goes first (RFC 2018), then lowest ranges, which are closest to the gap sender must fill
+    blocks: List[Tuple[int, int]] = []
+    for sequence in sorted(received):
+        if blocks and blocks[-1][1] == sequence:
+            blocks[-1] = (blocks[-1][0], sequence + 1)
+        else:
+            blocks.append((sequence, sequence + 1))
+    for index, (start, end) in enumerate(blocks):
+        if latest is not None and start <= latest < end:
+            blocks.insert(0, blocks.pop(index))
+            break
+    return blocks[:limit]
+
+class SackScoreboard:
+    def __init__(self):
+        # Sender view of segments after base which receiver reported in SACK blocks
+        self.sacked: Set[int] = set()
+        self.highest = 0    # End of highest reported block, segments under it which are not sacked are lost
+
+        # Holes already resent in current recovery, every hole is resent once per recovery
+        self.retransmitted: Set[int] = set()
+
+        # Statistic
+        self.skipped = 0
+        self.resent = 0
+
+    def __contains__(self, sequence : int) -> bool:
+        return sequence in self.sacked
+
+    def update(self, blocks : Iterable[Tuple[int, int]], base : int, limit : int) -> int:
+        # Merge blocks of one ACK, only range [base, limit) which was actually sent is trusted. Return newly sacked count
+        newly = 0
+        for start, end in blocks:
+            for sequence in range(max(start, base), min(end, limit)):
+                if sequence not in self.sacked:
+                    self.sacked.add(sequence)
+                    newly += 1
+            if start < end <= limit:
+                self.highest = max(self.highest, end)
+        return newly
+
+    def advance(self, base : int):
+        # Cumulative ACK moved base, forget everything under it
+        if self.sacked:
+            self.sacked = {sequence for sequence in self.sacked if sequence >= base}
+        if self.retransmitted:
+            self.retransmitted = {sequence for sequence in self.retransmitted if sequence >= base}
+
+    def has_holes(self, base : int) -> bool:
+        # Receiver reported data past base, so gaps are known exactly
+        return self.highest > base
+
+    def next_holes(self, base : int) -> List[int]:
+        # Lost segments under highest block which are not resent yet in this recovery
+        holes = [sequence for sequence in range(base, self.highest) if sequence not in self.sacked and sequence not in self.retransmitted]
+        self.retransmitted.update(holes)
+        self.resent += len(holes)
+        return holes
+
+    def end_recovery(self):
+        # Recovery finished, holes may be resent again
+        self.retransmitted.clear()
+
+    def reset(self):
+        # Retransmission timeout, receiver may have reneged on sacked segments (RFC 6675) so every block is forgotten
+        # and going back resends them too. Otherwise bogus or reneged SACK is skipped on every round forever
+        self.sacked.clear()
+        self.retransmitted.clear()
+        self.highest = 0
+
+    def __str__(self):
+        return f"holes resent: {self.resent}, sacked segments skipped: {self.skipped}"
@@ -1,10 +1,32 @@
 import struct
+from typing import Tuple
 
 # Import constants
-from .constant import ACK_FLAG, SYN_FLAG, FIN_FLAG
+from .constant import ACK_FLAG, SYN_FLAG, FIN_FLAG, DEFAULT_CHECKSUM, EXTENSION_NONE, EXTENSION_SACK, EXTENSION_PROBE, EXTENSION_NAK, EXTENSION_REPAIR, MAX_SACK_BLOCKS, MAX_NAK_BLOCKS
 
-# Import CRC16
-from .crc16 import CRC16
+# Import checksum engine
+from .checksum import calculate_checksum
+
+# Header layout, compiled once
+# Byte 0-3 seq_num (unsigned int [4]), byte 4-7 ack_num (unsigned int [4]), byte 8 flag (unsigned char [1]),
+# byte 9 extension (unsigned char [1], was padding), byte 10-11 checksum (unsigned short [2]). Native byte order, same as original per-field pack
+HEADER = struct.Struct("=IIBBH")
+HEADER_SIZE = HEADER.size
+
+# Header extension version 1, SACK blocks between header and payload. Every block is start and end (exclusive)
+# of received sequence range. Checksum covers blocks too. Peer which doesn't know extension always sends 0
+SACK_BLOCK = struct.Struct("=II")
+
+# Header extension version 2 marks path MTU probe (padded to probed size) and its ACK, seq_num is probed size
+
+# Header extension version 3 is poll of one-to-many transfer (no block) and NAK answering it. NAK ack_num is cumulative,
+# blocks are missing ranges and seq_num is horizon: every segment under it which isn't in a block was received
+
+# Header extension version 4 is repair segment of forward error correction (no block), seq_num is first data segment
+# of its block and ack_num is block layout (lib.fec)
+
+# Flag name -> flag bit, for set_flag(["SYN", "ACK"])
+FLAG_BITS = {"SYN": SYN_FLAG, "ACK": ACK_FLAG, "FIN": FIN_FLAG}
 
 class SegmentFlag:
     def __init__(self, flag : bytes):
@@ -12,7 +34,7 @@ class SegmentFlag:
         self.syn = flag & SYN_FLAG
         self.ack = flag & ACK_FLAG
         self.fin = flag & FIN_FLAG
-        
+
     def get_flag(self) -> int:
         # Flag getter
         return self.syn | self.ack | self.fin
@@ -22,31 +44,47 @@ class SegmentFlag:
         return struct.pack("B", self.get_flag())
 
 class Segment:
+    # Fixed attribute, no per-instance dict
+    __slots__ = ("seq_num", "ack_num", "flag", "checksum", "payload", "checksum_algorithm", "sack_blocks", "extension")
+
     # -- Internal Function --
     def __init__(self):
         # Initalize segment
         self.seq_num = 0
         self.ack_num = 0
-        self.flag = SegmentFlag(0b0)   # Default to 0
+        self.flag = 0b0     # Flag byte, combination of SYN_FLAG, ACK_FLAG, FIN_FLAG
         self.checksum = 0
-        self.payload = b""  # Binary payload
+        self.payload = b""  # Binary payload (memoryview when parsed from bytes)
+        self.checksum_algorithm = DEFAULT_CHECKSUM  # Negotiated at handshake
+        self.sack_blocks : Tuple[Tuple[int, int], ...] = ()  # Header extension blocks, SACK or NAK ranges
+        self.extension = EXTENSION_NONE  # Header extension version
 
     def __str__(self):
         # Optional, override this method for easier print(segmentA)
         output = ""
         output += f"{'SeqNum':12}\t\t| {self.seq_num}\n"
         output += f"{'AckNum':12}\t\t| {self.ack_num}\n"
-        output += f"{'FlagSYN':12}\t\t| {self.flag.syn >> 1}\n"
-        output += f"{'FlagACK':12}\t\t| {self.flag.ack >> 4}\n"
-        output += f"{'FlagFIN':12}\t\t| {self.flag.fin}\n"
+        output += f"{'FlagSYN':12}\t\t| {(self.flag & SYN_FLAG) >> 1}\n"
+        output += f"{'FlagACK':12}\t\t| {(self.flag & ACK_FLAG) >> 4}\n"
+        output += f"{'FlagFIN':12}\t\t| {self.flag & FIN_FLAG}\n"
         output += f"{'Checksum':24}| {self.checksum}\n"
         output += f"{'MsgSize':24}| {len(self.payload)}\n"
+        if self.sack_blocks:
+            output += f"{'NAK' if self.is_nak() else 'SACK':24}| {' '.join(f'{start}-{end}' for start, end in self.sack_blocks)}\n"
         return output
 
-    def __calculate_checksum(self) -> int:
-        # Calculate checksum with CRC16 class, return checksum
-        crc16 = CRC16(self.payload)
-        return crc16.calculate()
+    def __calculate_checksum(self, algorithm : str = None) -> int:
+        # Calculate checksum with negotiated algorithm, return checksum
+        if self.sack_blocks:
+            return calculate_checksum(self.get_extension_bytes() + bytes(self.payload), algorithm or self.checksum_algorithm)
+        return calculate_checksum(self.payload, algorithm or self.checksum_algorithm)
+
+    def get_extension(self) -> int:
+        # Byte 9 of header
+        return self.extension << 4 | len(self.sack_blocks)
+
+    def get_extension_bytes(self) -> bytes:
+        return b"".join(SACK_BLOCK.pack(start, end) for start, end in self.sack_blocks)
 
 
     # -- Setter --
@@ -60,21 +98,45 @@ class Segment:
     def set_flag(self, flag_list : list):
         new_flag = 0b0
         for flag in flag_list:
-            if flag == "SYN":
-                new_flag = new_flag | SYN_FLAG
-            elif flag == "ACK":
-                new_flag = new_flag | ACK_FLAG
-            elif flag == "FIN":
-                new_flag = new_flag | FIN_FLAG
-        self.flag = SegmentFlag(new_flag)
-        
+            new_flag = new_flag | FLAG_BITS.get(flag, 0)
+        self.flag = new_flag
+
     def set_checksum(self, checksum: int):
         self.checksum = checksum
 
+    def set_checksum_algorithm(self, algorithm : str):
+        self.checksum_algorithm = algorithm
+
+    def set_sack_blocks(self, blocks):
+        # At most MAX_SACK_BLOCKS ranges fit in header extension, first ones are kept
+        self.sack_blocks = tuple(blocks)[:MAX_SACK_BLOCKS]
+        self.extension = EXTENSION_SACK if self.sack_blocks else EXTENSION_NONE
+
+    def set_nak_blocks(self, blocks):
+        # Poll (no block) or NAK, at most MAX_NAK_BLOCKS missing ranges fit in header extension
+        self.sack_blocks = tuple(blocks)[:MAX_NAK_BLOCKS]
+        self.extension = EXTENSION_NAK
+
+    def set_probe(self, size : int, padding : bool = True):
+        # Path MTU probe of size bytes (header included), or its ACK without padding
+        self.extension = EXTENSION_PROBE
+        self.sack_blocks = ()
+        self.seq_num = size
+        self.ack_num = size
+        self.payload = bytes(max(size - HEADER_SIZE, 0)) if padding else b""
+
+    def set_repair(self, start : int, layout : int, payload : bytes):
+        # Repair segment of block starting at data segment start
+        self.extension = EXTENSION_REPAIR
+        self.sack_blocks = ()
+        self.seq_num = start
+        self.ack_num = layout
+        self.payload = payload
+
 
     # -- Getter --
-    def get_flag(self) -> SegmentFlag:
-        return self.flag.get_flag()
+    def get_flag(self) -> int:
+        return self.flag
 
     def get_header(self) -> dict:
         return {"seq_num": self.seq_num, "ack_num": self.ack_num}
@@ -82,31 +144,113 @@ class Segment:
     def get_payload(self) -> bytes:
         return self.payload
 
+    def get_sack_blocks(self) -> Tuple[Tuple[int, int], ...]:
+        return self.sack_blocks if self.extension == EXTENSION_SACK else ()
+
+    def get_nak_blocks(self) -> Tuple[Tuple[int, int], ...]:
+        return self.sack_blocks if self.extension == EXTENSION_NAK else ()
+
+    def is_probe(self) -> bool:
+        return self.extension == EXTENSION_PROBE
+
+    def is_nak(self) -> bool:
+        return self.extension == EXTENSION_NAK
+
+    def is_repair(self) -> bool:
+        return self.extension == EXTENSION_REPAIR
+
 
     # -- Marshalling --
     def set_from_bytes(self, src : bytes):
-        # From pure bytes, unpack() and set into python variable
-        self.seq_num = struct.unpack("I", src[0:4])[0]               # Byte 0-3 (unsigned int [4])
-        self.ack_num = struct.unpack("I", src[4:8])[0]               # Byte 4-7 (unsigned int [4])
-        self.flag = SegmentFlag(struct.unpack("B", src[8:9])[0])     # Byte 8 (unsigned char [1])
-        # Byte 9 empty -> padding
-        self.checksum = struct.unpack("H", src[10:12])[0]            # Byte 10-11 (unsigned short [2])
-        self.payload = src[12:]                                      # Byte 12-end -> payload
-
-    def get_bytes(self) -> bytes:
+        # From pure bytes, unpack header in one call. Payload is a memoryview into src, no copy
+        self.seq_num, self.ack_num, self.flag, extension, self.checksum = HEADER.unpack_from(src)
+        offset = HEADER_SIZE
+        self.extension = extension >> 4
+        if self.extension == EXTENSION_SACK or self.extension == EXTENSION_NAK:
+            # Unknown version is left in payload, checksum tells it apart
+            count = min(extension & 0x0F, (len(src) - HEADER_SIZE) // SACK_BLOCK.size)
+            self.sack_blocks = tuple(SACK_BLOCK.unpack_from(src, HEADER_SIZE + i * SACK_BLOCK.size) for i in range(count))
+            offset += count * SACK_BLOCK.size
+        else:
+            self.sack_blocks = ()
+        self.payload = memoryview(src)[offset:]
+
+    def get_bytes(self, checksum_algorithm : str = None) -> bytes:
         # Convert this object to pure bytes
-        self.checksum = self.__calculate_checksum()
+        # Shared segment (server file segment) can be encoded for other client algorithm without changing it
+        self.checksum = self.__calculate_checksum(checksum_algorithm)
+        header = HEADER.pack(self.seq_num, self.ack_num, self.flag, self.get_extension(), self.checksum)
+        if self.sack_blocks:
+            header += self.get_extension_bytes()
+        return header + self.payload
+
+    def pack_into(self, buffer : bytearray, offset : int = 0, checksum_algorithm : str = None) -> int:
+        # Encode into caller buffer at offset, return frame length
+        self.checksum = self.__calculate_checksum(checksum_algorithm)
+        HEADER.pack_into(buffer, offset, self.seq_num, self.ack_num, self.flag, self.get_extension(), self.checksum)
+        start = offset + HEADER_SIZE
+        for block in self.sack_blocks:
+            SACK_BLOCK.pack_into(buffer, start, *block)
+            start += SACK_BLOCK.size
+        end = start + len(self.payload)
+        buffer[start:end] = self.payload
+        return end - offset
+
+
+    # -- Checksum --
+    def valid_checksum(self, checksum_algorithm : str = None) -> bool:
+        # Use __calculate_checksum() and check integrity of this object.
+        # Handshake segment is checked with default algorithm even when other one is negotiated
+        return self.__calculate_checksum(checksum_algorithm) == self.checksum
+
+
+# Benchmark against original per-field codec
+# Run with: python -m lib.segment
+if __name__ == "__main__":
+    import time
+    from .constant import PAYLOAD_SIZE
+
+    def legacy_get_bytes(segment):
+        # Original get_bytes, five pack calls and repeated concatenation
         res = b""
-        res += struct.pack("I", self.seq_num)        # Byte 0-3 (unsigned int [4])
-        res += struct.pack("I", self.ack_num)        # Byte 4-7 (unsigned int [4])
-        res += self.flag.get_flag_bytes()            # Byte 8 (unsigned char [1])
-        res += struct.pack("x")                      # Byte 9 -> padding
-        res += struct.pack("H", self.checksum)       # Byte 10-11 (unsigned short [2])
-        res += self.payload                          # Byte 12-end -> payload
+        res += struct.pack("I", segment.seq_num)
+        res += struct.pack("I", segment.ack_num)
+        res += SegmentFlag(segment.flag).get_flag_bytes()
+        res += struct.pack("x")
+        res += struct.pack("H", segment.checksum)
+        res += segment.payload
         return res
 
+    def legacy_set_from_bytes(src):
+        # Original set_from_bytes, four unpack calls, new flag object and payload copy
+        seq_num = struct.unpack("I", src[0:4])[0]
+        ack_num = struct.unpack("I", src[4:8])[0]
+        flag = SegmentFlag(struct.unpack("B", src[8:9])[0])
+        checksum = struct.unpack("H", src[10:12])[0]
+        payload = src[12:]
+        return seq_num, ack_num, flag, checksum, payload
 
-    # -- Checksum --
-    def valid_checksum(self) -> bool:
-        # Use __calculate_checksum() and check integrity of this object
-        return self.__calculate_checksum() == self.checksum
+    segment = Segment()
+    segment.set_header({"seq_num": 7, "ack_num": 3})
+    segment.set_flag(["ACK"])
+    segment.set_payload(bytes(PAYLOAD_SIZE))
+    frame = segment.get_bytes()
+    assert legacy_get_bytes(segment) == frame
+    buffer = bytearray(len(frame))
+
+    def bench(name, function, rounds=20000):
+        start = time.perf_counter()
+        for i in range(rounds):
+            function()
+        elapsed = time.perf_counter() - start
+        print(f"{name:24}| {elapsed / rounds * 1e6:8.2f} us")
+        return elapsed
+
+    # Checksum excluded, only codec is compared
+    HEADER.pack_into(buffer, 0, 7, 3, ACK_FLAG, 0, 0)
+    legacy_encode = bench("legacy encode", lambda: legacy_get_bytes(segment))
+    fast_encode = bench("struct encode", lambda: HEADER.pack(segment.seq_num, segment.ack_num, segment.flag, 0, 0) + segment.payload)
+    bench("pack_into header", lambda: HEADER.pack_into(buffer, 0, segment.seq_num, segment.ack_num, segment.flag, 0, 0))
+    legacy_decode = bench("legacy decode", lambda: legacy_set_from_bytes(frame))
+    fast_decode = bench("memoryview decode", lambda: segment.set_from_bytes(frame))
+    print(f"Speedup encode x{legacy_encode / fast_encode:.1f}, decode x{legacy_decode / fast_decode:.1f}")
@@ -0,0 +1,440 @@
+import sys
+import heapq
+import random
+import socket
+import threading
+import time as real_time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .bufferpool import BufferPool
+from .segment import HEADER_SIZE
+from .constant import DEFAULT_IP, DEFAULT_BROADCAST_PORT, DEFAULT_PORT, SEGMENT_SIZE, TIMEOUT, RECEIVE_BUFFER_SIZE
+
+# Modules whose time module is replaced by virtual clock while simulation runs
+CLOCK_MODULES = ["server", "client", "lib.rtt", "lib.congestion", "lib.metrics", "lib.trace"]
+
+SIMULATION_MAX_TIME = 3600.0
+
+class SimulationError(Exception):
+    # Simulated transfer can't go on: every actor waits forever, or virtual time passed its limit
+    pass
+
+class VirtualClock:
+    def __init__(self, network : "SimulatedNetwork"):
+        # Stand-in for time module inside simulated code. Time only moves when every actor waits,
+        # anything else (strftime, ...) comes from real time module
+        self.network = network
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic_ns(self) -> int:
+        return int(self.now * 1e9)
+
+    def time_ns(self) -> int:
+        return int(self.now * 1e9)
+
+    def sleep(self, seconds : float):
+        self.network.wait(None, seconds)
+
+    def __getattr__(self, name):
+        return getattr(real_time, name)
+
+class Actor:
+    def __init__(self, name : str, target : Callable[[], None]):
+        # Thread of simulated code. Only one actor runs at a time, the rest wait for datagram or deadline
+        self.name = name
+        self.target = target
+        self.thread : Optional[threading.Thread] = None
+        self.ready = True
+        self.done = False
+        self.deadline = float("inf")
+        self.error : Optional[BaseException] = None     # Raised inside actor when it is woken
+        self.exception : Optional[BaseException] = None # Raised by actor itself
+
+class SimulatedConnection:
+    def __init__(self, network : "SimulatedNetwork", ip : str, port : int, broadcast_port : int, client_port : Optional[int] = None):
+        # Same interface as Connection, datagrams go through network in virtual time instead of UDP socket
+        self.network = network
+        self.ip = ip
+        self.port = broadcast_port
+        self.client_port = client_port
+        self.address = (ip, port)
+        self.timeout = None
+
+        # Delivered datagram is immutable bytes already, so it is handed out without copy into pooled buffer.
+        # Empty pool only stands in for the one of real connection in log
+        self.segment_size = SEGMENT_SIZE
+        self.pool = BufferPool(0, SEGMENT_SIZE)
+        self.send_lock = threading.Lock()
+        self.mtu_discovery = True
+        self.gso = False
+        self.group_socket = None
+
+        # Delivered datagrams not read yet, dropped when receive buffer is full like UDP socket
+        self.inbox: Deque[Tuple[bytes, Tuple[str, int]]] = deque()
+        self.inbox_bytes = 0
+        self.receive_buffer = network.receive_buffer
+        self.waiter : Optional[Actor] = None
+
+    def send_data(self, msg, dest : Tuple[str, int]):
+        self.network.send(self, bytes(msg), dest)
+
+    def send_batch(self, frames : List[bytes], dest : Tuple[str, int]) -> int:
+        for frame in frames:
+            self.network.send(self, bytes(frame), dest)
+        return len(frames)
+
+    def send_probe(self, frame : bytes, dest : Tuple[str, int]) -> bool:
+        # Probe larger than path MTU is dropped by network, never refused locally
+        self.network.send(self, bytes(frame), dest)
+        return True
+
+    def set_receive_buffer(self, size : int) -> int:
+        # Granted size is reported doubled like Linux
+        self.receive_buffer = min(size, self.network.receive_buffer)
+        return self.receive_buffer * 2
+
+    def set_multicast(self, ttl : int = 0):
+        pass
+
+    def join_group(self, group : Tuple[str, int]) -> bool:
+        # No multicast group in simulated network, server sends unicast copy instead
+        return False
+
+    def set_segment_size(self, size : int):
+        self.segment_size = size
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def deliver(self, data : bytes, source : Tuple[str, int]) -> bool:
+        if self.inbox_bytes + len(data) > self.receive_buffer:
+            return False
+        self.inbox.append((data, source))
+        self.inbox_bytes += len(data)
+        return True
+
+    def receive(self) -> Tuple[bytes, Tuple[str, int]]:
+        data, source = self.inbox.popleft()
+        self.inbox_bytes -= len(data)
+        return data[:self.segment_size], source
+
+    def listen_single_segment(self, timeout=TIMEOUT):
+        self.set_timeout(timeout)
+        return self.network.wait(self, timeout)
+
+    def listen_pooled_segment(self, timeout=TIMEOUT) -> Tuple[memoryview, Tuple[str, int], bytearray]:
+        self.set_timeout(timeout)
+        data, address = self.network.wait(self, timeout)
+        return memoryview(data), address, None
+
+    def release_buffer(self, buffer : bytearray):
+        pass
+
+    def close_socket(self):
+        self.network.endpoints.pop(self.address, None)
+
+    def __str__(self):
+        return f"simulated {self.address[0]}:{self.address[1]}, queued: {len(self.inbox)}"
+
+class SimulatedNetwork:
+    def __init__(self, seed : Optional[int] = None, delay : float = 0.0, rate : Optional[float] = None, loss : float = 0.0, reorder : float = 0.0, reorder_delay : float = 0.002,
+                 corrupt : float = 0.0, mtu : Optional[int] = None, receive_buffer : int = RECEIVE_BUFFER_SIZE, max_time : float = SIMULATION_MAX_TIME):
+        # In-memory network of SimulatedConnection in virtual time. Every datagram gets one-way delay (second), waits for
+        # its link at rate (bytes per second), and is dropped with probability loss or when larger than mtu. Probability
+        # reorder holds it reorder_delay longer, so later ones overtake it. Probability corrupt flips one random bit past
+        # header (corrupt header would be dropped by UDP checksum). Actors run one at a time in fixed order,
+        # so same seed gives exactly same transfer
+        self.delay = delay
+        self.rate = rate
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.corrupt = corrupt
+        self.mtu = mtu
+        self.receive_buffer = receive_buffer
+        self.max_time = max_time
+        self.random = random.Random(seed)
+        self.clock = VirtualClock(self)
+        self.impaired = True
+
+        self.endpoints: Dict[Tuple[str, int], SimulatedConnection] = {}
+        self.link_free: Dict[Tuple[Tuple[str, int], Tuple[str, int]], float] = {}
+        self.events: List[Tuple[float, int, bytes, Tuple[str, int], Tuple[str, int]]] = []
+        self.order = 0
+
+        # Actor holding the turn, switched under condition
+        self.condition = threading.Condition()
+        self.actors: List[Actor] = []
+        self.current : Optional[Actor] = None
+        self.local = threading.local()
+
+        # Statistic
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.reordered = 0
+        self.corrupted = 0
+        self.oversized = 0
+        self.overflowed = 0
+
+    def create_connection(self, ip : str = DEFAULT_IP, broadcast_port : int = DEFAULT_BROADCAST_PORT, port : int = DEFAULT_PORT, is_server : bool = False) -> SimulatedConnection:
+        # Same arguments as Connection, server is bound at broadcast port and client at its own port
+        if is_server:
+            connection = SimulatedConnection(self, ip, broadcast_port, broadcast_port)
+        else:
+            connection = SimulatedConnection(self, ip, port, broadcast_port, port)
+        self.endpoints[connection.address] = connection
+        return connection
+
+    @contextmanager
+    def reliable(self):
+        # Datagrams sent inside are never lost nor reordered, e.g. connection request which real client doesn't retry
+        self.impaired = False
+        try:
+            yield
+        finally:
+            self.impaired = True
+
+    def send(self, connection : SimulatedConnection, data : bytes, dest : Tuple[str, int]):
+        # Datagram leaves after previous one on same link is serialized, then arrives after delay
+        self.sent += 1
+        if self.mtu and len(data) > self.mtu:
+            self.oversized += 1
+            return
+        if self.impaired and self.loss and self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        if self.impaired and self.corrupt and len(data) > HEADER_SIZE and self.random.random() < self.corrupt:
+            damaged = bytearray(data)
+            damaged[self.random.randrange(HEADER_SIZE, len(data))] ^= 1 << self.random.randrange(8)
+            data = bytes(damaged)
+            self.corrupted += 1
+        now = self.clock.now
+        link = (connection.address, dest)
+        departure = max(now, self.link_free.get(link, 0.0))
+        if self.rate:
+            departure += len(data) / self.rate
+        self.link_free[link] = departure
+        arrival = departure + self.delay
+        if self.impaired and self.reorder and self.random.random() < self.reorder:
+            arrival += self.reorder_delay
+            self.reordered += 1
+        heapq.heappush(self.events, (arrival, self.order, data, connection.address, dest))
+        self.order += 1
+
+    # -- Scheduler --
+    def wait(self, connection : Optional[SimulatedConnection], timeout : Optional[float]) -> Tuple[bytes, Tuple[str, int]]:
+        # Block calling actor until datagram reaches connection or timeout passes in virtual time.
+        # Connection None only waits for timeout (sleep)
+        with self.condition:
+            actor = self.local.actor
+            if connection is not None and connection.inbox:
+                return connection.receive()
+            actor.ready = False
+            actor.deadline = self.clock.now + timeout if timeout is not None else float("inf")
+            if connection is not None:
+                connection.waiter = actor
+            self.switch(actor)
+            if connection is not None:
+                connection.waiter = None
+            if actor.error is not None:
+                error, actor.error = actor.error, None
+                raise error
+            if connection is not None and connection.inbox:
+                return connection.receive()
+            if connection is not None:
+                raise socket.timeout("timed out")
+            return None
+
+    def switch(self, actor : Optional[Actor]):
+        # Give turn to next actor and wait for it to come back (called with condition held)
+        self.current = self.get_next()
+        self.condition.notify_all()
+        if actor is not None:
+            while self.current is not actor:
+                self.condition.wait()
+
+    def get_next(self) -> Optional[Actor]:
+        # Ready actor in registration order. When every actor waits, virtual time jumps to next delivery or deadline,
+        # delivery first when both are due at the same time
+        while True:
+            for actor in self.actors:
+                if actor.ready and not actor.done:
+                    return actor
+            waiting = [actor for actor in self.actors if not actor.done]
+            if not waiting:
+                return None
+            deadline = min(actor.deadline for actor in waiting)
+            arrival = self.events[0][0] if self.events else float("inf")
+            if min(deadline, arrival) > self.max_time:
+                for actor in waiting:
+                    actor.error = SimulationError(f"{actor.name} still waiting at virtual time {self.clock.now:.3f}s")
+                    actor.ready = True
+                continue
+            if arrival <= deadline:
+                _, _, data, source, dest = heapq.heappop(self.events)
+                self.clock.now = max(self.clock.now, arrival)
+                connection = self.endpoints.get(dest)
+                if connection is None:
+                    continue
+                if not connection.deliver(data, source):
+                    self.overflowed += 1
+                    continue
+                self.delivered += 1
+                if connection.waiter is not None:
+                    connection.waiter.ready = True
+            else:
+                self.clock.now = max(self.clock.now, deadline)
+                for actor in waiting:
+                    if actor.deadline <= deadline:
+                        actor.ready = True
+
+    def run_actor(self, actor : Actor):
+        self.local.actor = actor
+        with self.condition:
+            while self.current is not actor:
+                self.condition.wait()
+        try:
+            actor.target()
+        except BaseException as e:
+            actor.exception = e
+        finally:
+            with self.condition:
+                actor.done = True
+                self.switch(None)
+
+    def run(self, *targets : Callable[[], None]):
+        # Run every target as actor until all of them return, in virtual time. First exception of actor is raised here
+        self.actors = [Actor(getattr(target, "__name__", f"actor {index}"), target) for index, target in enumerate(targets)]
+        originals = {}
+        for name in CLOCK_MODULES:
+            module = sys.modules.get(name)
+            if module is not None and getattr(module, "time", None) is real_time:
+                originals[name] = module
+                module.time = self.clock
+        try:
+            for actor in self.actors:
+                actor.thread = threading.Thread(target=self.run_actor, args=(actor,), name=actor.name, daemon=True)
+                actor.thread.start()
+            with self.condition:
+                self.current = self.get_next()
+                self.condition.notify_all()
+            for actor in self.actors:
+                actor.thread.join()
+        finally:
+            for module in originals.values():
+                module.time = real_time
+        for actor in self.actors:
+            if actor.exception is not None:
+                raise actor.exception
+
+    def __str__(self):
+        return (f"virtual time: {self.clock.now:.3f}s, sent: {self.sent}, delivered: {self.delivered}, dropped: {self.dropped}, "
+                f"reordered: {self.reordered}, corrupted: {self.corrupted}, oversized: {self.oversized}, overflowed: {self.overflowed}")
+
+def simulate_transfer(source : str, seed : Optional[int] = None, server_args : List[str] = (), client_args : List[str] = (), output : str = "simulated.bin",
+                      server_port : int = DEFAULT_BROADCAST_PORT, client_port : int = DEFAULT_PORT, **impairment) -> Dict[str, float]:
+    # Send source from real Server to real Client over simulated network, arguments as given on command line.
+    # Output lands in out/ like real client. Elapsed time is virtual, until server finishes FIN teardown
+    from server import Server
+    from client import Client
+    from .constant import TIMEOUT_LISTEN
+
+    network = SimulatedNetwork(seed, **impairment)
+    argv = sys.argv
+    try:
+        sys.argv = ["server.py", str(server_port), source, *server_args]
+        server = Server(network.create_connection(broadcast_port=server_port, is_server=True))
+        sys.argv = ["client.py", str(client_port), str(server_port), output, *client_args]
+        client = Client(network.create_connection(broadcast_port=server_port, port=client_port))
+    finally:
+        sys.argv = argv
+    result = {}
+
+    def serve():
+        data, address = server.connection.listen_single_segment(TIMEOUT_LISTEN)
+        server.client_list.append(address)
+        server.start_file_transfer()
+        result["elapsed"] = network.clock.now
+
+    def receive():
+        with network.reliable():
+            client.connect()
+        client.three_way_handshake()
+        result["complete"] = client.listen_file_transfer()
+        client.shutdown()
+
+    try:
+        network.run(serve, receive)
+    finally:
+        server.list_segment.close()
+        server.file.close()
+    totals = server.metrics.snapshot()["process"]
+    client_totals = client.metrics.snapshot()["process"]
+    result.update({
+        "goodput": server.filesize / result["elapsed"] if result["elapsed"] else 0.0,
+        "segments_sent": totals["segments_sent_total"],
+        "segments_resent": totals["segments_resent_total"],
+        "timeouts": totals["timeouts_total"],
+        "repairs_sent": totals["repairs_sent_total"],
+        "segments_recovered": client_totals["segments_recovered_total"],
+        "ecc_corrected": client_totals["ecc_corrected_total"],
+        "ecc_uncorrectable": client_totals["ecc_uncorrectable_total"],
+        "datagrams": network.sent,
+        "dropped": network.dropped,
+        "corrupted": network.corrupted,
+    })
+    return result
+
+
+# Benchmark of simulator, seeded transfers over lossy network per second of wall time, and same seed giving same transfer.
+# Real Server and Client code (about 50 us per datagram) bounds it, not the simulated network: hundreds of 64 KB transfers
+# per second rather than thousands, each more than 100x faster than real time.
+# Run with: python -m lib.simulator [transfers]
+if __name__ == "__main__":
+    import os
+    import filecmp
+    import logging
+    import tempfile
+
+    TRANSFERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    FILE_SIZE = 64 * 1024
+
+    source = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+    source.write(os.urandom(FILE_SIZE))
+    source.close()
+    logging.disable(logging.CRITICAL)
+    network_args = {"delay": 0.025, "rate": 1024 * 1024, "loss": 0.05, "reorder": 0.02}
+    server_args = ["--segment-size", "1472"]
+
+    try:
+        for arq in ("gbn", "sr"):
+            start = real_time.perf_counter()
+            virtual = 0.0
+            resent = 0
+            for seed in range(TRANSFERS):
+                result = simulate_transfer(source.name, seed, server_args + ["--arq", arq], **network_args)
+                virtual += result["elapsed"]
+                resent += result["segments_resent"]
+            elapsed = real_time.perf_counter() - start
+            assert filecmp.cmp(source.name, "out/simulated.bin", shallow=False)
+            print(f"{arq:4}| {TRANSFERS} transfers of {FILE_SIZE // 1024} KB in {elapsed:6.2f}s ({TRANSFERS / elapsed:7.1f}/s) | "
+                  f"virtual {virtual:8.1f}s ({virtual / elapsed:6.1f}x) | resent {resent / TRANSFERS:5.1f} per transfer")
+        first = simulate_transfer(source.name, 42, server_args, **network_args)
+        second = simulate_transfer(source.name, 42, server_args, **network_args)
+        print(f"seed 42 twice: {'identical' if first == second else 'DIFFERENT'} ({first})")
+    finally:
+        os.remove(source.name)
+        if os.path.exists("out/simulated.bin"):
+            os.remove("out/simulated.bin")
@@ -0,0 +1,132 @@
+import os
+import time
+import struct
+import itertools
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from .constant import TRACE_SIZE
+
+# Event record: monotonic timestamp (ns), connection id, event type, seq_num, ack_num, window
+TRACE_RECORD = struct.Struct("=QHBxIII")
+
+# Trace file: magic, offset from monotonic to wall clock (ns), number of records, byte length of connection table.
+# Table is peer label then "ip:port" of every connection id, one per line, records follow in chronological order
+TRACE_HEADER = struct.Struct("=4sqII")
+TRACE_MAGIC = b"TRC1"
+
+# Event type, each one replaces a per-segment debug log line. Slot never written is 0 and skipped by decoder
+TRACE_EMPTY = 0
+TRACE_SEND_SEGMENT = 1
+TRACE_RESEND_SEGMENT = 2
+TRACE_RECEIVE_ACK = 3
+TRACE_DUPLICATE_ACK = 4
+TRACE_SELECTIVE_ACK = 5
+TRACE_TIMEOUT = 6
+TRACE_RECEIVE_SEGMENT = 7
+TRACE_BUFFER_SEGMENT = 8
+TRACE_SEND_ACK = 9
+
+TRACE_MESSAGES = {
+    TRACE_SEND_SEGMENT: "Sending Segment {seq}",
+    TRACE_RESEND_SEGMENT: "Resending Segment {seq}",
+    TRACE_RECEIVE_ACK: "Received ACK {ack}",
+    TRACE_DUPLICATE_ACK: "Received duplicate ACK {ack}",
+    TRACE_SELECTIVE_ACK: "Received ACK Segment {seq} (next {ack})",
+    TRACE_TIMEOUT: "ACK {ack} timeout",
+    TRACE_RECEIVE_SEGMENT: "Received Segment {seq}",
+    TRACE_BUFFER_SEGMENT: "Buffered Segment {seq} [Out-Of-Order]",
+    TRACE_SEND_ACK: "Sending ACK {ack}",
+}
+
+class Tracer:
+    def __init__(self, path : str, capacity : int = TRACE_SIZE, peer : str = "Client"):
+        # Binary event trace, fixed size records packed into preallocated ring buffer, oldest event is overwritten.
+        # Caller keeps tracer None when tracing is off, so disabled trace costs a single comparison per event.
+        # peer is label of remote side, "Client" for server trace and "Server" for client trace
+        self.path = path
+        self.capacity = max(capacity, 1)
+        self.peer = peer
+        self.buffer = bytearray(self.capacity * TRACE_RECORD.size)
+        self.clock_offset = time.time_ns() - time.monotonic_ns()
+
+        # next() of itertools.count is atomic, so client threads never get the same slot
+        self.counter = itertools.count()
+        self.ids: Dict[Tuple[str, int], int] = {}
+        self.lock = threading.Lock()
+
+    def get_id(self, address : Tuple[str, int]) -> int:
+        # Connection id of address, looked up once per transfer rather than per event
+        conn = self.ids.get(address)
+        if conn is None:
+            with self.lock:
+                conn = self.ids.setdefault(address, len(self.ids))
+        return conn
+
+    def record(self, conn : int, event : int, seq : int = 0, ack : int = 0, window : int = 0):
+        slot = next(self.counter) % self.capacity
+        TRACE_RECORD.pack_into(self.buffer, slot * TRACE_RECORD.size, time.monotonic_ns(), conn, event, seq, ack, window)
+
+    def dump(self, path : str = None) -> int:
+        # Snapshot of ring buffer in chronological order, return number of slots written. Taking a count consumes
+        # one slot, it is cleared so decoder skips it
+        count = next(self.counter) + 1
+        TRACE_RECORD.pack_into(self.buffer, ((count - 1) % self.capacity) * TRACE_RECORD.size, 0, 0, TRACE_EMPTY, 0, 0, 0)
+        records = min(count, self.capacity)
+        start = (count % self.capacity) * TRACE_RECORD.size if count > self.capacity else 0
+        snapshot = bytes(self.buffer)
+        addresses = sorted(self.ids, key=self.ids.get)
+        table = "\n".join([self.peer] + [f"{ip}:{port}" for ip, port in addresses]).encode()
+
+        with open(path or self.path, "wb") as file:
+            file.write(TRACE_HEADER.pack(TRACE_MAGIC, self.clock_offset, records, len(table)))
+            file.write(table)
+            file.write(snapshot[start:records * TRACE_RECORD.size])
+            if count > self.capacity:
+                file.write(snapshot[:start])
+        return records
+
+    def __str__(self):
+        return f"capacity: {self.capacity} events, connections: {len(self.ids)}, file: {self.path}"
+
+def read_trace(path : str) -> Iterator[Tuple[int, str, Tuple[str, int], int, int, int, int]]:
+    # Records of trace file -> (wall clock ns, peer label, address, event, seq_num, ack_num, window)
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, clock_offset, records, table_size = TRACE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"{path} isn't a trace file")
+    table = data[TRACE_HEADER.size:TRACE_HEADER.size + table_size].decode().split("\n")
+    peer = table[0]
+    addresses: List[Tuple[str, int]] = []
+    for entry in table[1:]:
+        ip, _, port = entry.rpartition(":")
+        addresses.append((ip, int(port)))
+
+    offset = TRACE_HEADER.size + table_size
+    for timestamp, conn, event, seq, ack, window in TRACE_RECORD.iter_unpack(data[offset:offset + records * TRACE_RECORD.size]):
+        if event == TRACE_EMPTY:
+            continue
+        address = addresses[conn] if conn < len(addresses) else ("?", 0)
+        yield timestamp + clock_offset, peer, address, event, seq, ack, window
+
+def format_event(timestamp : int, peer : str, address : Tuple[str, int], event : int, seq : int, ack : int, window : int) -> str:
+    # Same line as debug log it replaces, window is appended when event carries one
+    moment = datetime.fromtimestamp(timestamp / 1e9)
+    message = TRACE_MESSAGES.get(event, "Unknown event {event}").format(seq=seq, ack=ack, event=event)
+    if window:
+        message += f" [window: {window}]"
+    return f"{moment:%Y-%m-%d %H:%M:%S},{moment.microsecond // 1000:03d} - [!] [{peer} {address[0]}:{address[1]}] {message}"
+
+
+# Decoder, prints trace file as log lines
+# Run with: python -m lib.trace [trace file]
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2 or not os.path.exists(sys.argv[1]):
+        print("Usage: python -m lib.trace [trace file]")
+        sys.exit(1)
+    for record in read_trace(sys.argv[1]):
+        print(format_event(*record))
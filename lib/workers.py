@@ -0,0 +1,133 @@
+import os
+import mmap
+import signal
+import threading
+from typing import Callable, List, Optional
+
+class WorkerPool:
+    def __init__(self, count : int):
+        # Supervisor of multi-process server. Workers are forked, so memory mapped before start() is shared by all of them.
+        # Every worker has one byte in shared idle table, set while its socket times out without any datagram
+        self.count = count
+        self.index : Optional[int] = None   # Index of this worker, None in supervisor
+        self.pids: List[int] = []
+        self.idle = mmap.mmap(-1, count)
+
+    def start(self, target : Callable[[int], None]):
+        # Fork every worker, child runs target(index) and never returns into supervisor code
+        for index in range(self.count):
+            pid = os.fork()
+            if pid == 0:
+                self.index = index
+                self.pids = []
+                os._exit(self.run_worker(target))
+            self.pids.append(pid)
+
+    def run_worker(self, target : Callable[[int], None]) -> int:
+        # Exit code of worker. Client threads still running are waited, interpreter shutdown is skipped by os._exit
+        code = 0
+        try:
+            target(self.index)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except BaseException:
+            code = 1
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:
+                thread.join()
+        return code
+
+    def wait(self) -> List[int]:
+        # Wait for every worker, exit code in worker order. Interrupted supervisor terminates workers first
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: self.terminate())
+        codes = []
+        try:
+            for pid in self.pids:
+                while True:
+                    try:
+                        _, status = os.waitpid(pid, 0)
+                        break
+                    except InterruptedError:
+                        continue
+                codes.append(os.waitstatus_to_exitcode(status))
+        except KeyboardInterrupt:
+            self.terminate()
+            raise
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        return codes
+
+    def terminate(self):
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # -- Idle Table --
+    def on_activity(self):
+        # Datagram received, this worker isn't idle anymore
+        if self.idle[self.index]:
+            self.idle[self.index] = 0
+
+    def on_idle(self) -> bool:
+        # Socket timed out. Return True when every worker is idle, so none of them still serves client.
+        # Single worker closing its socket earlier would make kernel hash some clients of other workers into another socket
+        self.idle[self.index] = 1
+        return all(self.idle[:])
+
+    def __str__(self):
+        return f"workers: {self.count}, pids: {' '.join(map(str, self.pids)) or '-'}"
+
+
+# Benchmark of multi-process server, aggregate throughput of concurrent clients at 1 to 8 workers.
+# Scaling needs as many free cores as workers, clients share the same machine
+# Run with: python -m lib.workers [clients]
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+    import subprocess
+    from .constant import INCOMPLETE_SUFFIX
+
+    SERVER_PORT = 9980
+    CLIENT_PORT = 8900
+    FILE_SIZE = 8 * 1024 * 1024
+    CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+
+    source = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+    source.write(os.urandom(FILE_SIZE))
+    source.close()
+
+    def transfer(workers : int) -> float:
+        # Single worker is plain server, which asks for paralelization first
+        server = subprocess.Popen([sys.executable, "server.py", str(SERVER_PORT), source.name, "--workers", str(workers)],
+                                  stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        server.stdin.write(b"y\n")
+        server.stdin.close()
+        time.sleep(1)
+        start = time.perf_counter()
+        clients = [subprocess.Popen([sys.executable, "client.py", str(CLIENT_PORT + i), str(SERVER_PORT), f"workers_benchmark_{i}.bin"],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for i in range(CLIENTS)]
+        # Client exits once FIN teardown is done. Output size isn't progress, it is preallocated as soon as metadata arrives
+        for client in clients:
+            client.wait()
+        elapsed = time.perf_counter() - start
+        outputs = [f"out/workers_benchmark_{i}.bin" for i in range(CLIENTS)]
+        incomplete = [output for output in outputs if not os.path.exists(output)]
+        if incomplete:
+            print(f"[!] {len(incomplete)} of {CLIENTS} transfers incomplete")
+
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+        for output in outputs:
+            for path in (output, output + INCOMPLETE_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
+        return elapsed
+
+    print(f"{'workers':8}| {'elapsed':>9} | {'aggregate':>12}")
+    for workers in (1, 2, 4, 8):
+        elapsed = transfer(workers)
+        print(f"{workers:<8}| {elapsed:8.3f}s | {FILE_SIZE * CLIENTS / elapsed / (1024 * 1024):7.2f} MB/s")
+    os.remove(source.name)
@@ -3,19 +3,34 @@ import logging
 import colorlog
 import threading
 import time
+from functools import partial
 
-from math import ceil
 import socket
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple, Dict
 
 from lib.connection import Connection
-from lib.segment import Segment
+from lib.segment import Segment, HEADER_SIZE
+from lib.options import ConnectionOptions
+from lib.framecache import FrameCache, SharedFrameCache
+from lib.hamming import encode_frame, get_data_size
+from lib.fec import RepairEncoder
+from lib.provider import SegmentProvider
+from lib.asyncserver import AsyncServerEngine
+from lib.demux import Demultiplexer
+from lib.rtt import RTTEstimator
+from lib.congestion import CongestionControl, get_congestion_control
+from lib.sack import SackScoreboard
+from lib.pmtu import PathMTUSearch
+from lib.multicast import MulticastMember, MulticastSession, parse_group
+from lib.workers import WorkerPool
+from lib.metrics import MetricsRegistry, MetricsEndpoint, ConnectionMetrics
+from lib.trace import Tracer, TRACE_SEND_SEGMENT, TRACE_RESEND_SEGMENT, TRACE_RECEIVE_ACK, TRACE_DUPLICATE_ACK, TRACE_SELECTIVE_ACK, TRACE_TIMEOUT
 from lib.argparse import FileTransferArgumentParser as Parser
-from lib.constant import SYN_FLAG, ACK_FLAG, FIN_ACK_FLAG, PAYLOAD_SIZE, SYN_ACK_FLAG, TIMEOUT_LISTEN, WINDOW_SIZE
+from lib.constant import SYN_FLAG, ACK_FLAG, FIN_ACK_FLAG, SYN_ACK_FLAG, TIMEOUT_LISTEN, TIMEOUT_PARALLEL, ENGINE_ASYNCIO, CLIENT_QUEUE_SIZE, ARQ_SELECTIVE_REPEAT, SACK_ON, SEGMENT_SIZE, MIN_SEGMENT_SIZE, PMTU_PROBE_ON, MAX_WINDOW, MULTICAST_ON, MULTICAST_GROUP, CONGESTION_FIXED, ECC_NONE, ECC_HAMMING, FEC_NONE, FEC_XOR, FEC_LENGTH_SIZE
 
 class Server:
     # -- Constructor --
-    def __init__(self):
+    def __init__(self, connection: Optional[Connection] = None):
         # Logger
         self.logger = self.setup_logger()
         
@@ -24,16 +39,104 @@ class Server:
         server_arguments = args.get_value()
         self.broadcast_port : int = server_arguments["broadcast_port"]
         self.pathfile : str = server_arguments["pathfile_input"]
-        self.connection = Connection(broadcast_port=self.broadcast_port, is_server=True)
+
+        # Multi-process mode, every worker owns socket of broadcast port and serves clients which kernel hashes into it
+        self.worker_count : int = max(server_arguments["workers"], 1)
+        self.workers : Optional[WorkerPool] = None
+        if self.worker_count > 1 and not (hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork")):
+            self.logger.warning("[!] SO_REUSEPORT or fork is unavailable. Running single process")
+            self.worker_count = 1
+        # Given connection replaces UDP socket, e.g. SimulatedConnection of lib.simulator
+        self.connection = connection if connection is not None else Connection(broadcast_port=self.broadcast_port, is_server=True, reuse_port=self.worker_count > 1)
+
+        # Segment size offered at handshake, path of every client which negotiates it is probed for largest unfragmented size
+        self.segment_size : int = min(max(server_arguments["segment_size"], MIN_SEGMENT_SIZE), SEGMENT_SIZE)
+        self.pmtu_probe : bool = server_arguments["pmtu_probe"] == PMTU_PROBE_ON and self.connection.mtu_discovery
+        self.client_pmtu: Dict[Tuple[str, int], PathMTUSearch] = {}
+
+        # One-to-many transfer of sequential mode. Without multicast group every member gets unicast copy of each round
+        self.multicast : bool = server_arguments["multicast"] == MULTICAST_ON
+        self.multicast_group : Optional[Tuple[str, int]] = None
+        self.multicast_session : Optional[MulticastSession] = None
+        if self.multicast and server_arguments["multicast_group"]:
+            self.multicast_group = parse_group(server_arguments["multicast_group"])
+            if self.multicast_group is None:
+                self.logger.warning(f"[!] Invalid multicast group {server_arguments['multicast_group']}. Sending unicast copy to every client")
+            else:
+                self.connection.set_multicast()
+
+        # Error correcting code of data segment payload, one-to-many transfer sends the same frame to every member
+        self.ecc : str = server_arguments["ecc"]
+        if self.multicast and self.ecc != ECC_NONE:
+            self.logger.warning("[!] Error correcting code isn't available in one-to-many transfer. Disabled")
+            self.ecc = ECC_NONE
+
+        # Forward error correction, repair segments after every block of data segments. Block size and repair count are
+        # one byte each in repair header, and Cauchy code needs both to fit GF(256)
+        self.fec : str = server_arguments["fec"]
+        if self.multicast and self.fec != FEC_NONE:
+            self.logger.warning("[!] Forward error correction isn't available in one-to-many transfer. Disabled")
+            self.fec = FEC_NONE
+        self.fec_block : int = min(max(server_arguments["fec_block"], 1), 255)
+        self.fec_repair : int = 1 if self.fec == FEC_XOR else min(max(server_arguments["fec_repair"], 1), 256 - self.fec_block)
+
+        # Options offered at handshake, and options agreed with each client
+        self.options = ConnectionOptions(checksum=server_arguments["checksum"], arq=server_arguments["arq"], ack=server_arguments["ack"], sack=server_arguments["sack"], ecc=self.ecc, fec=self.fec, segment_size=self.segment_size,
+                                         multicast=MULTICAST_ON if self.multicast else None, group=self.multicast_group)
+        self.client_options: Dict[Tuple[str, int], ConnectionOptions] = {}
+
+        # Retransmission timeout measured for each client
+        self.rto_min : float = server_arguments["rto_min"]
+        self.rto_max : float = server_arguments["rto_max"]
+        self.client_rtt: Dict[Tuple[str, int], RTTEstimator] = {}
+
+        # Send window of each client, grown and shrunk by congestion control
+        self.congestion : str = server_arguments["congestion"]
+        self.dupack_threshold : int = server_arguments["dupack_threshold"]
+
+        # Send window limit on top of receive window, fixed congestion control uses it as its window
+        self.max_window : Optional[int] = None
+        if server_arguments["window"] is not None:
+            self.max_window = min(max(server_arguments["window"], 1), MAX_WINDOW)
+        self.client_congestion: Dict[Tuple[str, int], CongestionControl] = {}
+
+        # Segments each client reported in SACK blocks
+        self.client_sack: Dict[Tuple[str, int], SackScoreboard] = {}
+
+        # Go-Back-N sender slides window on every ACK. Window-at-a-time sender is kept for benchmark comparison
+        self.sliding_window = True
         
         self.file = self.open_file()
         self.filesize = self.get_filesize()
         self.segment = Segment()
         self.client_list: List[Tuple[int, int]] = []
         self.filename = self.get_filename()
-        self.breakdown_file()
+        self.list_segment = self.breakdown_file(self.segment_size)
+
+        # Every client and retransmission is served from encoded frames, one cache for every negotiated segment size
+        self.cache_size : int = server_arguments["cache_size"]
+        self.frame_cache = FrameCache(self.list_segment, self.cache_size)
+        self.frame_caches: Dict[Tuple[int, str, str], FrameCache] = {(self.segment_size, ECC_NONE, FEC_NONE): self.frame_cache}
+        self.repair_encoders: Dict[Tuple[int, str, str], RepairEncoder] = {}
+        self.frame_cache_lock = threading.Lock()
 
         self.parallel = False
+        self.engine : str = server_arguments["engine"]
+
+        # Parallel mode inbox of every client, filled by listener thread
+        self.demux = Demultiplexer(CLIENT_QUEUE_SIZE, server_arguments["overflow"])
+
+        # Per-segment events go to binary trace instead of debug log, None when tracing is off
+        self.tracer : Optional[Tracer] = None
+        if server_arguments["trace"]:
+            self.tracer = Tracer(server_arguments["trace"], server_arguments["trace_size"], "Client")
+
+        # Counters, gauges and histograms of every client, scraped from endpoint when address is given
+        self.metrics = MetricsRegistry("server")
+        self.metrics_address : Optional[str] = server_arguments["metrics"]
+        self.metrics_endpoint : Optional[MetricsEndpoint] = None
+        if self.worker_count == 1:
+            self.start_metrics_endpoint(self.metrics_address)
 
         self.logger.debug(f"[!] Source file | {self.filename} | {self.filesize} bytes")
 
@@ -58,8 +161,9 @@ class Server:
         # Add formatter to ch
         ch.setFormatter(formatter)
 
-        # Add ch to logger
-        logger.addHandler(ch)
+        # Add ch to logger once, instance may be created many times in one process (lib.simulator)
+        if not logger.handlers:
+            logger.addHandler(ch)
         return logger
     
 
@@ -86,39 +190,45 @@ class Server:
         
         return self.pathfile
     
-    def breakdown_file(self):
-        self.list_segment: List[Segment] = []
-        
+    def breakdown_file(self, segment_size: int) -> SegmentProvider:
+        # Segments are built on demand from memory mapped file, so memory doesn't grow with file size
+        return SegmentProvider(self.file, self.get_metadata(), segment_size - HEADER_SIZE)
+
+    def get_frame_cache(self, segment_size: int = None, ecc: str = ECC_NONE, fec: str = FEC_NONE) -> FrameCache:
+        # File is broken down once for every negotiated segment size, error correcting code and forward error correction,
+        # clients with the same options share frames. Hamming code doubles payload, so its segments carry half of the file data.
+        # Repair segment carries payload length too, so data segment of forward error correction is that much shorter
+        segment_size = segment_size or self.segment_size
+        key = (segment_size, ecc, fec)
+        with self.frame_cache_lock:
+            if key not in self.frame_caches:
+                payload_size = segment_size - HEADER_SIZE
+                if ecc == ECC_HAMMING:
+                    payload_size = get_data_size(payload_size)
+                if fec != FEC_NONE:
+                    payload_size -= FEC_LENGTH_SIZE
+                segments = self.breakdown_file(HEADER_SIZE + payload_size)
+                encoder = partial(encode_frame, header_size=HEADER_SIZE) if ecc == ECC_HAMMING else None
+                self.frame_caches[key] = FrameCache(segments, self.cache_size, encoder)
+            return self.frame_caches[key]
+
+    def get_repair_encoder(self, segment_size: int = None, ecc: str = ECC_NONE, fec: str = FEC_NONE) -> Optional[RepairEncoder]:
+        # Repair segments of the same segments as frame cache of these options, None without forward error correction
+        if fec == FEC_NONE:
+            return None
+        segments = self.get_frame_cache(segment_size, ecc, fec).segments
+        key = (segment_size or self.segment_size, ecc, fec)
+        with self.frame_cache_lock:
+            if key not in self.repair_encoders:
+                self.repair_encoders[key] = RepairEncoder(segments, self.fec_block, 1 if fec == FEC_XOR else self.fec_repair)
+            return self.repair_encoders[key]
+
+    def get_metadata(self) -> bytes:
         # Metadata support 
-        metadata_segment = Segment()
         filename = self.filename.split(".")[0]
         extension = self.filename.split(".")[-1]
         filesize = self.filesize
-        metadata = filename.encode() + ",".encode() + extension.encode() + ",".encode() + str(filesize).encode()
-        metadata_segment.set_payload(metadata)
-        header = metadata_segment.get_header()
-        header["seq_num"] = 2
-        header["ack_num"] = 0
-        metadata_segment.set_header(header)
-        self.list_segment.append(metadata_segment)
-        
-        num_of_segment = ceil(self.filesize / PAYLOAD_SIZE)
-        
-        # Sending data
-        for i in range(num_of_segment):
-            segment = Segment()
-            data_to_set = self.get_filechunk(i)
-            segment.set_payload(data_to_set)
-            header = segment.get_header()
-            header["seq_num"] = i + 3
-            header["ack_num"] = 3
-            segment.set_header(header)
-            self.list_segment.append(segment)
-            
-    def get_filechunk(self, index):
-        offset = index * PAYLOAD_SIZE
-        self.file.seek(offset)
-        return self.file.read(PAYLOAD_SIZE)
+        return filename.encode() + ",".encode() + extension.encode() + ",".encode() + str(filesize).encode()
     
 
     # -- Listening Handler --
@@ -129,12 +239,67 @@ class Server:
             choice = input("[?] Enable paralelization for server (y/n) ").lower()
 
         if choice == "y":
-            self.parallel = True
+            self.set_parallel()
+
+    def start_metrics_endpoint(self, address: Optional[str]):
+        if not address:
+            return
+        try:
+            self.metrics_endpoint = MetricsEndpoint(self.metrics, address)
+            self.metrics_endpoint.start()
+            self.logger.info(f"[!] Metrics endpoint at {self.metrics_endpoint}")
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"[!] Metrics endpoint {address} can't be started ({e})")
+            self.metrics_endpoint = None
+
+    def set_parallel(self):
+        self.parallel = True
+        if self.multicast:
+            # Parallel mode serves every client as it comes, one-to-many transfer needs all of them first
+            self.logger.warning("[!] One-to-many transfer is only available in sequential mode. Disabled")
+            self.multicast = False
+            self.options.multicast = None
+
+    def start_workers(self):
+        # Supervisor of multi-process mode. Every socket is bound and frames of offered segment size are put in shared
+        # memory before fork, then each worker runs parallel mode on its own socket. Supervisor only waits for workers
+        self.set_parallel()
+        connections = [self.connection] + [Connection(broadcast_port=self.broadcast_port, is_server=True, reuse_port=True) for _ in range(self.worker_count - 1)]
+        if SharedFrameCache.fits(self.list_segment, self.segment_size, self.cache_size):
+            self.frame_cache = SharedFrameCache(self.list_segment, self.segment_size, self.options.checksum, self.cache_size)
+            self.frame_caches[(self.segment_size, ECC_NONE, FEC_NONE)] = self.frame_cache
+        else:
+            # Shared copy of whole file would be over cache budget, every worker keeps its own bounded cache instead
+            self.logger.info(f"[!] File is larger than frame cache ({self.cache_size} bytes), frames aren't shared between workers")
+        self.workers = WorkerPool(self.worker_count)
+
+        def run_worker(index: int):
+            for connection in connections:
+                if connection is not connections[index]:
+                    connection.close_socket()
+            self.connection = connections[index]
+            if self.tracer is not None:
+                self.tracer.path = f"{self.tracer.path}.{index}"
+            if self.metrics_address:
+                # Every worker has its own registry, so its own endpoint: next TCP port or numbered Unix socket
+                host, _, port = self.metrics_address.rpartition(":")
+                self.start_metrics_endpoint(f"{self.metrics_address}.{index}" if "/" in self.metrics_address else f"{host}:{int(port) + index}")
+            self.logger.info(f"[!] Worker {index} started (pid {os.getpid()})")
+            self.listen_for_clients()
+
+        self.workers.start(run_worker)
+        for connection in connections:
+            connection.close_socket()
+        codes = self.workers.wait()
+        self.logger.info(f"[!] Every worker exited ({self.workers}, exit code {' '.join(map(str, codes))})")
 
     def listen_for_clients(self):
         self.logger.debug("[!] Listening to broadcast address for clients.")
         while True:
-            if self.parallel:
+            if self.parallel and self.engine == ENGINE_ASYNCIO:
+                AsyncServerEngine(self).run()
+                break
+            elif self.parallel:
                 self.parallel_listen()
             else:
                 try:
@@ -161,22 +326,26 @@ class Server:
                     break
 
     def parallel_listen(self):
-        self.parallel_client_list: Dict[Tuple[str, int], List[Segment]] = {}
         while True:
             try:
-                client = self.connection.listen_single_segment(15)
+                client = self.connection.listen_single_segment(TIMEOUT_PARALLEL)
                 client_address = client[1]
-                if client_address not in self.parallel_client_list:
+                if self.workers is not None:
+                    self.workers.on_activity()
+                if client_address not in self.demux:
                     ip, port = client_address 
                     self.logger.debug(f"[!] Received request from {ip}:{port}")
 
-                    self.parallel_client_list[client_address] = []
+                    self.demux.register(client_address)
                     new_thread = threading.Thread(target=self.start_file_transfer, kwargs={"parallel_client": client_address})
                     new_thread.start()
-                else:
-                    self.parallel_client_list[client_address].append(client[0])
+                elif not self.demux.dispatch(client[0], client_address):
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Inbox full. Dropping segment ({self.demux.policy})")
             except socket.timeout:
-                self.logger.error("[!] Timeout error for listening client. Exiting")
+                if self.workers is not None and not self.workers.on_idle():
+                    # Other worker still serves clients, closing this socket would move some of them into another worker
+                    continue
+                self.logger.error(f"[!] Timeout error for listening client. Exiting ({self.demux})")
                 exit(0)
 
     def choice_valid(self, choice: str):
@@ -195,27 +364,76 @@ class Server:
         if self.parallel:
             self.three_way_handshake(parallel_client)
             self.file_transfer(parallel_client)
+        elif self.multicast:
+            self.multicast_file_transfer(self.client_list)
         else:
             for client in self.client_list:
                 self.three_way_handshake(client)
                 self.file_transfer(client)
 
-    def get_segment(self, client_address: Tuple[str, int]):
+    def get_rtt(self, client_address: Tuple[str, int]) -> RTTEstimator:
+        # Estimator lives across reset of the same client
+        if client_address not in self.client_rtt:
+            self.client_rtt[client_address] = RTTEstimator(self.rto_min, self.rto_max)
+        return self.client_rtt[client_address]
+
+    def new_congestion_control(self, client_address: Tuple[str, int], options: ConnectionOptions) -> CongestionControl:
+        # Fresh window for every transfer, bounded by receive window advertised by client
+        receive_window = options.window
+        if self.max_window is not None:
+            receive_window = min(receive_window or MAX_WINDOW, self.max_window)
+        initial_window = self.max_window if self.congestion == CONGESTION_FIXED else None
+        controller = get_congestion_control(self.congestion, receive_window, self.dupack_threshold, initial_window)
+        self.client_congestion[client_address] = controller
+        return controller
+
+    def new_sack_scoreboard(self, client_address: Tuple[str, int]) -> SackScoreboard:
+        # Stays empty when client doesn't negotiate SACK
+        scoreboard = SackScoreboard()
+        self.client_sack[client_address] = scoreboard
+        return scoreboard
+
+    def start_metrics(self, client_address: Tuple[str, int], rtt: RTTEstimator, congestion: CongestionControl, options: ConnectionOptions) -> ConnectionMetrics:
+        # Transfer of client starts, its metrics read window and RTT from the same objects the sender uses
+        metrics = self.metrics.get(client_address)
+        metrics.start(rtt, congestion, self.get_frame_cache(options.segment_size, options.ecc, options.fec).segments.payload_size, self.filesize)
+        return metrics
+
+    def get_window(self, client_address: Tuple[str, int]) -> int:
+        # Current send window of client, for instrumentation
+        controller = self.client_congestion.get(client_address)
+        return 0 if controller is None else controller.get_window()
+
+    def get_segment(self, client_address: Tuple[str, int], timeout: float = None):
+        # Timeout defaults to current retransmission timeout of client
+        if timeout is None:
+            timeout = self.get_rtt(client_address).get_timeout()
         if self.parallel:
-            just_now = time.time() + 1
-            while (time.time() < just_now):
-                if len(self.parallel_client_list[client_address]) > 0:
-                    return self.parallel_client_list[client_address].pop(0), client_address
-            raise socket.timeout
+            # Block on client inbox, raise socket.timeout
+            return self.demux.get(client_address, timeout), client_address
         else:
-            return self.connection.listen_single_segment()
+            return self.connection.listen_single_segment(timeout)
+
+    def get_pooled_segment(self, client_address: Tuple[str, int], timeout: float = None):
+        # Same as get_segment, but sequential mode receives into pooled buffer.
+        # Buffer (None in parallel mode) must be given back with connection.release_buffer()
+        if self.parallel:
+            data, address = self.get_segment(client_address, timeout)
+            return data, address, None
+        if timeout is None:
+            timeout = self.get_rtt(client_address).get_timeout()
+        return self.connection.listen_pooled_segment(timeout)
         
     def three_way_handshake(self, client_address: Tuple[str, int]) -> bool:
         # Three Way Handshake Protocol, for server-side to establishing connection with client
         self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Initiating three way handshake")
 
-        # Set SYN flag to start establishing connection
+        # Set SYN flag to start establishing connection, offer options in SYN payload
         self.segment.set_flag(["SYN"])
+        self.segment.set_payload(self.options.get_offer_bytes())
+        rtt = self.get_rtt(client_address)
+        rtt.discard_pending()
+        handshake_start = time.monotonic()
 
         while True:
             # If segment flag is SYN flag, then send segment to client
@@ -230,120 +448,750 @@ class Server:
 
                 # Send segment to client
                 self.connection.send_data(self.segment.get_bytes(), client_address)
+                rtt.on_send("SYN")
                 
                 # Wait for SYN-ACK from client
                 try:
-                    data, client_address = self.get_segment(client_address)
+                    data, response_address = self.get_segment(client_address, rtt.get_timeout())
+                    while client_address[1] != response_address[1]:
+                        # Late segment of client served before (path MTU probe ACK, one-to-many member), not part of this handshake
+                        data, response_address = self.get_segment(client_address, rtt.get_timeout())
                     self.segment.set_from_bytes(data)
                 except socket.timeout:
+                    rtt.backoff()
                     self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] SYN-ACK response timeout. Resending SYN")
             # If segment flag is SYN-ACK flag, then send ACK to client
-            elif self.segment.get_flag() == SYN_ACK_FLAG:
-                # Set segment ACK flag
-                self.segment.set_flag(["ACK"])
+            # Empty SYN-ACK is a leftover reset request, not an answer to this SYN
+            elif self.segment.get_flag() == SYN_ACK_FLAG and not self.is_reset_request(self.segment):
+                # Corrupt or malformed answer is never defaulted, client would use options it chose. Offer again
+                options = ConnectionOptions.from_answer(self.segment.get_payload()) if self.segment.valid_checksum() else None
+                if options is None:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Corrupt SYN-ACK. Resending SYN")
+                    self.segment.set_flag(["SYN"])
+                    self.segment.set_payload(self.options.get_offer_bytes())
+                    continue
+
+                # Save options chosen by client (defaults for client which doesn't negotiate)
+                self.client_options[client_address] = options
+                rtt.on_ack("SYN")
+                self.metrics.get(client_address).on_handshake(time.monotonic() - handshake_start)
 
-                # Initialize segment sequence and ACK number
-                segment_header = self.segment.get_header()
-                segment_header["ack_num"] = 1
-                segment_header["seq_num"] = 1
-                self.segment.set_header(segment_header)
-                
                 # Show status
                 self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Receive SYN-ACK")
-                self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Sending ACK")
-
-                # Send segment to client
-                self.connection.send_data(self.segment.get_bytes(), client_address)
+                self.send_handshake_ack(client_address)
                 break
-            # Other than that, stop three way handshake
+            # Other than that, segment belongs to previous connection. Keep offering SYN
             else:
-                self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Client already waiting for file. Ending three way handshake")
+                self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Unexpected segment during handshake. Resending SYN")
+                self.segment.set_flag(["SYN"])
+                self.segment.set_payload(self.options.get_offer_bytes())
         
-        self.logger.info(f"[!] [Client {client_address[0]}:{client_address[1]}] Handshake established")
+        self.probe_path_mtu(client_address, self.client_options[client_address])
+        self.logger.info(f"[!] [Client {client_address[0]}:{client_address[1]}] Handshake established ({self.client_options[client_address]})")
     
+    def probe_path_mtu(self, client_address: Tuple[str, int], options: ConnectionOptions):
+        # Largest segment which reaches client unfragmented (RFC 8899). Only client which negotiates segment size
+        # answers probe, older client gets segment size of this server
+        if options.segment_size is None:
+            options.segment_size = self.segment_size
+            return
+        if not self.pmtu_probe:
+            return
+
+        search = PathMTUSearch(options.segment_size)
+        self.client_pmtu[client_address] = search
+        rtt = self.get_rtt(client_address)
+        probe = Segment()
+        segment = Segment()
+        while not search.done:
+            for size in search.get_probe_sizes():
+                probe.set_probe(size)
+                self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Sending path MTU probe {size}")
+                try:
+                    if not self.connection.send_probe(probe.get_bytes(), client_address):
+                        search.on_too_big(size)
+                except OSError as e:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Path MTU probe {size} failed ({e})")
+
+            # Wait for probe ACKs until larger probe can't pass anymore, handshake ACK is resent if client is still waiting for it
+            deadline = time.monotonic() + rtt.get_timeout()
+            while search.get_pending() and time.monotonic() < deadline:
+                buffer = None
+                try:
+                    data, response_address, buffer = self.get_pooled_segment(client_address, max(deadline - time.monotonic(), 0.001))
+                    segment.set_from_bytes(data)
+                    if client_address[1] != response_address[1]:
+                        continue
+                    if segment.is_probe() and segment.get_flag() == ACK_FLAG:
+                        search.on_ack(segment.ack_num)
+                    elif segment.get_flag() == SYN_ACK_FLAG and not self.is_reset_request(segment):
+                        self.send_handshake_ack(client_address)
+                except socket.timeout:
+                    break
+                finally:
+                    self.connection.release_buffer(buffer)
+            search.end_round()
+
+        self.set_segment_size(options, search.get_size())
+        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Path MTU | {search}")
+
+    def set_segment_size(self, options: ConnectionOptions, segment_size: int):
+        # Probed size replaces negotiated one. Receive window was advertised in segments of negotiated size, smaller segments fit more
+        if options.window is not None:
+            options.window = max(1, min(MAX_WINDOW, options.window * options.segment_size // segment_size))
+        options.segment_size = segment_size
+
+    def send_handshake_ack(self, client_address: Tuple[str, int]):
+        # Third step of handshake, also resent when a duplicate SYN-ACK shows the ACK was lost
+        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Sending ACK")
+        segmentACK = Segment()
+        segmentACK.set_flag(["ACK"])
+        segmentACK.set_header({"seq_num": 1, "ack_num": 1})
+        self.connection.send_data(segmentACK.get_bytes(), client_address)
+
+    def is_reset_request(self, segment: Segment) -> bool:
+        # Client which receives file segment before handshake ends asks reset with empty SYN-ACK.
+        # Handshake SYN-ACK always carries payload (options answer, or echoed offer from older client)
+        return segment.get_flag() == SYN_ACK_FLAG and len(segment.get_payload()) == 0
+
     def file_transfer(self, client_address: Tuple[str, int]):
         # File transfer, server-side
         # seq_num 0 for SYN
         # seq_num 1 for ACK
         # seq_num 2 for Metadata
-        num_of_segment = len(self.list_segment) + 2
-        window_size = min(num_of_segment - 2, WINDOW_SIZE)
+        options = self.client_options.get(client_address, ConnectionOptions())
+        self.get_rtt(client_address).discard_pending()
+        if options.arq == ARQ_SELECTIVE_REPEAT:
+            reset_conn = self.selective_repeat_transfer(client_address, options)
+        elif self.sliding_window:
+            reset_conn = self.go_back_n_transfer(client_address, options)
+        else:
+            reset_conn = self.go_back_n_batch_transfer(client_address, options)
+
+        if reset_conn:
+            self.three_way_handshake(client_address)
+            self.file_transfer(client_address)
+        else:
+            self.metrics.get(client_address).end()
+            self.close_connection(client_address)
+
+    def go_back_n_transfer(self, client_address: Tuple[str, int], options: ConnectionOptions) -> bool:
+        # Go-Back-N sender with continuous sliding window. Every ACK which moves sequence_base lets new segments out,
+        # and single retransmission timer runs on oldest unacknowledged segment. Return True when client ask to reset connection
+        frame_cache = self.get_frame_cache(options.segment_size, options.ecc, options.fec)
+        repairs = self.get_repair_encoder(options.segment_size, options.ecc, options.fec)
+        segments = frame_cache.segments
+        num_of_segment = len(segments) + 2
+        sequence_base = 2
+        next_sequence = 2
+        highest_sequence = 2
+        timer_start = 0.0
+        rtt = self.get_rtt(client_address)
+        congestion = self.new_congestion_control(client_address, options)
+        scoreboard = self.new_sack_scoreboard(client_address)
+
+        # Loss recovery: no new fast retransmit until base passes recovery_point (NewReno),
+        # retransmitted_base is base resent by fast retransmit which is not acknowledged yet.
+        # sack_recovery is set when SACK blocks tell exactly which segments are lost, only those are resent
+        recovery_point = 2
+        retransmitted_base = None
+        sack_recovery = False
+
+        # Single segment reused for parsing every response, ACKs carry negotiated checksum
+        segment = Segment()
+        segment.set_checksum_algorithm(options.checksum)
+        tracer = self.tracer
+        trace_id = tracer.get_id(client_address) if tracer is not None else 0
+        metrics = self.start_metrics(client_address, rtt, congestion, options)
+        while sequence_base < num_of_segment:
+            # Fill window with new segments
+            window_end = min(sequence_base + congestion.get_window(), num_of_segment)
+            if next_sequence < window_end:
+                first_sequence = next_sequence
+                segments.prefetch(window_end - 2, window_end - next_sequence)
+                frames = []
+                sent = []
+                while next_sequence < window_end:
+                    if next_sequence in scoreboard:
+                        # Client already holds this segment, going back doesn't resend it
+                        scoreboard.skipped += 1
+                    else:
+                        if tracer is not None:
+                            tracer.record(trace_id, TRACE_SEND_SEGMENT, next_sequence, sequence_base, congestion.get_window())
+                        frames.append(frame_cache.get_frame(next_sequence - 2, options.checksum))
+                        sent.append(next_sequence)
+                        if repairs is not None and next_sequence >= highest_sequence:
+                            # First send of segment closing a block, its repairs follow right behind
+                            repair_frames = repairs.get_frames(next_sequence, options.checksum)
+                            frames.extend(repair_frames)
+                            metrics.repairs_sent += len(repair_frames)
+                    next_sequence += 1
+                highest_sequence = max(highest_sequence, next_sequence)
+                self.connection.send_batch(frames, client_address)
+                metrics.segments_sent += len(sent)
+                metrics.next = next_sequence
+                now = time.monotonic()
+                for sequence in sent:
+                    rtt.on_send(sequence, now)
+                if first_sequence == sequence_base:
+                    # Nothing was in flight, timer starts with this segment
+                    timer_start = now
+
+            buffer = None
+            try:
+                timeout = max(timer_start + rtt.get_timeout() - time.monotonic(), 0.001)
+                data, response_address, buffer = self.get_pooled_segment(client_address, timeout)
+                segment.set_from_bytes(data)
+
+                if client_address[1] != response_address[1]:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received ACK from wrong client")
+                elif self.is_reset_request(segment):
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received SYN ACK Flag, client ask to reset connection")
+                    return True
+                elif segment.get_flag() == SYN_ACK_FLAG:
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received duplicate SYN ACK, handshake ACK was lost")
+                    self.send_handshake_ack(client_address)
+                elif segment.is_probe():
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received late path MTU probe ACK")
+                elif segment.get_flag() != ACK_FLAG:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Wrong Flag")
+                elif not segment.valid_checksum():
+                    # Corrupt SACK blocks must not reach scoreboard, RTT estimator or congestion control
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Corrupt ACK")
+                elif sequence_base <= segment.ack_num <= highest_sequence:
+                    metrics.acks_received += 1
+                    scoreboard.update(segment.get_sack_blocks(), sequence_base, highest_sequence)
+                    if segment.ack_num > sequence_base:
+                        # Cumulative ACK slides window, only newest segment it covers gives RTT sample.
+                        # After going back it may cover segments sent before timeout, which are not resent
+                        if tracer is not None:
+                            tracer.record(trace_id, TRACE_RECEIVE_ACK, segment.seq_num, segment.ack_num, congestion.get_window())
+                        for sequence in range(sequence_base, segment.ack_num - 1):
+                            rtt.forget(sequence)
+                        rtt.on_ack(segment.ack_num - 1)
+                        congestion.on_ack(segment.ack_num - sequence_base)
+                        segments.release(sequence_base - 2, segment.ack_num - sequence_base)
+                        sequence_base = segment.ack_num
+                        next_sequence = max(next_sequence, sequence_base)
+                        metrics.base = sequence_base
+                        scoreboard.advance(sequence_base)
+                        if retransmitted_base is not None and sequence_base > retransmitted_base:
+                            congestion.on_recovery()
+                            retransmitted_base = None
+
+                        # Timer restarts for next oldest unacknowledged segment
+                        timer_start = time.monotonic()
+                    else:
+                        # Client still expects base, a segment in flight is lost
+                        metrics.duplicate_acks += 1
+                        if tracer is not None:
+                            tracer.record(trace_id, TRACE_DUPLICATE_ACK, segment.seq_num, segment.ack_num, congestion.get_window())
+                        if congestion.on_duplicate_ack() and sequence_base >= recovery_point:
+                            self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] {congestion.duplicate_acks} duplicate ACK {sequence_base}. Fast retransmit from Segment {sequence_base}")
+                            congestion.on_fast_retransmit()
+                            recovery_point = highest_sequence
+                            retransmitted_base = sequence_base
+                            scoreboard.end_recovery()
+                            sack_recovery = scoreboard.has_holes(sequence_base)
+                            if not sack_recovery:
+                                # Client dropped everything after the gap, go back to base now
+                                next_sequence = sequence_base
+
+                    if sack_recovery and sequence_base < recovery_point:
+                        # Every hole reported so far is resent at once, so several losses of one window recover in one RTT
+                        holes = scoreboard.next_holes(sequence_base)
+                        if holes:
+                            self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] SACK. Resending Segment {', '.join(map(str, holes))}")
+                            self.connection.send_batch([frame_cache.get_frame(sequence - 2, options.checksum) for sequence in holes], client_address)
+                            metrics.segments_sent += len(holes)
+                            now = time.monotonic()
+                            for sequence in holes:
+                                rtt.on_send(sequence, now)
+                                if tracer is not None:
+                                    tracer.record(trace_id, TRACE_RESEND_SEGMENT, sequence, sequence_base, congestion.get_window())
+                    else:
+                        sack_recovery = False
+                else:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Wrong ACK")
+            except socket.timeout:
+                # Timer of oldest segment expired, go back and resend from base with doubled timeout
+                rtt.backoff()
+                congestion.on_timeout()
+                self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] ACK {sequence_base + 1} timeout. Resending from Segment {sequence_base} ({rtt}, window: {congestion.get_window()})")
+                if tracer is not None:
+                    tracer.record(trace_id, TRACE_TIMEOUT, sequence_base, sequence_base + 1, congestion.get_window())
+                recovery_point = highest_sequence
+                retransmitted_base = None
+                sack_recovery = False
+                scoreboard.reset()
+                next_sequence = sequence_base
+            finally:
+                self.connection.release_buffer(buffer)
+
+        return False
+
+    def go_back_n_batch_transfer(self, client_address: Tuple[str, int], options: ConnectionOptions) -> bool:
+        # Previous Go-Back-N sender, whole window is sent then its ACKs are collected before anything new is sent.
+        # Return True when client ask to reset connection
+        frame_cache = self.get_frame_cache(options.segment_size, options.ecc, options.fec)
+        repairs = self.get_repair_encoder(options.segment_size, options.ecc, options.fec)
+        segments = frame_cache.segments
+        num_of_segment = len(segments) + 2
         sequence_base = 2
+        highest_sequence = 2
+        released_base = 2
+        retransmitted_base = None
         reset_conn = False
+        rtt = self.get_rtt(client_address)
+        congestion = self.new_congestion_control(client_address, options)
+
+        # Single segment reused for parsing every response, ACKs carry negotiated checksum
+        segment = Segment()
+        segment.set_checksum_algorithm(options.checksum)
+        tracer = self.tracer
+        trace_id = tracer.get_id(client_address) if tracer is not None else 0
+        metrics = self.start_metrics(client_address, rtt, congestion, options)
         while sequence_base < num_of_segment and not reset_conn:
+            window_size = min(num_of_segment - sequence_base, congestion.get_window())
             sequence_max = window_size
+
+            # Read ahead just past current window, drop pages of acknowledged segments
+            segments.prefetch(sequence_base - 2 + window_size, window_size)
+            segments.release(released_base - 2, sequence_base - released_base)
+            released_base = sequence_base
             
+            # Whole window is sent in one batch
+            frames = []
+            repair_frames = []
             for i in range(sequence_max):
                 # Start sending segment x
-                self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Sending Segment {sequence_base + i}")
+                if tracer is not None:
+                    tracer.record(trace_id, TRACE_SEND_SEGMENT, sequence_base + i, sequence_base, congestion.get_window())
                 if i + sequence_base < num_of_segment:
-                    self.connection.send_data(self.list_segment[i + sequence_base - 2].get_bytes(), client_address)
-                    
+                    frames.append(frame_cache.get_frame(i + sequence_base - 2, options.checksum))
+                    if repairs is not None and i + sequence_base >= highest_sequence:
+                        repair_frames += repairs.get_frames(i + sequence_base, options.checksum)
+            highest_sequence = max(highest_sequence, sequence_base + len(frames))
+            self.connection.send_batch(frames + repair_frames, client_address)
+            metrics.repairs_sent += len(repair_frames)
+            metrics.segments_sent += len(frames)
+            metrics.next = sequence_base + len(frames)
+            now = time.monotonic()
+            for i in range(len(frames)):
+                rtt.on_send(sequence_base + i, now)
+
+            window_end = sequence_base + len(frames)
             for i in range(sequence_max):
+                if sequence_base >= window_end:
+                    # Whole window is acknowledged, delayed ACK client sends fewer responses than segments
+                    break
+                buffer = None
                 try:
-                    data, response_address = self.get_segment(client_address)
-                    segment = Segment()
+                    data, response_address, buffer = self.get_pooled_segment(client_address, rtt.get_timeout())
                     segment.set_from_bytes(data)
 
                     # Various segment conditions
-                    if (client_address[1] == response_address[1] and segment.get_flag() == ACK_FLAG and segment.get_header()["ack_num"] == sequence_base + 1):
-                        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received ACK {sequence_base + 1}")
+                    if segment.is_probe():
+                        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received late path MTU probe ACK")
+                    elif segment.get_flag() == ACK_FLAG and not segment.valid_checksum():
+                        self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Corrupt ACK")
+                    elif (client_address[1] == response_address[1] and segment.get_flag() == ACK_FLAG and segment.get_header()["ack_num"] == sequence_base + 1):
+                        if tracer is not None:
+                            tracer.record(trace_id, TRACE_RECEIVE_ACK, segment.seq_num, sequence_base + 1, congestion.get_window())
+                        rtt.on_ack(sequence_base)
+                        congestion.on_ack()
                         sequence_base += 1
-                        window_size = min(num_of_segment - sequence_base, WINDOW_SIZE)
+                        metrics.acks_received += 1
+                        metrics.base = sequence_base
+                        if retransmitted_base is not None and sequence_base > retransmitted_base:
+                            congestion.on_recovery()
+                            retransmitted_base = None
                     elif client_address[1] != response_address[1]:
                         self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received ACK from wrong client")
-                    elif segment.get_flag() == SYN_ACK_FLAG:
+                    elif self.is_reset_request(segment):
                         self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received SYN ACK Flag, client ask to reset connection")
                         reset_conn = True
                         break
+                    elif segment.get_flag() == SYN_ACK_FLAG:
+                        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received duplicate SYN ACK, handshake ACK was lost")
+                        self.send_handshake_ack(client_address)
                     elif segment.get_flag() != ACK_FLAG:
                         self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Wrong Flag")
                     else:
                         self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Wrong ACK")
                         request_number = segment.get_header()["ack_num"]
+                        metrics.acks_received += 1
+                        if request_number == sequence_base:
+                            metrics.duplicate_acks += 1
+                        if request_number == sequence_base and congestion.on_duplicate_ack():
+                            # Client still expects base, a segment of this window is lost and client dropped the rest.
+                            # Go back to base now, next window resends it without waiting for timer
+                            self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] {congestion.duplicate_acks} duplicate ACK {sequence_base}. Fast retransmit from Segment {sequence_base}")
+                            congestion.on_fast_retransmit()
+                            retransmitted_base = sequence_base
+                            break
                         if (request_number > sequence_base):
+                            # Cumulative ACK samples only newest segment it covers
+                            for sequence in range(sequence_base, request_number - 1):
+                                rtt.forget(sequence)
+                            rtt.on_ack(request_number - 1)
+                            congestion.on_ack(request_number - sequence_base)
                             sequence_max = (sequence_max - sequence_base) + request_number
                             sequence_base = request_number
+                            metrics.base = sequence_base
+                            if retransmitted_base is not None and sequence_base > retransmitted_base:
+                                congestion.on_recovery()
+                                retransmitted_base = None
 
                 except socket.timeout:
-                    self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] ACK response timeout. Resending previous sequence number")
-        
-        if reset_conn:
-            self.three_way_handshake(client_address)
-            self.file_transfer(client_address)
-        else:
-            self.logger.info(f"[!] [Client {client_address[0]}:{client_address[1]}] File transfer complete. Sending FIN")
-            sendFIN = Segment()
-            sendFIN.set_flag(["FIN"])
-            self.connection.send_data(sendFIN.get_bytes(), client_address)
-            is_ack = False
-
-            # Wait for ack
-            while not is_ack:
+                    # Timer expired, go back and resend whole window with doubled timeout
+                    rtt.backoff()
+                    congestion.on_timeout()
+                    retransmitted_base = None
+                    self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] ACK response timeout. Resending previous sequence number ({rtt}, window: {congestion.get_window()})")
+                    break
+                finally:
+                    self.connection.release_buffer(buffer)
+
+        return reset_conn
+
+    def selective_repeat_transfer(self, client_address: Tuple[str, int], options: ConnectionOptions) -> bool:
+        # Selective Repeat sender, every segment in window has its own timer and only unacknowledged segment is resent.
+        # Return True when client ask to reset connection
+        frame_cache = self.get_frame_cache(options.segment_size, options.ecc, options.fec)
+        repairs = self.get_repair_encoder(options.segment_size, options.ecc, options.fec)
+        segments = frame_cache.segments
+        num_of_segment = len(segments) + 2
+        sequence_base = 2
+        next_sequence = 2
+        acknowledged = set()
+        sent_time: Dict[int, float] = {}
+        retries: Dict[int, int] = {}
+        rtt = self.get_rtt(client_address)
+        congestion = self.new_congestion_control(client_address, options)
+        recovery_point = 2
+        retransmitted_base = None
+
+        segment = Segment()
+        segment.set_checksum_algorithm(options.checksum)
+        tracer = self.tracer
+        trace_id = tracer.get_id(client_address) if tracer is not None else 0
+        metrics = self.start_metrics(client_address, rtt, congestion, options)
+        while sequence_base < num_of_segment:
+            # Send new segments as long as window has room, and resend segments whose timer expired
+            now = time.monotonic()
+            expired = False
+            frames = []
+            repair_frames = []
+            window_size = congestion.get_window()
+            window_end = min(sequence_base + window_size, num_of_segment)
+            if next_sequence < window_end:
+                segments.prefetch(window_end - 2, window_size)
+            while next_sequence < window_end:
+                if tracer is not None:
+                    tracer.record(trace_id, TRACE_SEND_SEGMENT, next_sequence, sequence_base, window_size)
+                frames.append(frame_cache.get_frame(next_sequence - 2, options.checksum))
+                sent_time[next_sequence] = now
+                retries[next_sequence] = 0
+                rtt.on_send(next_sequence, now)
+                if repairs is not None:
+                    # Segment closing a block, its repairs go out with this batch
+                    repair_frames += repairs.get_frames(next_sequence, options.checksum)
+                next_sequence += 1
+            for sequence in range(sequence_base, next_sequence):
+                # Every segment backs off its own timer, so independent losses don't compound
+                if sequence not in acknowledged and now - sent_time[sequence] >= rtt.get_timeout(retries[sequence]):
+                    self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] ACK {sequence + 1} timeout. Resending Segment {sequence}")
+                    if tracer is not None:
+                        tracer.record(trace_id, TRACE_TIMEOUT, sequence, sequence + 1, window_size)
+                    frames.append(frame_cache.get_frame(sequence - 2, options.checksum))
+                    sent_time[sequence] = now
+                    retries[sequence] += 1
+                    rtt.on_send(sequence, now)
+                    expired = True
+            self.connection.send_batch(frames + repair_frames, client_address)
+            metrics.segments_sent += len(frames)
+            metrics.repairs_sent += len(repair_frames)
+            metrics.next = next_sequence
+            if expired:
+                congestion.on_timeout()
+                recovery_point = next_sequence
+                retransmitted_base = None
+
+            # Wait until earliest timer of unacknowledged segment
+            pending = [sent_time[sequence] + rtt.get_timeout(retries[sequence]) for sequence in range(sequence_base, next_sequence) if sequence not in acknowledged]
+            timeout = max(min(pending) - time.monotonic(), 0.001)
+            buffer = None
+            try:
+                data, response_address, buffer = self.get_pooled_segment(client_address, timeout)
+                segment.set_from_bytes(data)
+
+                if client_address[1] != response_address[1]:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received ACK from wrong client")
+                elif self.is_reset_request(segment):
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received SYN ACK Flag, client ask to reset connection")
+                    return True
+                elif segment.get_flag() == SYN_ACK_FLAG:
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received duplicate SYN ACK, handshake ACK was lost")
+                    self.send_handshake_ack(client_address)
+                elif segment.is_probe():
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received late path MTU probe ACK")
+                elif segment.get_flag() != ACK_FLAG:
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Wrong Flag")
+                elif not segment.valid_checksum():
+                    self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] Received Corrupt ACK")
+                else:
+                    # seq_num is the segment being acknowledged, ack_num is cumulative
+                    if tracer is not None:
+                        tracer.record(trace_id, TRACE_SELECTIVE_ACK, segment.seq_num, segment.ack_num, congestion.get_window())
+                    metrics.acks_received += 1
+                    newly_acknowledged = 0
+                    if sequence_base <= segment.seq_num < next_sequence and segment.seq_num not in acknowledged:
+                        acknowledged.add(segment.seq_num)
+                        rtt.on_ack(segment.seq_num)
+                        newly_acknowledged += 1
+                    for sequence in range(sequence_base, min(segment.ack_num, next_sequence)):
+                        if sequence not in acknowledged:
+                            acknowledged.add(sequence)
+                            rtt.forget(sequence)
+                            newly_acknowledged += 1
+                    for start, end in segment.get_sack_blocks():
+                        # SACK blocks repeat segments whose own ACK may be lost
+                        for sequence in range(max(start, sequence_base), min(end, next_sequence)):
+                            if sequence not in acknowledged:
+                                acknowledged.add(sequence)
+                                rtt.forget(sequence)
+                                newly_acknowledged += 1
+
+                    # Slide window over acknowledged prefix
+                    released_base = sequence_base
+                    while sequence_base in acknowledged:
+                        acknowledged.discard(sequence_base)
+                        sent_time.pop(sequence_base, None)
+                        retries.pop(sequence_base, None)
+                        sequence_base += 1
+                    segments.release(released_base - 2, sequence_base - released_base)
+                    metrics.base = sequence_base
+                    if not newly_acknowledged:
+                        metrics.duplicate_acks += 1
+                    if newly_acknowledged:
+                        congestion.on_ack(newly_acknowledged, advanced=sequence_base > released_base)
+                    if retransmitted_base is not None and sequence_base > retransmitted_base:
+                        congestion.on_recovery()
+                        retransmitted_base = None
+
+                    # Later segment arrived while base is still missing
+                    if segment.ack_num == sequence_base and segment.seq_num > sequence_base and sequence_base < next_sequence:
+                        if congestion.on_duplicate_ack() and sequence_base >= recovery_point:
+                            # Fast retransmit of missing base, timer of resent segment restarts without backoff.
+                            # With SACK every hole under highest acknowledged segment is resent too
+                            holes = [sequence_base]
+                            if options.sack == SACK_ON and acknowledged:
+                                holes = [sequence for sequence in range(sequence_base, max(acknowledged)) if sequence not in acknowledged]
+                            self.logger.warning(f"[!] [Client {client_address[0]}:{client_address[1]}] {congestion.duplicate_acks} duplicate ACK {sequence_base}. Fast retransmit Segment {', '.join(map(str, holes))}")
+                            congestion.on_fast_retransmit()
+                            self.connection.send_batch([frame_cache.get_frame(sequence - 2, options.checksum) for sequence in holes], client_address)
+                            metrics.segments_sent += len(holes)
+                            now = time.monotonic()
+                            for sequence in holes:
+                                sent_time[sequence] = now
+                                rtt.on_send(sequence, now)
+                                if tracer is not None:
+                                    tracer.record(trace_id, TRACE_RESEND_SEGMENT, sequence, sequence_base, congestion.get_window())
+                            recovery_point = next_sequence
+                            retransmitted_base = sequence_base
+            except socket.timeout:
+                pass
+            finally:
+                self.connection.release_buffer(buffer)
+
+        return False
+
+    def multicast_file_transfer(self, clients: List[Tuple[str, int]]):
+        # Clients which negotiate one-to-many transfer wait silently after handshake and share it,
+        # older clients are served one by one as before
+        members = []
+        for client in clients:
+            self.three_way_handshake(client)
+            if self.client_options[client].multicast is not None:
+                members.append(client)
+            else:
+                self.file_transfer(client)
+        if members:
+            self.multicast_transfer(members)
+
+    def multicast_transfer(self, members: List[Tuple[str, int]]):
+        # One-to-many sender. Every round sends lowest segments which any member still misses, once to multicast group and
+        # as unicast copy to member outside group, then polls every member. NAK answering poll carries cumulative ACK and
+        # missing ranges, so next round resends union of losses. Round size follows congestion control of slowest member
+        checksum = self.options.checksum
+        segment_size = min(self.client_options[member].segment_size or self.segment_size for member in members)
+        for member in members:
+            self.set_segment_size(self.client_options[member], segment_size)
+        frame_cache = self.get_frame_cache(segment_size)
+        num_of_segment = len(frame_cache.segments) + 2
+
+        # Member joins group only if it reads group frames, encoded with offered checksum
+        session = MulticastSession(MulticastMember(member, num_of_segment, self.multicast_group is not None and self.client_options[member].multicast == MULTICAST_GROUP and self.client_options[member].checksum == checksum) for member in members)
+        self.multicast_session = session
+        windows = [self.client_options[member].window for member in members if self.client_options[member].window is not None]
+        if self.max_window is not None:
+            windows.append(self.max_window)
+        congestion = get_congestion_control(self.congestion, min(windows) if windows else None, 0, self.max_window if self.congestion == CONGESTION_FIXED else None)
+        self.logger.info(f"[!] One-to-many transfer to {len(members)} clients ({sum(member.group for member in session.members.values())} in group, segment size {segment_size})")
+
+        poll = Segment()
+        poll.set_nak_blocks(())
+        segment = Segment()
+        while not session.done:
+            # Lowest missing segments, group frame once if any group member needs it, and unicast copy to every other member
+            sequences, needed = session.get_missing(congestion.get_window())
+            active = session.get_active()
+            datagrams = 0
+            group_frames = [frame_cache.get_frame(sequence - 2, checksum) for sequence in sequences if any(member.group and sequence in needed[member.address] for member in active)]
+            if group_frames:
+                datagrams += self.connection.send_batch(group_frames, self.multicast_group)
+            for member in active:
+                member.received += len(needed[member.address])
+                if not member.group and needed[member.address]:
+                    options = self.client_options[member.address]
+                    frames = [frame_cache.get_frame(sequence - 2, options.checksum) for sequence in sequences if sequence in needed[member.address]]
+                    datagrams += self.connection.send_batch(frames, member.address)
+            session.on_send(sequences, datagrams)
+            self.logger.debug(f"[!] Round {session.rounds + 1} | Sent Segment {sequences[0]}-{sequences[-1]} ({len(sequences)} segments, {datagrams} datagrams)")
+
+            # Poll every member which is still receiving, round ends when all answered or timer expires.
+            # Once some members answered, the rest is polled again every two smoothed RTT, lost poll or NAK doesn't cost whole RTO
+            session.start_round()
+            key = ("POLL", session.rounds)
+            for member in active:
+                self.send_poll(poll, member.address, key)
+            deadline = time.monotonic() + max(self.get_rtt(member.address).get_timeout() for member in active)
+            repoll_interval = 2 * max(self.get_rtt(member.address).srtt or 0.0 for member in active)
+            repoll_time = None
+            while session.get_unanswered() and time.monotonic() < deadline:
+                if repoll_time is not None and time.monotonic() >= repoll_time:
+                    for member in session.get_unanswered():
+                        self.send_poll(poll, member.address, key)
+                    repoll_time = time.monotonic() + repoll_interval
+                buffer = None
                 try:
-                    data, response_address = self.get_segment(client_address)
-                    segment = Segment()
+                    data, response_address, buffer = self.connection.listen_pooled_segment(max(min(deadline, repoll_time or deadline) - time.monotonic(), 0.001))
                     segment.set_from_bytes(data)
-                    if (client_address[1] == response_address[1] and segment.get_flag() == FIN_ACK_FLAG):
-                        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received FIN-ACK")
-                        sequence_base += 1
-                        is_ack = True
-                        if self.parallel:
-                            self.parallel_client_list.pop(client_address)
-                        
+                    if response_address not in session:
+                        self.logger.debug(f"[!] [Client {response_address[0]}:{response_address[1]}] Ignored segment, not in one-to-many transfer")
+                    elif segment.get_flag() == SYN_ACK_FLAG:
+                        # Member got segment before handshake ACK, or lost it. Both mean handshake ACK must be sent again
+                        self.logger.debug(f"[!] [Client {response_address[0]}:{response_address[1]}] Received SYN ACK, handshake ACK was lost")
+                        self.send_handshake_ack(response_address)
+                    elif segment.is_nak() and segment.get_flag() == ACK_FLAG:
+                        # Corrupt NAK blocks would hide missing ranges, member checksum algorithm is negotiated per client
+                        segment.set_checksum_algorithm(self.client_options[response_address].checksum)
+                        if not segment.valid_checksum():
+                            self.logger.warning(f"[!] [Client {response_address[0]}:{response_address[1]}] Received Corrupt NAK")
+                            continue
+                        member = session.get(response_address)
+                        if member.on_nak(segment.ack_num, segment.seq_num, segment.get_nak_blocks()):
+                            self.get_rtt(response_address).on_ack(key)
+                            if repoll_time is None and repoll_interval:
+                                repoll_time = time.monotonic() + repoll_interval
+                            self.logger.debug(f"[!] [Client {response_address[0]}:{response_address[1]}] Received NAK {segment.ack_num} (horizon {segment.seq_num}, missing {' '.join(f'{start}-{end}' for start, end in member.holes) or '-'})")
                 except socket.timeout:
-                    self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] ACK response timeout. Resending FIN")
-                    self.connection.send_data(sendFIN.get_bytes(), client_address)
+                    pass
+                finally:
+                    self.connection.release_buffer(buffer)
+
+            # Loss reported in this round shrinks window. Lost poll or NAK of some members isn't congestion, only a round
+            # without any answer counts as timeout. Silent member keeps what it reported before
+            unanswered = session.get_unanswered()
+            for member in unanswered:
+                rtt = self.get_rtt(member.address)
+                rtt.forget(key)
+                rtt.backoff()
+                if member.on_silent():
+                    self.logger.error(f"[!] [Client {member.address[0]}:{member.address[1]}] No answer to {member.silent} polls. Dropped from one-to-many transfer")
+                else:
+                    self.logger.error(f"[!] [Client {member.address[0]}:{member.address[1]}] Poll timeout ({rtt})")
+            lost = any(needed[member.address].intersection(member.get_missing(len(sequences))) for member in session.get_active() if member.answered)
+            if len(unanswered) == len(active):
+                congestion.on_timeout()
+            elif lost:
+                congestion.on_fast_retransmit()
+            else:
+                congestion.on_ack(len(sequences))
+
+        self.logger.info(f"[!] One-to-many transfer complete ({session})")
+        self.logger.debug(f"[!] Congestion control | {congestion}")
+        for address, member in session.members.items():
+            self.logger.debug(f"[!] [Client {address[0]}:{address[1]}] One-to-many | {member}")
+            if not member.dropped:
+                self.close_connection(address)
+
+    def send_poll(self, poll: Segment, client_address: Tuple[str, int], key):
+        # Ask one-to-many member for NAK, poll and its answer are RTT sample of the member
+        self.connection.send_data(poll.get_bytes(self.client_options[client_address].checksum), client_address)
+        self.get_rtt(client_address).on_send(key)
 
-            # send ACK and tear down connection
-            self.logger.info(f"[!] [Client {client_address[0]}:{client_address[1]}] Sending ACK. Tearing down connection.")
-            segmentACK = Segment()
-            segmentACK.set_flag(["ACK"])
-            self.connection.send_data(segmentACK.get_bytes(), client_address)
+    def close_connection(self, client_address: Tuple[str, int]):
+        # FIN teardown, server-side
+        self.logger.info(f"[!] [Client {client_address[0]}:{client_address[1]}] File transfer complete. Sending FIN")
+        options = self.client_options.get(client_address, ConnectionOptions())
+        self.logger.debug(f"[!] Frame cache | {self.get_frame_cache(options.segment_size, options.ecc, options.fec)}")
+        self.logger.debug(f"[!] Receive buffer pool | {self.connection.pool}")
+        rtt = self.get_rtt(client_address)
+        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] RTT | {rtt}")
+        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Congestion control | {self.client_congestion.get(client_address)}")
+        self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] SACK | {self.client_sack.get(client_address)}")
+        sendFIN = Segment()
+        sendFIN.set_flag(["FIN"])
+        self.connection.send_data(sendFIN.get_bytes(), client_address)
+        rtt.on_send("FIN")
+        is_ack = False
+
+        # Wait for ack
+        segment = Segment()
+        while not is_ack:
+            buffer = None
+            try:
+                data, response_address, buffer = self.get_pooled_segment(client_address, rtt.get_timeout())
+                segment.set_from_bytes(data)
+                if (client_address[1] == response_address[1] and segment.get_flag() == FIN_ACK_FLAG):
+                    self.logger.debug(f"[!] [Client {client_address[0]}:{client_address[1]}] Received FIN-ACK")
+                    rtt.on_ack("FIN")
+                    is_ack = True
+                    if self.parallel:
+                        self.demux.unregister(client_address)
+                    
+            except socket.timeout:
+                rtt.backoff()
+                self.logger.error(f"[!] [Client {client_address[0]}:{client_address[1]}] ACK response timeout. Resending FIN")
+                self.connection.send_data(sendFIN.get_bytes(), client_address)
+                rtt.on_send("FIN")
+            finally:
+                self.connection.release_buffer(buffer)
+
+        # send ACK and tear down connection
+        self.logger.info(f"[!] [Client {client_address[0]}:{client_address[1]}] Sending ACK. Tearing down connection.")
+        segmentACK = Segment()
+        segmentACK.set_flag(["ACK"])
+        self.connection.send_data(segmentACK.get_bytes(), client_address)
+        self.dump_trace()
+
+    def dump_trace(self):
+        # Trace file is rewritten after every client, so it is there even when server exits on idle timeout
+        if self.tracer is not None:
+            try:
+                records = self.tracer.dump()
+                self.logger.debug(f"[!] Trace | {records} events dumped ({self.tracer})")
+            except OSError as e:
+                self.logger.warning(f"[!] Trace can't be dumped ({e})")
 
 if __name__ == '__main__':
     main = Server()
-    main.ask_for_parallel()
-    main.listen_for_clients()
-    if not main.parallel:
-        main.start_file_transfer()
\ No newline at end of file
+    if main.worker_count > 1:
+        main.start_workers()
+    else:
+        main.ask_for_parallel()
+        main.listen_for_clients()
+        if not main.parallel:
+            main.start_file_transfer()
\ No newline at end of file
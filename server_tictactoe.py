@@ -240,7 +240,7 @@ class ServerTictactoe(Server):
                         sequence_base += 1
                         is_ack = True
                         if self.parallel:
-                            self.parallel_client_list.pop(client_address)
+                            self.demux.unregister(client_address)
 
                 except socket.timeout:
                     self.logger.error(
@@ -0,0 +1,45 @@
+# Simulator driven tests: real Server and Client over lib.simulator network, virtual time and seeded impairment,
+# so every run is deterministic and timeouts cost nothing
+import os
+import sys
+import random
+import logging
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from lib.simulator import simulate_transfer
+
+# Longest virtual time of one transfer, run which doesn't finish in time raises SimulationError
+MAX_TIME = 120.0
+
+@pytest.fixture(autouse=True)
+def quiet():
+    # Server and client log every segment
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Client writes into out/ of working directory
+    (tmp_path / "out").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def transfer(workdir):
+    # run(size, seed, server_args, client_args, **impairment) -> (result, source bytes, received bytes).
+    # Received is None when output was kept as incomplete
+    def run(size, seed=0, server_args=(), client_args=(), **impairment):
+        source = random.Random(size).randbytes(size)
+        path = workdir / f"source_{size}.bin"
+        path.write_bytes(source)
+        impairment.setdefault("max_time", MAX_TIME)
+        result = simulate_transfer(str(path), seed, list(server_args), list(client_args), output="received.bin", **impairment)
+        output = workdir / "out" / "received.bin"
+        return result, source, output.read_bytes() if output.exists() else None
+    return run
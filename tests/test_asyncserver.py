@@ -0,0 +1,21 @@
+import logging
+from types import SimpleNamespace
+
+from lib.asyncserver import AsyncServerEngine
+from lib.options import ConnectionOptions
+
+def get_engine(options):
+    return AsyncServerEngine(SimpleNamespace(logger=logging.getLogger("test"), options=options, segment_size=4096))
+
+def test_offer_carries_error_correction():
+    engine = get_engine(ConnectionOptions(checksum="crc32", ecc="hamming", fec="xor"))
+    answer = ConnectionOptions()
+    options = ConnectionOptions.from_answer(answer.accept_offer(engine.get_offer().get_offer_bytes(), segment_limit=8192))
+    assert (options.checksum, options.ecc, options.fec, options.segment_size) == ("crc32", "hamming", "xor", 4096)
+
+def test_selective_repeat_rejected(caplog):
+    logging.disable(logging.NOTSET)
+    with caplog.at_level(logging.WARNING):
+        engine = get_engine(ConnectionOptions(arq="sr"))
+    assert "Selective repeat" in caplog.text
+    assert ConnectionOptions.from_answer(ConnectionOptions().accept_offer(engine.get_offer().get_offer_bytes())).arq == "gbn"
@@ -0,0 +1,11 @@
+import pytest
+
+import server
+
+@pytest.mark.parametrize("seed", [0, 2])
+def test_fast_retransmit_resends_base(transfer, monkeypatch, seed):
+    # Batch sender used to count fast retransmit and shrink window without resending anything, every loss waited for timer
+    monkeypatch.setattr(server.Server, "go_back_n_transfer", server.Server.go_back_n_batch_transfer)
+    result, source, received = transfer(200000, seed, ["--segment-size", "1024"], loss=0.02, delay=0.01)
+    assert received == source
+    assert result["timeouts"] == 0
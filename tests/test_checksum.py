@@ -0,0 +1,29 @@
+import pytest
+
+from lib.checksum import Checksum, BACKENDS, CRC16Bitwise, CRC32
+
+def test_incomplete_backend_not_instantiable():
+    class NoDigest(Checksum):
+        def reset(self):
+            pass
+
+        def update(self, data):
+            return self
+
+    with pytest.raises(TypeError):
+        NoDigest()
+    with pytest.raises(TypeError):
+        Checksum()
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_update_in_pieces(backend):
+    data = bytes(range(256)) * 4
+    checksum = backend(data[:100])
+    checksum.update(memoryview(data)[100:])
+    assert checksum.digest() == backend(data).digest()
+
+def test_crc16_backends_agree():
+    data = b"123456789"
+    assert len({backend(data).digest() for backend in BACKENDS if backend.width == 16}) == 1
+    assert CRC16Bitwise(data).digest() == 0x29B1
+    assert CRC32(data).digest() == 0xCBF43926
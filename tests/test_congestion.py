@@ -0,0 +1,103 @@
+import pytest
+
+from lib.congestion import CongestionControl, Cubic, FixedWindow, get_congestion_control
+from lib.constant import CUBIC_BETA, CUBIC_C
+
+def ack_window(congestion, now=0.0):
+    # One round trip, every segment in window is acknowledged one by one
+    for _ in range(congestion.get_window()):
+        congestion.on_ack(1, now=now)
+
+def test_slow_start_doubles_every_round():
+    congestion = CongestionControl(initial_window=2)
+    windows = []
+    for _ in range(4):
+        ack_window(congestion)
+        windows.append(congestion.get_window())
+    assert windows == [4, 8, 16, 32]
+
+def test_congestion_avoidance_one_segment_per_round():
+    congestion = CongestionControl(initial_window=10)
+    congestion.ssthresh = 10
+    ack_window(congestion)
+    assert congestion.cwnd == pytest.approx(11, abs=0.1)
+
+def test_receive_window_limits_growth():
+    congestion = CongestionControl(receive_window=6, initial_window=4)
+    ack_window(congestion)
+    assert congestion.get_window() == 6
+    assert congestion.cwnd == 6
+
+def test_fast_retransmit_halves_window():
+    congestion = CongestionControl(initial_window=40)
+    assert [congestion.on_duplicate_ack() for _ in range(4)] == [False, False, True, False]
+    congestion.on_fast_retransmit(now=0.0)
+    assert (congestion.ssthresh, congestion.get_window(), congestion.fast_retransmits) == (20, 20, 1)
+
+    # New ACK resets duplicate count, window grows linearly from ssthresh
+    congestion.on_ack(1, now=0.0)
+    assert congestion.duplicate_acks == 0
+    assert congestion.cwnd == pytest.approx(20.05)
+
+def test_ssthresh_not_below_two():
+    congestion = CongestionControl(initial_window=3)
+    congestion.on_fast_retransmit(now=0.0)
+    assert congestion.ssthresh == 2
+
+def test_timeout_restarts_slow_start():
+    congestion = CongestionControl(initial_window=40)
+    congestion.on_duplicate_ack()
+    congestion.on_timeout()
+    assert (congestion.get_window(), congestion.ssthresh, congestion.duplicate_acks, congestion.timeouts) == (1, 20, 0, 1)
+    ack_window(congestion)
+    assert congestion.get_window() == 2
+
+def test_duplicate_threshold_zero_disables_fast_retransmit():
+    congestion = CongestionControl(duplicate_threshold=0)
+    assert not any(congestion.on_duplicate_ack() for _ in range(10))
+
+def test_fixed_window_never_changes():
+    congestion = FixedWindow(initial_window=8)
+    ack_window(congestion)
+    congestion.on_fast_retransmit(now=0.0)
+    congestion.on_timeout()
+    assert congestion.get_window() == 8
+    assert (congestion.fast_retransmits, congestion.timeouts) == (1, 1)
+
+def test_cubic_loss_reduces_by_beta():
+    congestion = Cubic(initial_window=40)
+    congestion.on_fast_retransmit(now=0.0)
+    assert congestion.window_max == 40
+    assert congestion.ssthresh == pytest.approx(40 * CUBIC_BETA)
+    assert congestion.cwnd == pytest.approx(40 * CUBIC_BETA)
+
+    # Second loss before previous maximum, fast convergence lowers it further
+    congestion.on_fast_retransmit(now=0.0)
+    assert congestion.window_max == pytest.approx(int(40 * CUBIC_BETA) * (1 + CUBIC_BETA) / 2)
+
+def test_cubic_growth_curve():
+    # Concave up to previous maximum at K seconds after loss, plateau around it, then convex probing
+    congestion = Cubic(initial_window=40)
+    congestion.on_fast_retransmit(now=0.0)
+    k = (40 * (1 - CUBIC_BETA) / CUBIC_C) ** (1 / 3)
+    windows = [congestion.cwnd]
+    for second in range(9):
+        ack_window(congestion, now=float(second))
+        windows.append(congestion.cwnd)
+    growth = [after - before for before, after in zip(windows, windows[1:])]
+    plateau = int(k) + 1
+    assert all(step > 0 for step in growth)
+    assert growth[1:plateau + 1] == sorted(growth[1:plateau + 1], reverse=True)
+    assert growth[plateau:] == sorted(growth[plateau:])
+    assert windows[plateau] == pytest.approx(40, abs=2)
+    assert windows[-1] > 60
+
+def test_cubic_timeout_restarts_slow_start():
+    congestion = Cubic(initial_window=40)
+    congestion.on_timeout()
+    assert (congestion.get_window(), congestion.ssthresh, congestion.window_max) == (1, 20, 40)
+    assert congestion.epoch_start is None
+
+def test_unknown_controller():
+    with pytest.raises(ValueError):
+        get_congestion_control("vegas")
@@ -0,0 +1,104 @@
+import errno
+import socket
+
+import pytest
+
+from lib import mmsg
+from lib.connection import Connection
+
+linux_only = pytest.mark.skipif(not mmsg.available(), reason="sendmmsg/recvmmsg need Linux")
+
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def pair():
+    server_port = get_free_port()
+    server = Connection(port=server_port, broadcast_port=server_port, is_server=True)
+    client = Connection(port=get_free_port(), broadcast_port=server_port)
+    yield server, client
+    server.close_socket()
+    client.close_socket()
+
+def receive(connection, count):
+    received = []
+    for _ in range(count):
+        data, address, buffer = connection.listen_pooled_segment(1.0)
+        received.append(bytes(data))
+        connection.release_buffer(buffer)
+    return received
+
+@linux_only
+@pytest.mark.parametrize("size", [1472, 32768])
+def test_send_batch_delivers_in_order(pair, monkeypatch, size):
+    # 1472 byte frames share GSO buffer, 32768 byte frames don't fit two in one and go with sendmmsg
+    server, client = pair
+    client.set_segment_size(size)
+    client.set_receive_buffer(1024 * 1024)
+    calls = []
+    sendmmsg = mmsg.sendmmsg
+    monkeypatch.setattr(mmsg, "sendmmsg", lambda *args: calls.append(len(args[1])) or sendmmsg(*args))
+    frames = [bytes([index]) * size for index in range(9)] + [b"short"]
+    assert server.send_batch(frames, client.socket.getsockname()) == len(frames)
+    assert receive(client, len(frames)) == frames
+    assert calls == ([] if size == 1472 else [9])
+
+@linux_only
+def test_short_frame_before_large_frames(pair):
+    # Short frame can lead GSO buffer, large ones after it can't join and mustn't be sent with its GSO size
+    server, client = pair
+    client.set_segment_size(32768)
+    client.set_receive_buffer(1024 * 1024)
+    frames = [b"metadata", bytes(32768), bytes(32768), b"short"]
+    assert server.send_batch(frames, client.socket.getsockname()) == len(frames)
+    assert receive(client, len(frames)) == frames
+    assert server.gso and server.mmsg
+
+@linux_only
+def test_receive_drains_queue(pair):
+    server, client = pair
+    frames = [bytes([index]) * 100 for index in range(5)]
+    server.send_batch(frames, client.socket.getsockname())
+    data, address, buffer = client.listen_pooled_segment(1.0)
+    client.release_buffer(buffer)
+    # Rest was read by the same recvmmsg, handed out before socket is read again (single segment listen too)
+    assert len(client.pending) == 4
+    assert client.listen_single_segment(1.0)[0] == frames[1]
+    assert receive(client, 3) == frames[2:]
+    assert client.pool.in_use == 0
+
+class FlakySocket:
+    # Socket whose GSO send fails with given errors first
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.datagrams = []
+
+    def sendmsg(self, buffers, ancillary, flags, dest):
+        if self.errors:
+            raise OSError(self.errors.pop(0), "refused")
+        self.datagrams.extend(buffers)
+
+    def sendto(self, frame, dest):
+        self.datagrams.append(frame)
+
+@pytest.mark.parametrize("errors, gso", [
+    ([errno.ENOBUFS], True),
+    ([errno.EAGAIN, errno.ENOBUFS, errno.EAGAIN, errno.ENOBUFS], True),
+    ([errno.EINVAL], False),
+    ([errno.EOPNOTSUPP], False),
+])
+def test_gso_disabled_only_when_unsupported(pair, errors, gso):
+    server, client = pair
+    real_socket = server.socket
+    server.gso = True
+    server.mmsg = False
+    server.socket = FlakySocket(errors)
+    try:
+        frames = [bytes([index]) * 1000 for index in range(4)]
+        assert server.send_batch(frames, ("127.0.0.1", 1)) == 4
+        assert server.socket.datagrams == frames
+        assert server.gso == gso
+    finally:
+        server.socket = real_socket
@@ -0,0 +1,56 @@
+import socket
+import threading
+
+import pytest
+
+from lib.demux import ClientInbox, Demultiplexer
+from lib.constant import OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST
+
+CLIENT = ("127.0.0.1", 7001)
+
+def drain(demux, address):
+    items = []
+    while True:
+        try:
+            items.append(demux.get(address, 0))
+        except socket.timeout:
+            return items
+
+@pytest.mark.parametrize("policy, kept", [
+    (OVERFLOW_DROP_OLDEST, [b"2", b"3", b"4"]),
+    (OVERFLOW_DROP_NEWEST, [b"0", b"1", b"2"]),
+])
+def test_overflow_policy(policy, kept):
+    demux = Demultiplexer(capacity=3, policy=policy)
+    demux.register(CLIENT)
+    results = [demux.dispatch(str(index).encode(), CLIENT) for index in range(5)]
+    # Drop oldest always takes new datagram, drop newest refuses it
+    assert results == ([True] * 5 if policy == OVERFLOW_DROP_OLDEST else [True] * 3 + [False] * 2)
+    assert len(demux.inboxes[CLIENT].items) == 3
+    assert drain(demux, CLIENT) == kept
+    assert demux.get_stats() == {"clients": 1, "queued": 0, "received": 5, "dropped": 2, "unrouted": 0}
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Demultiplexer(policy="drop-random")
+
+def test_unrouted_and_retired_stats():
+    demux = Demultiplexer(capacity=1)
+    assert not demux.dispatch(b"x", CLIENT)
+    demux.register(CLIENT)
+    demux.dispatch(b"a", CLIENT)
+    demux.dispatch(b"b", CLIENT)
+    demux.unregister(CLIENT)
+    assert CLIENT not in demux
+    assert demux.get_stats() == {"clients": 0, "queued": 0, "received": 2, "dropped": 1, "unrouted": 1}
+    with pytest.raises(socket.timeout):
+        demux.get(CLIENT, 0)
+
+def test_get_waits_for_datagram():
+    inbox = ClientInbox(4, OVERFLOW_DROP_OLDEST)
+    with pytest.raises(socket.timeout):
+        inbox.get(0.01)
+    timer = threading.Timer(0.05, inbox.put, [b"late"])
+    timer.start()
+    assert inbox.get(2.0) == b"late"
+    timer.join()
@@ -0,0 +1,44 @@
+import itertools
+import random
+
+import pytest
+
+from lib.fec import encode_block, decode_block
+
+PAYLOAD_SIZE = 64
+
+def get_block(count, last=PAYLOAD_SIZE):
+    # Every payload but the last is full, like data segments of a file
+    generator = random.Random(count)
+    return [generator.randbytes(PAYLOAD_SIZE if column < count - 1 else last) for column in range(count)]
+
+@pytest.mark.parametrize("repair_count", [1, 2, 3])
+def test_lost_columns_rebuilt(repair_count):
+    # Any combination of up to repair_count lost payloads is rebuilt, short last one included
+    block = get_block(8, last=17)
+    repairs = dict(enumerate(encode_block(block, repair_count, PAYLOAD_SIZE)))
+    for lost in itertools.combinations(range(8), repair_count):
+        received = {column: payload for column, payload in enumerate(block) if column not in lost}
+        assert decode_block(received, repairs, 8, repair_count) == {column: block[column] for column in lost}
+
+def test_too_many_lost():
+    block = get_block(8)
+    repairs = dict(enumerate(encode_block(block, 2, PAYLOAD_SIZE)))
+    received = dict(enumerate(block[3:], 3))
+    assert decode_block(received, repairs, 8, 2) is None
+    assert decode_block(dict(enumerate(block)), {}, 8, 2) == {}
+
+def test_lost_repair_uses_other_row():
+    # Reed-Solomon row 1 alone rebuilds a single loss when repair row 0 is lost too
+    block = get_block(5)
+    repairs = encode_block(block, 2, PAYLOAD_SIZE)
+    received = dict(enumerate(block))
+    del received[2]
+    assert decode_block(received, {1: repairs[1]}, 5, 2) == {2: block[2]}
+
+@pytest.mark.parametrize("fec", ["xor", "rs"])
+@pytest.mark.parametrize("seed", range(3))
+def test_lost_segments_recovered(transfer, fec, seed):
+    result, source, received = transfer(100000, seed, ["--segment-size", "1024", "--fec", fec], loss=0.03, delay=0.005)
+    assert received == source
+    assert result["repairs_sent"] > 0 and result["segments_recovered"] > 0
@@ -0,0 +1,61 @@
+from lib.framecache import FrameCache, SharedFrameCache
+from lib.segment import Segment, HEADER_SIZE
+
+def get_segments(count, payload_size=100):
+    segments = []
+    for index in range(count):
+        segment = Segment()
+        segment.set_header({"seq_num": index, "ack_num": 0})
+        segment.set_payload(bytes([index]) * payload_size)
+        segments.append(segment)
+    return segments
+
+def test_lru_eviction_over_budget():
+    segments = get_segments(5)
+    frame_size = HEADER_SIZE + 100
+    cache = FrameCache(segments, max_bytes=3 * frame_size)
+    for index in range(3):
+        cache.get_frame(index, "crc16")
+    # Frame 0 is used again, so frame 1 is least recently used when frame 3 comes in
+    cache.get_frame(0, "crc16")
+    cache.get_frame(3, "crc16")
+    assert list(cache.frames) == [(2, "crc16"), (0, "crc16"), (3, "crc16")]
+    assert (cache.size, cache.evictions, cache.hits, cache.misses) == (3 * frame_size, 1, 1, 4)
+    assert cache.get_frame(1, "crc16") == segments[1].get_bytes("crc16")
+    assert cache.misses == 5
+
+def test_frame_bigger_than_budget_kept():
+    segments = get_segments(2)
+    cache = FrameCache(segments, max_bytes=10)
+    cache.get_frame(0, "crc16")
+    cache.get_frame(1, "crc16")
+    assert list(cache.frames) == [(1, "crc16")]
+
+def test_zero_budget_unbounded():
+    segments = get_segments(50)
+    cache = FrameCache(segments, max_bytes=0)
+    for index in range(50):
+        cache.get_frame(index, "crc16")
+        cache.get_frame(index, "crc32")
+    assert len(cache) == 100
+    assert cache.evictions == 0
+    assert cache.size == 100 * (HEADER_SIZE + 100)
+
+def test_shared_cache_only_within_budget():
+    # Shared mapping is never evicted, whole file over budget stays in per-process FrameCache
+    segments = get_segments(10)
+    segment_size = HEADER_SIZE + 100
+    size = SharedFrameCache.get_size(segments, segment_size)
+    assert SharedFrameCache.fits(segments, segment_size, 0)
+    assert SharedFrameCache.fits(segments, segment_size, size)
+    assert not SharedFrameCache.fits(segments, segment_size, size - 1)
+
+def test_shared_cache_frames():
+    segments = get_segments(4)
+    cache = SharedFrameCache(segments, HEADER_SIZE + 100, "crc16")
+    assert bytes(cache.get_frame(2, "crc16")) == segments[2].get_bytes("crc16")
+    assert bytes(cache.get_frame(2, "crc16")) == segments[2].get_bytes("crc16")
+    assert (cache.shared_hits, cache.shared_misses) == (1, 1)
+    # Other algorithm goes to private cache
+    assert cache.get_frame(2, "crc32") == segments[2].get_bytes("crc32")
+    assert len(cache) == 1
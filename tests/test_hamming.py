@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+
+from lib import hamming
+
+def test_round_trip_every_byte():
+    data = bytes(range(256)) * 4
+    code = hamming.encode(data, vectorized=False)
+    assert len(code) == hamming.get_encoded_size(len(data))
+    assert hamming.decode(code, vectorized=False) == (data, 0, 0)
+
+@pytest.mark.parametrize("nibble", range(16))
+def test_single_bit_corrected(nibble):
+    code = hamming.encode(bytes([nibble]), vectorized=False)
+    for bit in range(8):
+        damaged = bytes([code[0], code[1] ^ 1 << bit])
+        assert hamming.decode(damaged, vectorized=False) == (bytes([nibble]), 1, 0)
+
+@pytest.mark.parametrize("nibble", range(16))
+def test_double_bit_detected(nibble):
+    # SECDED: two flipped bits in a code byte are never silently "corrected" into other data
+    code = hamming.encode(bytes([nibble]), vectorized=False)
+    for first, second in itertools.combinations(range(8), 2):
+        damaged = bytes([code[0], code[1] ^ (1 << first | 1 << second)])
+        assert hamming.decode(damaged, vectorized=False)[1:] == (0, 1)
+
+def test_frame_keeps_header():
+    frame = bytes(range(12)) + b"payload"
+    encoded = hamming.encode_frame(frame, 12)
+    assert encoded[:12] == frame[:12]
+    assert hamming.decode_frame(encoded, 12) == (frame, 0, 0)
+
+def test_numpy_path_matches():
+    if hamming._numpy is None:
+        pytest.skip("NumPy isn't installed")
+    data = bytes(range(256)) * 64
+    code = hamming.encode(data, vectorized=True)
+    assert code == hamming.encode(data, vectorized=False)
+    assert hamming.decode(code, vectorized=True) == (data, 0, 0)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_corrupt_segments_corrected(transfer, seed):
+    # Single bit flips in data segments are corrected by client, so far fewer of them are resent than without ECC
+    args = ["--segment-size", "1024"]
+    plain, source, received = transfer(100000, seed, args, corrupt=0.2, delay=0.005)
+    assert received == source
+    result, source, received = transfer(100000, seed, args + ["--ecc", "hamming"], corrupt=0.2, delay=0.005)
+    assert received == source
+    assert result["segments_resent"] < plain["segments_resent"]
+    # Simulated corruption flips one bit, never a double error
+    assert result["ecc_corrected"] > 0
+    assert result["ecc_uncorrectable"] == 0
@@ -0,0 +1,77 @@
+import pytest
+
+from lib.metrics import MetricsRegistry, Histogram, METRICS
+from lib.rtt import RTTEstimator
+from lib.congestion import CongestionControl
+from lib.constant import METRICS_PREFIX, RTT_BUCKETS
+
+FIRST = ("127.0.0.1", 7001)
+SECOND = ("127.0.0.1", 7002)
+
+def parse(text):
+    # Sample lines -> {series: value}, comment lines -> list in order
+    samples = {}
+    comments = []
+    for line in text.splitlines():
+        if line.startswith("#"):
+            comments.append(line)
+        else:
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples, comments
+
+def get_registry():
+    registry = MetricsRegistry("server")
+    for address, sent, samples in ((FIRST, 10, [0.002, 0.02]), (SECOND, 5, [0.3])):
+        metrics = registry.get(address)
+        rtt = RTTEstimator()
+        metrics.start(rtt, CongestionControl(initial_window=4), payload_size=100, filesize=1000)
+        metrics.segments_sent = sent
+        for sample in samples:
+            rtt.update(sample)
+    registry.get(FIRST).on_handshake(0.01)
+    return registry
+
+def test_histogram_cumulative():
+    histogram = Histogram([0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.get_cumulative() == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.sum == pytest.approx(5.65)
+
+def test_render_counters_and_gauges():
+    samples, comments = parse(get_registry().render())
+    name = f"{METRICS_PREFIX}_segments_sent_total"
+    # Counter has process total without peer label and one series per connection
+    assert samples[f'{name}{{role="server"}}'] == 15
+    assert samples[f'{name}{{role="server",peer="127.0.0.1:7001"}}'] == 10
+    assert samples[f'{name}{{role="server",peer="127.0.0.1:7002"}}'] == 5
+    # Gauge has no process total
+    assert f'{METRICS_PREFIX}_window_segments{{role="server"}}' not in samples
+    assert samples[f'{METRICS_PREFIX}_window_segments{{role="server",peer="127.0.0.1:7001"}}'] == 4
+    assert samples[f'{METRICS_PREFIX}_connections{{role="server"}}'] == 2
+    assert samples[f'{METRICS_PREFIX}_connections_active{{role="server"}}'] == 2
+
+    # HELP then TYPE for every metric, each once
+    for metric, kind, help in METRICS:
+        index = comments.index(f"# HELP {METRICS_PREFIX}_{metric} {help}")
+        assert comments[index + 1] == f"# TYPE {METRICS_PREFIX}_{metric} {kind}"
+    assert len(comments) == len(set(comments))
+
+def test_render_histograms():
+    samples, comments = parse(get_registry().render())
+    assert f"# TYPE {METRICS_PREFIX}_rtt_seconds histogram" in comments
+    name = f"{METRICS_PREFIX}_rtt_seconds"
+    buckets = [(bound, samples[f'{name}_bucket{{role="server",le="{bound}"}}']) for bound in [repr(bound) for bound in RTT_BUCKETS] + ["+Inf"]]
+    counts = [count for _, count in buckets]
+    assert counts == sorted(counts)
+    assert buckets[-1] == ("+Inf", 3)
+    assert samples[f'{name}_count{{role="server"}}'] == 3
+    assert samples[f'{name}_sum{{role="server"}}'] == pytest.approx(0.322)
+    assert samples[f'{name}_count{{role="server",peer="127.0.0.1:7002"}}'] == 1
+    assert samples[f'{METRICS_PREFIX}_handshake_seconds_count{{role="server"}}'] == 1
+
+def test_render_empty_registry():
+    samples, comments = parse(MetricsRegistry("client").render())
+    assert samples[f'{METRICS_PREFIX}_segments_sent_total{{role="client"}}'] == 0
+    assert not any("_bucket" in series for series in samples)
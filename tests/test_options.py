@@ -0,0 +1,57 @@
+import pytest
+
+import client
+import server
+from lib.options import ConnectionOptions, encode_options, decode_options, ANSWER_PREFIX
+
+def test_options_round_trip():
+    options = {"checksum": ["crc32", "crc16"], "segment": ["1024"]}
+    assert decode_options(encode_options(options)) == options
+
+def test_answer_matches_offer():
+    offer = ConnectionOptions(checksum="crc32", ecc="hamming", fec="xor", segment_size=4096).get_offer_bytes()
+    answer = ConnectionOptions()
+    payload = answer.accept_offer(offer, segment_limit=2048)
+    options = ConnectionOptions.from_answer(payload)
+    assert str(options) == str(answer)
+    assert (options.checksum, options.ecc, options.fec, options.segment_size) == ("crc32", "hamming", "xor", 2048)
+
+def test_echoed_offer_is_older_client():
+    offer = ConnectionOptions(checksum="crc32").get_offer_bytes()
+    assert str(ConnectionOptions.from_answer(offer)) == str(ConnectionOptions())
+
+@pytest.mark.parametrize("payload", [
+    b"",
+    b"garbage",
+    ANSWER_PREFIX + b"ecc=hammimg",
+    ANSWER_PREFIX + b"ecc=hamming,none",
+    ANSWER_PREFIX + b"ecb=hamming",
+    ANSWER_PREFIX + b"ecc=hamming;fec",
+    ANSWER_PREFIX + b"ecc=hamming;ecc=none",
+    ANSWER_PREFIX + b"window=0",
+    ANSWER_PREFIX + b"segment=1k",
+    ANSWER_PREFIX + b"multicast=broadcast",
+    ANSWER_PREFIX + b"fec=xor\xff",
+])
+def test_malformed_answer_rejected(payload):
+    # Defaulting any of these leaves server with options client didn't choose
+    assert ConnectionOptions.from_answer(payload) is None
+
+@pytest.mark.parametrize("seed", [179824, 179828, 179864, 179884, 179893])
+def test_corrupt_handshake_same_options(transfer, monkeypatch, seed):
+    # Corrupt SYN-ACK used to be parsed anyway, server fell back to default for garbled option while client used its choice
+    negotiated = {}
+    listen_file_transfer = client.Client.listen_file_transfer
+    probe_path_mtu = server.Server.probe_path_mtu
+    def client_options(self, *args, **kwargs):
+        negotiated["client"] = str(self.options)
+        return listen_file_transfer(self, *args, **kwargs)
+    def server_options(self, address, options):
+        negotiated["server"] = str(options)
+        return probe_path_mtu(self, address, options)
+    monkeypatch.setattr(client.Client, "listen_file_transfer", client_options)
+    monkeypatch.setattr(server.Server, "probe_path_mtu", server_options)
+
+    result, source, received = transfer(65536, seed, ["--fec", "xor", "--ecc", "hamming"], corrupt=0.05)
+    assert negotiated["server"] == negotiated["client"]
+    assert received == source
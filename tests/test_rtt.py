@@ -0,0 +1,77 @@
+import pytest
+
+from lib.rtt import RTTEstimator
+
+def test_first_sample():
+    # SRTT = R, RTTVAR = R/2, RTO = SRTT + 4 RTTVAR
+    rtt = RTTEstimator(rto_min=0.0)
+    rtt.update(0.1)
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.05)
+    assert rtt.rto == pytest.approx(0.3)
+
+def test_next_sample():
+    # RTTVAR uses SRTT before it's updated, beta 1/4 and alpha 1/8
+    rtt = RTTEstimator(rto_min=0.0)
+    rtt.update(0.1)
+    rtt.update(0.2)
+    assert rtt.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert rtt.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+    assert rtt.rto == pytest.approx(rtt.srtt + 4 * rtt.rttvar)
+
+def test_sample_from_ack():
+    rtt = RTTEstimator()
+    rtt.on_send(1, now=10.0)
+    assert rtt.on_ack(1, now=10.25) == pytest.approx(0.25)
+    assert rtt.samples == 1
+    assert rtt.on_ack(1, now=11.0) is None
+
+def test_karn_skips_retransmitted():
+    rtt = RTTEstimator()
+    rtt.on_send(1, now=10.0)
+    rtt.on_send(1, now=11.0)
+    assert rtt.on_ack(1, now=11.1) is None
+    assert (rtt.srtt, rtt.samples, rtt.discarded, rtt.resent) == (None, 0, 1, 1)
+
+    # Sent once again after that, key is fresh
+    rtt.on_send(1, now=20.0)
+    assert rtt.on_ack(1, now=20.5) == pytest.approx(0.5)
+
+def test_forget_and_discard_pending():
+    rtt = RTTEstimator()
+    rtt.on_send(1, now=0.0)
+    rtt.on_send(1, now=1.0)
+    rtt.forget(1)
+    rtt.on_send(2, now=0.0)
+    rtt.discard_pending()
+    assert rtt.on_ack(1, now=2.0) is None
+    assert rtt.on_ack(2, now=2.0) is None
+    assert not rtt.retransmitted
+
+@pytest.mark.parametrize("sample, rto", [(0.001, 0.2), (30.0, 60.0)])
+def test_clamped(sample, rto):
+    rtt = RTTEstimator(rto_min=0.2, rto_max=60.0)
+    rtt.update(sample)
+    assert rtt.rto == pytest.approx(rto)
+
+def test_initial_timeout_clamped():
+    assert RTTEstimator(rto_min=2.0, rto_initial=1.0).rto == 2.0
+
+def test_backoff_doubles_until_max():
+    rtt = RTTEstimator(rto_min=0.0, rto_max=4.0, rto_initial=1.0)
+    timeouts = []
+    for _ in range(5):
+        timeouts.append(rtt.get_timeout())
+        rtt.backoff()
+    assert timeouts == [1.0, 2.0, 4.0, 4.0, 4.0]
+    assert rtt.backoff_count == 2
+    assert rtt.get_timeout(1) == 2.0
+
+def test_sample_clears_backoff():
+    rtt = RTTEstimator(rto_min=0.0, rto_initial=1.0)
+    rtt.backoff()
+    rtt.clear_backoff()
+    assert rtt.get_timeout() == 1.0
+    rtt.backoff()
+    rtt.update(0.5)
+    assert rtt.backoff_count == 0
@@ -0,0 +1,49 @@
+import pytest
+
+from lib.sack import get_sack_blocks, SackScoreboard
+
+SACK_ARGS = ["--segment-size", "1024", "--sack", "on"]
+
+def test_sack_blocks_latest_first():
+    # Range of newest segment first (RFC 2018), then lowest ranges
+    assert get_sack_blocks([5, 6, 9, 12, 13], latest=12) == [(12, 14), (5, 7), (9, 10)]
+    assert get_sack_blocks(range(10, 30, 2), limit=4) == [(10, 11), (12, 13), (14, 15), (16, 17)]
+
+def test_scoreboard_trusts_only_sent_range():
+    scoreboard = SackScoreboard()
+    assert scoreboard.update([(5, 8), (40, 50)], base=3, limit=10) == 3
+    assert 5 in scoreboard and 40 not in scoreboard
+    assert scoreboard.next_holes(3) == [3, 4]
+    scoreboard.advance(6)
+    assert 5 not in scoreboard and 6 in scoreboard
+
+@pytest.mark.parametrize("seed", [0, 2, 4])
+def test_selective_repeat_corrupt_ack(transfer, seed):
+    # ACK with corrupt SACK blocks used to acknowledge segments client never got, leaving truncated output
+    result, source, received = transfer(200000, seed, SACK_ARGS + ["--arq", "sr"], corrupt=0.05, delay=0.005)
+    assert received == source
+
+def test_scoreboard_reset_forgets_sacked():
+    scoreboard = SackScoreboard()
+    scoreboard.update([(5, 8)], base=3, limit=10)
+    scoreboard.reset()
+    assert 5 not in scoreboard and not scoreboard.has_holes(3)
+
+@pytest.mark.parametrize("seed", [0, 3, 4])
+def test_go_back_n_corrupt_ack(transfer, seed):
+    # Corrupt SACK blocks used to mark unsent range as sacked, going back skipped it forever
+    result, source, received = transfer(200000, seed, SACK_ARGS + ["--arq", "gbn"], corrupt=0.05, delay=0.005)
+    assert received == source
+
+def test_go_back_n_reneged_sack(transfer, monkeypatch):
+    # Client which also reports the segment just before its lowest held one, which it doesn't have. Timeout treats SACK
+    # as reneged and resends it, without reset the gap is skipped on every round until simulation gives up
+    import client
+    def get_reneged_blocks(received, latest=None, limit=4):
+        blocks = get_sack_blocks(received, latest, limit)
+        lowest = min(received)
+        return [(lowest - 1, lowest)] + blocks[:limit - 1]
+    monkeypatch.setattr(client, "get_sack_blocks", get_reneged_blocks)
+    result, source, received = transfer(65536, 0, SACK_ARGS + ["--arq", "gbn"], loss=0.05, delay=0.005)
+    assert received == source
+    assert result["timeouts"] > 0
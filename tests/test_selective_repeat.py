@@ -0,0 +1,27 @@
+import pytest
+
+import server
+from lib.constant import INCOMPLETE_SUFFIX
+
+SR_ARGS = ["--segment-size", "1024", "--arq", "sr"]
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("sack", ["on", "off"])
+def test_selective_repeat_loss_reorder(transfer, seed, sack):
+    # Out-of-order segments are written in place, in-order prefix reaches whole file
+    result, source, received = transfer(150000, seed, SR_ARGS + ["--sack", sack], loss=0.05, reorder=0.05, delay=0.005)
+    assert received == source
+    assert result["complete"] and result["segments_resent"] > 0
+
+def test_selective_repeat_corrupt(transfer):
+    result, source, received = transfer(150000, 1, SR_ARGS, corrupt=0.05, delay=0.005)
+    assert received == source
+
+@pytest.mark.parametrize("arq", ["sr", "gbn"])
+def test_short_transfer_marked_incomplete(transfer, workdir, monkeypatch, arq):
+    # FIN before the whole file arrived used to leave truncated output under its own name, reported as success
+    get_metadata = server.Server.get_metadata
+    monkeypatch.setattr(server.Server, "get_metadata", lambda self: get_metadata(self) + b"0")
+    result, source, received = transfer(20000, 0, ["--segment-size", "1024", "--arq", arq])
+    assert not result["complete"] and received is None
+    assert (workdir / "out" / f"received.bin{INCOMPLETE_SUFFIX}").read_bytes() == source
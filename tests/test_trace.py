@@ -0,0 +1,39 @@
+import pytest
+
+from lib.trace import Tracer, read_trace, format_event, TRACE_SEND_SEGMENT, TRACE_RECEIVE_ACK, TRACE_TIMEOUT
+
+FIRST = ("127.0.0.1", 7001)
+SECOND = ("10.0.0.2", 7002)
+
+def test_round_trip(tmp_path):
+    tracer = Tracer(str(tmp_path / "server.trace"), capacity=16)
+    first, second = tracer.get_id(FIRST), tracer.get_id(SECOND)
+    tracer.record(first, TRACE_SEND_SEGMENT, seq=2)
+    tracer.record(second, TRACE_RECEIVE_ACK, ack=3, window=8)
+    tracer.record(first, TRACE_TIMEOUT, ack=2)
+    assert tracer.dump() == 4
+
+    records = list(read_trace(tracer.path))
+    assert [record[1:] for record in records] == [
+        ("Client", FIRST, TRACE_SEND_SEGMENT, 2, 0, 0),
+        ("Client", SECOND, TRACE_RECEIVE_ACK, 0, 3, 8),
+        ("Client", FIRST, TRACE_TIMEOUT, 0, 2, 0),
+    ]
+    timestamps = [record[0] for record in records]
+    assert timestamps == sorted(timestamps)
+    assert format_event(*records[1]).endswith("[!] [Client 10.0.0.2:7002] Received ACK 3 [window: 8]")
+
+def test_wrapped_ring_keeps_newest(tmp_path):
+    # Oldest events are overwritten, dump still comes out in chronological order. Slot taken by dump itself is skipped
+    tracer = Tracer(str(tmp_path / "client.trace"), capacity=4, peer="Server")
+    conn = tracer.get_id(FIRST)
+    for seq in range(10):
+        tracer.record(conn, TRACE_SEND_SEGMENT, seq=seq)
+    assert tracer.dump() == 4
+    assert [record[4] for record in read_trace(tracer.path)] == [7, 8, 9]
+
+def test_not_trace_file(tmp_path):
+    path = tmp_path / "garbage.trace"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        list(read_trace(str(path)))